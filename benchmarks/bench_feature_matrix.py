@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scenario_catalog import flatten_events
+from selection_result import (build_event_table, aggregate_runs, build_feature_matrix,
+                              build_feature_matrix_from_events, manhattan_row_sums)
+from bench_selection_pipeline import TOWNS, synthetic_run_events
+
+
+# Micro-benchmark del costruttore della matrice delle feature:
+# costruttore pandas storico (dizionari + DataFrame + OneHotEncoder) contro i costruttori vettoriali.
+
+SIZES = (1_000, 10_000, 100_000)
+
+def legacy_build_feature_matrix(scenarios):
+    """Costruttore storico di compute_div_scores, mantenuto qui solo come riferimento."""
+    records = []
+    for idx, s in enumerate(scenarios):
+        record = {"id": idx, "town": s.get("town", None),
+                  "road_type_at_collision": s.get("road_type_at_collision", None)}
+        record.update(s.get("weather", {}))
+        record.update(s.get("town_characteristics", {}))
+        records.append(record)
+
+    df = pd.DataFrame(records)
+    cat_cols = ['town']
+    if 'road_type_at_collision' in df.columns:
+        cat_cols.append('road_type_at_collision')
+    for col in cat_cols:
+        df[col] = df[col].fillna('Unknown')
+
+    encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+    cat_encoded_df = pd.DataFrame(encoder.fit_transform(df[cat_cols]),
+                                  columns=encoder.get_feature_names_out(cat_cols))
+
+    numeric_df = df[[c for c in df.columns if c not in ["id"] + cat_cols]].apply(pd.to_numeric, errors='coerce')
+    numeric_df = numeric_df.dropna(axis=1, how='all')
+    num_scaled_df = pd.DataFrame(MinMaxScaler().fit_transform(numeric_df.fillna(0)), columns=numeric_df.columns)
+
+    X = pd.concat([num_scaled_df.reset_index(drop=True), cat_encoded_df.reset_index(drop=True)], axis=1)
+    return X.to_numpy(dtype=np.float64)
+
+
+def synthetic_runs(n, seed=0):
+    """Eventi di n run sintetici, con lo stesso generatore del corpus di bench_selection_pipeline."""
+    rng = random.Random(seed)
+    runs = []
+    timestamp = 1753966976.0
+    for _ in range(n):
+        events, run_duration = synthetic_run_events(rng, rng.choice(sorted(TOWNS)), timestamp)
+        timestamp += run_duration + 3.0
+        runs.append(events)
+    return runs
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    print(f"{'n':>8} {'costruttore':<22} {'tempo (s)':>10} {'picco (MB)':>11} {'speedup':>8}")
+    for n in SIZES:
+        runs = synthetic_runs(n)
+        # Lo scenario di un run è il suo evento rappresentativo: la prima collisione, o il primo evento
+        scenarios = [events[0] for events in runs]
+        rows, counts = [], []
+        for events in runs:
+            file_rows = flatten_events(events)
+            rows.extend(file_rows)
+            counts.append(len(file_rows))
+        event_table = build_event_table(rows, counts, [f"simulation_events_{i}.json" for i in range(n)])
+        positions = aggregate_runs(event_table)["representative_pos"].to_numpy()
+
+        X_legacy, t_legacy, m_legacy = measure(legacy_build_feature_matrix, scenarios)
+        X_dicts, t_dicts, m_dicts = measure(build_feature_matrix, scenarios)
+        X_table, t_table, m_table = measure(build_feature_matrix_from_events, event_table, positions)
+
+        for name, t, m in (("pandas (storico)", t_legacy, m_legacy), ("vettoriale da dict", t_dicts, m_dicts),
+                           ("vettoriale da tabella", t_table, m_table)):
+            print(f"{n:>8} {name:<22} {t:>10.4f} {m / 1e6:>11.2f} {t_legacy / t:>7.1f}x")
+
+        # Stesse distanze: confronto delle somme per riga su un campione di scenari
+        sample = np.arange(min(n, 200))
+        reference = manhattan_row_sums(X_legacy[sample], X_legacy, dtype=np.float64)
+        for X in (X_dicts, X_table):
+            assert np.allclose(manhattan_row_sums(X[sample], X, dtype=np.float64), reference, rtol=1e-5), \
+                "Le matrici delle feature producono distanze diverse"
+
+
+if __name__ == "__main__":
+    main()
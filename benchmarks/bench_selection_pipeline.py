@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Benchmark della pipeline di selezione su corpus sintetici di simulation_events_*.json.
+# Ogni fase (caricamento, diversità, greedy) gira in un processo nuovo, così tempo e picco di memoria
+# (RSS) sono misurati in isolamento; l'output di ogni fase ha un checksum per accorgersi se cambia.
+# Con --save-baseline i risultati diventano la baseline; nelle esecuzioni successive il benchmark
+# fallisce (exit code 1) se una fase è più lenta o usa più memoria oltre la soglia, o se cambia output;
+# senza baseline (o senza le dimensioni richieste nella baseline) fallisce con exit code 2.
+#
+#   python benchmarks/bench_selection_pipeline.py --sizes 1000 10000 --save-baseline
+#   python benchmarks/bench_selection_pipeline.py --sizes 1000 10000
+
+SIZES = (1_000, 10_000, 100_000)
+STAGES = ("load", "diversity", "greedy")
+TIME_THRESHOLD = 0.25  # +25% di tempo rispetto alla baseline
+RSS_THRESHOLD = 0.25  # +25% di picco di memoria rispetto alla baseline
+# Differenze assolute sotto cui non si segnala nulla: le fasi da pochi millisecondi sono solo rumore
+MIN_TIME_DELTA_SECONDS = 0.05
+MIN_RSS_DELTA_MB = 10.0
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_selection_pipeline.json")
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), "adas_selection_bench")
+
+# Stesse town e caratteristiche registrate da ego_traffic.py
+TOWNS = {
+    "Town01": {"traffic_lights": 36, "approx_curves": 28, "approx_junctions": 12, "approx_roads": 98},
+    "Town02": {"traffic_lights": 24, "approx_curves": 17, "approx_junctions": 8, "approx_roads": 68},
+    "Town03": {"traffic_lights": 38, "approx_curves": 83, "approx_junctions": 31, "approx_roads": 248},
+    "Town04": {"traffic_lights": 43, "approx_curves": 49, "approx_junctions": 27, "approx_roads": 242},
+    "Town05": {"traffic_lights": 54, "approx_curves": 75, "approx_junctions": 21, "approx_roads": 259},
+}
+# Preset di set_random_weather (ClearNoon e CloudyNoon con i valori di CARLA)
+WEATHER_PRESETS = [
+    dict(cloudiness=5.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=10.0,
+         fog_density=0.0, sun_altitude_angle=45.0),
+    dict(cloudiness=60.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=10.0,
+         fog_density=0.0, sun_altitude_angle=45.0),
+    dict(cloudiness=80.0, precipitation=70.0, precipitation_deposits=50.0, wind_intensity=30.0,
+         fog_density=10.0, sun_altitude_angle=0.0),
+    dict(cloudiness=90.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=0.0,
+         fog_density=50.0, sun_altitude_angle=-20.0),
+    dict(cloudiness=70.0, precipitation=20.0, precipitation_deposits=30.0, wind_intensity=0.0,
+         fog_density=0.0, sun_altitude_angle=0.0),
+    dict(cloudiness=100.0, precipitation=80.0, precipitation_deposits=100.0, wind_intensity=50.0,
+         fog_density=0.0, sun_altitude_angle=0.0),
+]
+VEHICLES = ["vehicle.audi.tt", "vehicle.nissan.micra", "vehicle.tesla.model3", "vehicle.ford.mustang",
+            "vehicle.mini.cooper_s", "vehicle.dodge.charger_2020", "vehicle.volkswagen.t2", "vehicle.toyota.prius"]
+WALKERS = ["walker.pedestrian.0001", "walker.pedestrian.0012", "walker.pedestrian.0030"]
+
+
+# --- Generazione del corpus ---
+
+def synthetic_run_events(rng, town, run_start):
+    """Eventi di un run con lo schema di ego_traffic.py (collisioni oppure un singolo 'no_incidents')."""
+    weather = dict(rng.choice(WEATHER_PRESETS))
+    town_characteristics = dict(map_name=f"Carla/Maps/{town}", **TOWNS[town])
+    run_duration = round(rng.uniform(15.0, 75.0), 2)
+    common = {"town": town, "town_characteristics": town_characteristics}
+
+    events = []
+    if rng.random() < 0.75:
+        for k in range(1 if rng.random() < 0.85 else rng.randint(2, 8)):
+            events.append({
+                "event_type": "collision",
+                "timestamp": f"{run_start + 5.0 + k * 1.5:.2f}",
+                "actor_id": rng.randint(100, 30000),
+                "actor_type": rng.choice(VEHICLES),
+                "other_actor_id": rng.randint(100, 30000),
+                "other_actor_type": rng.choice(VEHICLES + WALKERS),
+                "impact_location": {"x": rng.uniform(-500.0, 500.0), "y": rng.uniform(-400.0, 400.0),
+                                    "z": rng.uniform(-0.05, 0.5)},
+                **common,
+                "road_type_at_collision": "curve" if rng.random() < 0.3 else "straight",
+                "weather": weather,
+            })
+    else:
+        events.append({
+            "event_type": "no_incidents",
+            "timestamp": f"{run_start + run_duration:.2f}",
+            "message": "No incidents or traffic violations recorded during simulation.",
+            **common,
+            "weather": weather,
+        })
+
+    for event in events:
+        event["run_duration_seconds"] = run_duration
+        event["simulation_duration_seconds"] = round(run_duration - 3.0, 2)
+    return events, run_duration
+
+
+def generate_corpus(folder, n, seed=0):
+    """Scrive n file simulation_events_*.json in `folder` (riusa il corpus se è già stato generato)."""
+    marker = os.path.join(folder, f".complete_{n}_{seed}")
+    if os.path.exists(marker):
+        return folder
+    os.makedirs(folder, exist_ok=True)
+
+    rng = random.Random(seed)
+    timestamp = 1753966976.0
+    for _ in range(n):
+        events, run_duration = synthetic_run_events(rng, rng.choice(sorted(TOWNS)), timestamp)
+        timestamp += run_duration + 3.0
+        with open(os.path.join(folder, f"simulation_events_{int(timestamp)}.json"), "w") as f:
+            json.dump(events, f, indent=4)
+
+    open(marker, "w").close()
+    return folder
+
+
+# --- Fasi della pipeline ---
+
+def _peak_rss_mb():
+    import resource
+    # ru_maxrss è in KB su Linux e in byte su macOS; include i processi figli (es. il caricamento parallelo)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / scale
+
+
+def _sha256(*chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_stage(stage, corpus_dir, state_path):
+    """
+    Esegue una fase e restituisce le sue metriche. Gli input delle fasi successive al caricamento
+    vengono letti da `state_path` prima di far partire il cronometro.
+    """
+    import numpy as np
+    from selection_result import (load_scenarios_and_features, extract_collisions, extract_exec_times,
+                                  compute_div_scores, additional_greedy)
+
+    if stage != "load":
+        state = np.load(state_path)
+        X, collisions, exec_times = state["X"], state["collisions"].tolist(), state["exec_times"].tolist()
+    baseline_rss = _peak_rss_mb()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if stage == "load":
+            scenarios, X = load_scenarios_and_features(corpus_dir)
+            collisions = extract_collisions(scenarios)
+            exec_times = extract_exec_times(scenarios)
+            elapsed = time.perf_counter() - start
+            np.savez(state_path, X=X, collisions=np.asarray(collisions), exec_times=np.asarray(exec_times))
+            checksum = _sha256(json.dumps(scenarios, sort_keys=True).encode(), np.ascontiguousarray(X).tobytes(),
+                               json.dumps(exec_times).encode())
+        elif stage == "diversity":
+            divs = compute_div_scores(range(X.shape[0]), X=X)
+            elapsed = time.perf_counter() - start
+            with np.load(state_path) as previous:
+                previous = dict(previous)
+            previous["divs"] = np.asarray(divs)
+            np.savez(state_path, **previous)
+            # Arrotondamento: il checksum non deve dipendere dall'ordine delle somme in virgola mobile
+            checksum = _sha256(np.round(np.asarray(divs, dtype=np.float64), 4).tobytes())
+        elif stage == "greedy":
+            divs = np.load(state_path)["divs"].tolist()
+            selected = additional_greedy(collisions, exec_times, divs, max(exec_times), exec_times, lazy=True)
+            elapsed = time.perf_counter() - start
+            checksum = _sha256(json.dumps(selected).encode())
+        else:
+            raise ValueError(f"Fase sconosciuta: {stage}")
+
+    return {"wall_seconds": elapsed, "peak_rss_mb": _peak_rss_mb(), "baseline_rss_mb": baseline_rss,
+            "checksum": checksum}
+
+
+def _stage_process(stage, corpus_dir, state_path, queue):
+    try:
+        queue.put(run_stage(stage, corpus_dir, state_path))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_stage_isolated(stage, corpus_dir, state_path):
+    """Esegue la fase in un interprete nuovo (spawn), per misurarne il picco di memoria da solo."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_stage_process, args=(stage, corpus_dir, state_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"Fase '{stage}' fallita: {result['error']}")
+    return result
+
+
+# --- Confronto con la baseline ---
+
+def compare_with_baseline(results, baseline, time_threshold=TIME_THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """Restituisce l'elenco delle regressioni (tempo, memoria o checksum) rispetto alla baseline."""
+    regressions = []
+    for size, stages in results.items():
+        for stage, metrics in stages.items():
+            reference = baseline.get(size, {}).get(stage)
+            if reference is None:
+                continue
+            label = f"n={size} {stage}"
+            if metrics["wall_seconds"] > max(reference["wall_seconds"] * (1 + time_threshold),
+                                             reference["wall_seconds"] + MIN_TIME_DELTA_SECONDS):
+                regressions.append(f"{label}: tempo {metrics['wall_seconds']:.3f}s contro "
+                                   f"{reference['wall_seconds']:.3f}s (soglia +{time_threshold:.0%})")
+            if metrics["peak_rss_mb"] > max(reference["peak_rss_mb"] * (1 + rss_threshold),
+                                            reference["peak_rss_mb"] + MIN_RSS_DELTA_MB):
+                regressions.append(f"{label}: picco RSS {metrics['peak_rss_mb']:.1f} MB contro "
+                                   f"{reference['peak_rss_mb']:.1f} MB (soglia +{rss_threshold:.0%})")
+            if metrics["checksum"] != reference["checksum"]:
+                regressions.append(f"{label}: l'output è cambiato (checksum diverso)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline di selezione degli scenari.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="cartella dei corpus generati (riutilizzati)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="salva i risultati come nuova baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--rss-threshold", type=float, default=RSS_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'n':>8} {'fase':<10} {'tempo (s)':>10} {'picco RSS (MB)':>15} {'checksum':>18}")
+    for n in args.sizes:
+        corpus_dir = generate_corpus(os.path.join(args.workdir, f"corpus_{n}"), n)
+        state_path = os.path.join(args.workdir, f"state_{n}.npz")
+        results[str(n)] = {}
+        for stage in STAGES:
+            if stage not in args.stages:
+                continue
+            metrics = run_stage_isolated(stage, corpus_dir, state_path)
+            results[str(n)][stage] = metrics
+            print(f"{n:>8} {stage:<10} {metrics['wall_seconds']:>10.3f} {metrics['peak_rss_mb']:>15.1f} "
+                  f"{metrics['checksum'][:16]:>18}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for size, stages in results.items():
+            baseline.setdefault(size, {}).update(stages)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"✅ Baseline salvata in: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n❌ Nessuna baseline in {args.baseline}: esegui con --save-baseline per crearla.")
+        return 2
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    missing = [f"n={size} {stage}" for size, stages in results.items() for stage in stages
+               if stage not in baseline.get(size, {})]
+    if missing:
+        print(f"\n❌ Fasi senza baseline in {args.baseline}: {', '.join(missing)}. "
+              f"Esegui con --save-baseline per aggiungerle.")
+        return 2
+    regressions = compare_with_baseline(results, baseline, args.time_threshold, args.rss_threshold)
+    if regressions:
+        print("\n❌ Regressioni rispetto alla baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\n✅ Nessuna regressione rispetto alla baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import json
+
+import numpy as np
+
+from town_cache import TOWN_CACHE_DIR, load_cached_towns
+
+
+# Precomputed curvature field of a town for is_collision_on_curve: every cached waypoint
+# (see town_cache.py) carries its heading change over the next 10 m, and a uniform grid over
+# waypoint positions finds the nearest waypoint of any location without calling the server.
+# Locations are classified in the collision sensor callback and offline on recorded collisions.
+
+CURVE_YAW_THRESHOLD = 5.0  # Degrees of heading change over 10 m above which the road is a curve
+CURVATURE_GRID_CELL = 5.0  # Meters: side of the grid cells over waypoint positions
+
+
+def yaw_difference(yaw_a, yaw_b):
+    """Absolute heading difference in degrees, wrap-aware (179 vs -179 is 2 degrees, not 358)."""
+    return np.abs((np.asarray(yaw_a) - np.asarray(yaw_b) + 180.0) % 360.0 - 180.0)
+
+
+class CurvatureIndex:
+    """Nearest-waypoint lookup of the road type ('curve' / 'straight') of any location of a town."""
+
+    def __init__(self, arrays, threshold=CURVE_YAW_THRESHOLD, cell_size=CURVATURE_GRID_CELL):
+        xs, ys = arrays["x"], arrays["y"]
+        # A waypoint with nothing 10 m ahead (end of a road) counts as straight, as the server path did
+        change = yaw_difference(arrays["yaw"], arrays["curvature_next_yaw"])
+        curve = np.nan_to_num(change, nan=0.0) > threshold
+
+        self.cell_size = cell_size
+        cx = np.floor(xs / cell_size).astype(np.int64)
+        cy = np.floor(ys / cell_size).astype(np.int64)
+        self.origin = (int(cx.min()), int(cy.min())) if len(xs) else (0, 0)
+        self.shape = (int(cx.max()) - self.origin[0] + 1, int(cy.max()) - self.origin[1] + 1) if len(xs) else (0, 0)
+
+        cells = (cx - self.origin[0]) * self.shape[1] + (cy - self.origin[1])
+        order = np.argsort(cells, kind="stable")
+        self.xs, self.ys, self.curve = xs[order], ys[order], curve[order]
+        counts = np.bincount(cells, minlength=self.shape[0] * self.shape[1])
+        self.starts = np.concatenate([[0], np.cumsum(counts)]).tolist()
+
+    def nearest(self, x, y):
+        """Position (in the index) of the waypoint nearest to (x, y), or -1 if the index is empty."""
+        if not len(self.xs):
+            return -1
+        cx = int(np.floor(x / self.cell_size)) - self.origin[0]
+        cy = int(np.floor(y / self.cell_size)) - self.origin[1]
+        # Rings of cells around the location, widened until the nearest waypoint found is closer than
+        # any unsearched cell or the rings cover the whole grid (then the result is exact anyway)
+        reach, best = 1, -1
+        while True:
+            x_lo, x_hi = max(cx - reach, 0), min(cx + reach + 1, self.shape[0])
+            y_lo, y_hi = max(cy - reach, 0), min(cy + reach + 1, self.shape[1])
+            covers_grid = x_lo == 0 and y_lo == 0 and x_hi == self.shape[0] and y_hi == self.shape[1]
+            spans = [(self.starts[r * self.shape[1] + y_lo], self.starts[r * self.shape[1] + y_hi])
+                     for r in range(x_lo, x_hi)] if x_lo < x_hi and y_lo < y_hi else []
+            spans = [(a, b) for a, b in spans if b > a]
+            if spans:
+                idx = np.concatenate([np.arange(a, b) for a, b in spans])
+                dist = (self.xs[idx] - x) ** 2 + (self.ys[idx] - y) ** 2
+                k = int(np.argmin(dist))
+                best = int(idx[k])
+                if dist[k] <= (reach * self.cell_size) ** 2:
+                    break
+            if covers_grid:
+                break
+            reach *= 2
+        return best
+
+    def classify(self, x, y):
+        """'curve' or 'straight' for the location (x, y), 'unknown' if the town has no waypoints."""
+        best = self.nearest(x, y)
+        if best < 0:
+            return "unknown"
+        return "curve" if self.curve[best] else "straight"
+
+
+def classify_collisions(folder_path, cache_dir=TOWN_CACHE_DIR):
+    """
+    Classifies offline the impact locations of the collisions recorded in the simulation files,
+    using the cached towns. Returns a list of (filename, town, recorded road type, classified road type).
+    """
+    indexes = {name: CurvatureIndex(arrays) for name, arrays in load_cached_towns(cache_dir).items()}
+    results = []
+    missing_towns = set()
+    for root, _, files in os.walk(folder_path):
+        for filename in sorted(files):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(root, filename), 'r') as f:
+                    events = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            for event in events if isinstance(events, list) else []:
+                if not isinstance(event, dict) or event.get("event_type") != "collision":
+                    continue
+                map_name = (event.get("town_characteristics") or {}).get("map_name") or \
+                    f"Carla/Maps/{event.get('town')}"
+                impact = event.get("impact_location") or {}
+                if map_name not in indexes:
+                    missing_towns.add(map_name)
+                    continue
+                try:
+                    road_type = indexes[map_name].classify(float(impact["x"]), float(impact["y"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                results.append((filename, event.get("town"), event.get("road_type_at_collision"), road_type))
+
+    if missing_towns:
+        print(f"Warning: no cached waypoints for {', '.join(sorted(missing_towns))} "
+              f"(run ego_traffic.py once per town to build {cache_dir}).")
+    return results
+
+
+if __name__ == "__main__":
+    input_folder = "simulation_output"
+
+    classified = classify_collisions(input_folder)
+    if classified:
+        agree = sum(1 for _, _, recorded, road_type in classified if recorded == road_type)
+        curves = sum(1 for _, _, _, road_type in classified if road_type == "curve")
+        print(f"Classified {len(classified)} collisions offline: {curves} on curves, "
+              f"{len(classified) - curves} on straight roads.")
+        print(f"Agreement with the recorded road type: {agree}/{len(classified)} "
+              f"(recorded values used the raw, non wrap-aware yaw difference).")
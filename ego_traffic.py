@@ -10,108 +10,124 @@ import math
 from agents.navigation.behavior_agent import BehaviorAgent
 from agents.navigation.local_planner import RoadOption
 
+from hotspot_index import HotspotIndex, spawn_point_weights
+from town_cache import get_town_data
+from curvature_index import CurvatureIndex, yaw_difference, CURVE_YAW_THRESHOLD
+
 # Global variables for collision debounce
 _last_collision_time = {}
 COLLISION_DEBOUNCE_TIME = 2.0  # Seconds: INCREASED to avoid
 # multiple registrations of the same collision
 
 # Global variables for weather management
-LAST_WEATHER_CHANGE_TIME = 0
-WEATHER_CHANGE_INTERVAL = 10  # Seconds: change weather every
+LAST_WEATHER_CHANGE_TIME = None
+WEATHER_CHANGE_INTERVAL = 10  # Simulated seconds: change weather every
 # X seconds.
 
-# Global variable to control execution state
-# Will be set to False to terminate the simulation
-running = True
+# Synchronous fixed-delta simulation: the server advances only on world.tick(), by
+# FIXED_DELTA_SECONDS of simulated time, as fast as it can step (no frame cap)
+SYNCHRONOUS_MODE = True
+FIXED_DELTA_SECONDS = 0.05  # Simulated seconds per tick (20 Hz)
+SIMULATION_TIMEOUT = 60  # Maximum simulation duration in simulated seconds
+RANDOM_SEED = None  # Seed for town/actor choices and the Traffic Manager (None = different every run)
 
+# Headless mode for batch campaigns: no pygame window, no camera sensor and the
+# server's no_rendering_mode (physics, sensors like collision and the agents still run)
+HEADLESS = False
 
-def get_town_static_characteristics(world, carla_map):  # Pass world directly
-    """
-    Analyzes the CARLA map to extract static characteristics like
-    the number of traffic lights and an approximation of curves.
-    """
-    print("Gathering town static characteristics...")
-    traffic_lights = 0
-    num_curves = 0
-    num_junctions = 0
-    num_roads = 0
-    road_ids = set()
-
-    waypoints = carla_map.generate_waypoints(2.0)  # Generate waypoints with 2.0 meter resolution
-
-    for waypoint in waypoints:
-        if waypoint.is_junction:
-            num_junctions += 1
-
-        if waypoint.road_id not in road_ids:
-            num_roads += 1
-            road_ids.add(waypoint.road_id)
-
-        # Approximate curves by checking the change in orientation over a short distance
-        # A significant change in yaw indicates a curve
-        if waypoint.next(5.0):  # Check 5 meters ahead
-            next_waypoint = waypoint.next(5.0)[0]
-            angle_diff = abs(waypoint.transform.rotation.yaw - next_waypoint.transform.rotation.yaw)
-            if angle_diff > 10 and angle_diff < 350:  # A threshold to detect a curve (e.g., more than 10 degrees)
-                num_curves += 1
-
-    # Count traffic lights by iterating through all actors and filtering by type
-    world_actors = world.get_actors()  # Corrected: Use 'world' object
-    for actor in world_actors:
-        if 'traffic_light' in actor.type_id:
-            traffic_lights += 1
-
-    # Remove duplicates for junctions, as multiple waypoints can be in one junction
-    num_junctions = len(set(wp.junction_id for wp in waypoints if wp.is_junction))
-
-    # Simple heuristic to reduce overcounting curves: Divide by a factor based on waypoint density
-    # This is still an approximation, more sophisticated curve detection would be needed for precision
-    num_curves = int(num_curves / 15)
+# Ego trajectory summary stored in every event record
+# (used by the trajectory diversity mode of selection_result.py)
+TRAJECTORY_SAMPLE_INTERVAL = 0.5  # Seconds between raw samples of the follower (ego) vehicle
+TRAJECTORY_SUMMARY_POINTS = 32  # Points kept in the downsampled summary
 
-    return {
-        "map_name": carla_map.name,
-        "traffic_lights": traffic_lights,
-        "approx_curves": num_curves,
-        "approx_junctions": num_junctions,
-        "approx_roads": num_roads
-    }
+# Collision hotspot steering of spawn points (see hotspot_index.py)
+HOTSPOT_SPAWN_BIAS = 0.0  # Extra sampling weight per known collision near a spawn point (0 = disabled)
+HOTSPOT_RADIUS = 30.0  # Meters: collisions within this radius of a spawn point count towards its weight
 
+# Global variable to control execution state
+# Will be set to False to terminate the simulation
+running = True
 
-def is_collision_on_curve(collision_location, carla_map):
+
+def is_collision_on_curve(collision_location, carla_map, curvature_index=None):
     """
     Determines if a collision occurred on a straight road or a curve.
-    This is an approximation based on waypoint curvature.
+    This is an approximation based on the heading change over the next 10 meters of road.
+    With a precomputed curvature index (see curvature_index.py) no server call is made.
     """
+    if curvature_index is not None:
+        return curvature_index.classify(collision_location.x, collision_location.y)
+
     waypoint = carla_map.get_waypoint(collision_location, project_to_road=True)
     if not waypoint:
         return "unknown"
 
     # Check the curvature of the road at the collision point
-    # A simple way is to check the angle difference between consecutive waypoints
-    # further down the road.
-    if waypoint.next(10.0):  # Check 10 meters ahead for curvature
-        next_waypoint = waypoint.next(10.0)[0]
-        angle_diff = abs(waypoint.transform.rotation.yaw - next_waypoint.transform.rotation.yaw)
+    # by comparing the heading 10 meters further down the road
+    next_waypoints = waypoint.next(10.0)
+    if next_waypoints:
+        angle_diff = yaw_difference(waypoint.transform.rotation.yaw, next_waypoints[0].transform.rotation.yaw)
 
         # If the angle difference is significant, it's likely a curve
-        if angle_diff > 5:  # Threshold in degrees for detecting a curve
+        if angle_diff > CURVE_YAW_THRESHOLD:  # Threshold in degrees for detecting a curve
             return "curve"
     return "straight"
 
 
+def summarize_trajectory(samples, num_points=TRAJECTORY_SUMMARY_POINTS):
+    """
+    Downsamples the raw (time, x, y, speed) samples of the ego vehicle to a fixed number
+    of points evenly spaced in time, so every run stores a compact summary of the same size.
+    """
+    if len(samples) < 2:
+        return None
+    data = np.asarray(samples, dtype=np.float64)
+    times = np.linspace(data[0, 0], data[-1, 0], num_points)
+    return {
+        "t": np.round(times - data[0, 0], 2).tolist(),
+        "x": np.round(np.interp(times, data[:, 0], data[:, 1]), 2).tolist(),
+        "y": np.round(np.interp(times, data[:, 0], data[:, 2]), 2).tolist(),
+        "speed_kmh": np.round(np.interp(times, data[:, 0], data[:, 3]), 2).tolist()
+    }
+
+
+def hotspot_biased_order(spawn_points, town, output_dir="simulation_output"):
+    """
+    Weighted random order of the spawn points: points near known collision hotspots of the town
+    are more likely to come first, so the Leader/Follower pair starts close to them.
+    The hotspot index is updated incrementally with the runs written since the last update.
+    """
+    index = HotspotIndex.load()
+    if index.update_from_folder(output_dir):
+        index.save()
+    locations = [(sp.location.x, sp.location.y) for sp in spawn_points]
+    weights = spawn_point_weights(index, town, locations, HOTSPOT_RADIUS, HOTSPOT_SPAWN_BIAS)
+    print(f"📍 Hotspot-biased spawn points: {index.num_collisions(town)} known collisions in {town}.")
+
+    # Weighted permutation (Efraimidis-Spirakis): sort by u^(1/w), u uniform in (0, 1)
+    keys = [random.random() ** (1.0 / w) for w in weights]
+    return [sp for _, sp in sorted(zip(keys, spawn_points), key=lambda pair: pair[0], reverse=True)]
+
+
 def main():
     # Clean up global
     # collision and weather tracking for each new run.
     global _last_collision_time, LAST_WEATHER_CHANGE_TIME, running
     _last_collision_time.clear()
-    LAST_WEATHER_CHANGE_TIME = 0
+    LAST_WEATHER_CHANGE_TIME = None
     running = True  #
     # Ensure it's True at the start of each run
-
-    pygame.init()
-    display = pygame.display.set_mode((1280, 720), pygame.HWSURFACE | pygame.DOUBLEBUF)
-    pygame.display.set_caption("CARLA: Advanced Traffic Scenario")
-    clock = pygame.time.Clock()
+    run_start_time = time.time()  # Wall-clock start of the whole run (map load, spawn, simulation)
+    if RANDOM_SEED is not None:
+        random.seed(RANDOM_SEED)
+
+    display = None
+    clock = None
+    if not HEADLESS:
+        pygame.init()
+        display = pygame.display.set_mode((1280, 720), pygame.HWSURFACE | pygame.DOUBLEBUF)
+        pygame.display.set_caption("CARLA: Advanced Traffic Scenario")
+        clock = pygame.time.Clock()
 
     client = carla.Client('127.0.0.1', 2000)
     client.set_timeout(30.0)
@@ -133,7 +149,9 @@ def main():
     traffic_manager.global_percentage_speed_difference(-20.0)
 
     # Get static town characteristics once at the beginning
-    town_characteristics = get_town_static_characteristics(world, carla_map)  # Pass world here
+    # Static town characteristics and waypoint arrays, cached on disk per map and CARLA version
+    town_characteristics, town_waypoints = get_town_data(client, world, carla_map)
+    curvature_index = CurvatureIndex(town_waypoints)
     print(f"Town Characteristics: {json.dumps(town_characteristics, indent=4)}")
 
     blueprint_library = world.get_blueprint_library()
@@ -156,17 +174,17 @@ def main():
 
     spawn_points = carla_map.get_spawn_points()
     random.shuffle(spawn_points)
+    if HOTSPOT_SPAWN_BIAS > 0:
+        spawn_points = hotspot_biased_order(spawn_points, town)
 
     print("🧹 Cleaning up previous actors...")
-    for actor in world.get_actors():
-        if 'vehicle' in actor.type_id or 'sensor' in actor.type_id or 'walker' in actor.type_id or \
-                'controller.ai.walker' in actor.type_id:
-            try:
-                actor.destroy()
-            except Exception as e:
-                print(f"Error destroying {actor.type_id} (ID: {actor.id}): {e}")
-    time.sleep(1.0)  #
-    # Give time for destruction
+    leftover_ids = [actor.id for actor in world.get_actors()
+                    if 'vehicle' in actor.type_id or 'sensor' in actor.type_id or 'walker' in actor.type_id or
+                    'controller.ai.walker' in actor.type_id]
+    # apply_batch_sync returns once the server has processed the commands: no need to wait for destruction
+    for response in client.apply_batch_sync([carla.command.DestroyActor(actor_id) for actor_id in leftover_ids]):
+        if response.error:
+            print(f"Error destroying actor: {response.error}")
 
     if len(spawn_points) < 2:
         print(f"Error: Not enough spawn points available ({len(spawn_points)}). Need at least 2 for ego vehicles.")
@@ -229,11 +247,12 @@ def main():
     follower_agent.ignore_traffic_lights(random.random() < 0.7)
     leader_agent.set_destination(random.choice(spawn_points).location)
 
-    camera_transform = carla.Transform(carla.Location(x=-5.5, z=2.5))
-    camera = world.spawn_actor(camera_bp, camera_transform, attach_to=follower)
-    if camera is None:
-        print("🔴 Error: Could not spawn camera. Proceeding without camera.")
-        image_surface = None  # Ensure image_surface is None if camera isn't present
+    camera = None
+    if not HEADLESS:
+        camera_transform = carla.Transform(carla.Location(x=-5.5, z=2.5))
+        camera = world.spawn_actor(camera_bp, camera_transform, attach_to=follower)
+        if camera is None:
+            print("🔴 Error: Could not spawn camera. Proceeding without camera.")
 
     image_surface = None
     if camera:
@@ -275,11 +294,12 @@ def main():
         sorted_ids = tuple(sorted([actor_id, other_actor_id]))
         collision_key = frozenset(sorted_ids)
 
-        current_time = time.time()
+        current_time = event.timestamp  # Simulated seconds, consistent with the fixed-delta clock
 
         # If the same
         # pair has recently collided, ignore it
-        if (current_time - _last_collision_time.get(collision_key, 0)) < COLLISION_DEBOUNCE_TIME:
+        if collision_key in _last_collision_time and \
+                (current_time - _last_collision_time[collision_key]) < COLLISION_DEBOUNCE_TIME:
             return
 
         # Register the
@@ -297,7 +317,7 @@ def main():
         }
 
         # Determine if collision is on a curve or straight road
-        collision_road_type = is_collision_on_curve(event.transform.location, carla_map)
+        collision_road_type = is_collision_on_curve(event.transform.location, carla_map, curvature_index)
 
         print(f"💥 COLLISION DETECTED! {event.actor.type_id} (ID: {actor_id}) hit "
               f"{other_actor_type} (ID: {other_actor_id}) in {town} with weather: "
@@ -308,7 +328,7 @@ def main():
         # collision event
         simulation_events.append({
             "event_type": "collision",
-            "timestamp": f"{current_time:.2f}",  # Format to 2 decimal places
+            "timestamp": f"{time.time():.2f}",  # Format to 2 decimal places
             "actor_id": actor_id,
             "actor_type": event.actor.type_id,
             "other_actor_id": other_actor_id,
@@ -333,55 +353,50 @@ def main():
         collision_sensor.listen(on_collision)
 
     # Traffic vehicles
-    traffic_vehicles = []
+    # Spawned with one synchronous command batch: every SpawnActor is chained with
+    # SetAutopilot on the Traffic Manager port, so setup costs one round trip instead of one per actor
+    setup_start = time.perf_counter()
     num_traffic_vehicles_to_spawn = min(130, len(spawn_points))
 
     print(f"Attempting to spawn {num_traffic_vehicles_to_spawn} traffic vehicles...")
-    spawned_vehicle_count = 0
     available_vehicle_spawn_points = list(spawn_points)
     random.shuffle(available_vehicle_spawn_points)
 
-    for i in range(num_traffic_vehicles_to_spawn):
-        if not available_vehicle_spawn_points:
-            print("  No more spawn points available for traffic vehicles.")
-            break
-        sp = available_vehicle_spawn_points.pop(0)
-        bp = random.choice(traffic_vehicle_bps)
-        try:
-            vehicle = world.try_spawn_actor(bp, sp)
-            if vehicle:
-                vehicle.set_autopilot(True, 8000)
-                #
-                # Randomize traffic behavior further
-                if random.random() < 0.4: traffic_manager.ignore_lights_percentage(vehicle, 100)
-                # FIX:
-                # Corrected random.random() usage
-                if random.random() < 0.3: traffic_manager.ignore_vehicles_percentage(vehicle, 50)
-
-                #
-                # Speed variation
-                speed_diff = random.uniform(-30.0, 20.0)  # Wider range for variety
-                traffic_manager.vehicle_percentage_speed_difference(vehicle, speed_diff)
-                traffic_manager.distance_to_leading_vehicle(vehicle, random.uniform(0.5, 2.5))  # More varied distance
-
-                traffic_vehicles.append(vehicle)
-                spawned_vehicle_count += 1
-            else:
-                pass
-        except Exception as e:
-            pass
-    print(f"✅ Spawned {spawned_vehicle_count} traffic vehicles out of {num_traffic_vehicles_to_spawn} attempted.")
+    SpawnActor = carla.command.SpawnActor
+    SetAutopilot = carla.command.SetAutopilot
+    FutureActor = carla.command.FutureActor
+
+    vehicle_batch = [SpawnActor(random.choice(traffic_vehicle_bps), sp)
+                     .then(SetAutopilot(FutureActor, True, traffic_manager.get_port()))
+                     for sp in available_vehicle_spawn_points[:num_traffic_vehicles_to_spawn]]
+    # Occupied spawn points (e.g. the Leader's and Follower's) simply fail, as try_spawn_actor did
+    vehicle_ids = [response.actor_id for response in client.apply_batch_sync(vehicle_batch)
+                   if not response.error]
+    traffic_vehicles = list(world.get_actors(vehicle_ids)) if vehicle_ids else []
+
+    # The Traffic Manager has no batch commands: per-vehicle parameters stay per actor
+    for vehicle in traffic_vehicles:
+        #
+        # Randomize traffic behavior further
+        if random.random() < 0.4: traffic_manager.ignore_lights_percentage(vehicle, 100)
+        if random.random() < 0.3: traffic_manager.ignore_vehicles_percentage(vehicle, 50)
+
+        #
+        # Speed variation
+        speed_diff = random.uniform(-30.0, 20.0)  # Wider range for variety
+        traffic_manager.vehicle_percentage_speed_difference(vehicle, speed_diff)
+        traffic_manager.distance_to_leading_vehicle(vehicle, random.uniform(0.5, 2.5))  # More varied distance
+    print(f"✅ Spawned {len(traffic_vehicles)} traffic vehicles out of {num_traffic_vehicles_to_spawn} attempted.")
 
     # Pedestrians
-    pedestrians = []
-    pedestrian_controllers = []
+    # Walkers first, then their AI controllers attached to them, each in one batch
     num_pedestrians_to_spawn = min(30,
                                    len(carla_map.get_spawn_points()))  # Use carla_map
     print(f"Attempting to spawn {num_pedestrians_to_spawn} pedestrians...")
-    spawned_ped_count = 0
 
+    walker_batch = []
     for i in range(num_pedestrians_to_spawn):
-        spawn_location = carla.Location()
+        spawn_location = None
         retries = 0
         MAX_RETRIES = 10
         while retries < MAX_RETRIES:
@@ -401,27 +416,31 @@ def main():
         ped_transform = carla.Transform(spawn_location + carla.Location(z=0.1), carla.Rotation())
         ped_bp = random.choice(walker_bp)
         ped_bp.set_attribute('is_invincible', 'false')
-
-        try:
-            pedestrian = world.try_spawn_actor(ped_bp, ped_transform)
-            if pedestrian:
-                controller = world.try_spawn_actor(walker_controller_bp,
-                                                   carla.Transform(), pedestrian)
-                if controller:
-                    pedestrians.append(pedestrian)
-                    pedestrian_controllers.append(controller)
-                    controller.start()
-                    controller.go_to_location(world.get_random_location_from_navigation())
-                    controller.set_max_speed(1 + random.random() * 1.5)  # Variable
-                    # pedestrian speed
-                    spawned_ped_count += 1
-                else:
-                    pedestrian.destroy()
-            else:
-                pass
-        except Exception as e:
-            pass
-    print(f"✅ Spawned {spawned_ped_count} pedestrians out of {num_pedestrians_to_spawn} attempted.")
+        walker_batch.append(SpawnActor(ped_bp, ped_transform))
+
+    walker_ids = [response.actor_id for response in client.apply_batch_sync(walker_batch)
+                  if not response.error]
+    controller_batch = [SpawnActor(walker_controller_bp, carla.Transform(), walker_id) for walker_id in walker_ids]
+    controller_responses = client.apply_batch_sync(controller_batch)
+
+    # Walkers whose controller failed would stand still: drop them
+    paired_ids = [(walker_id, response.actor_id) for walker_id, response in zip(walker_ids, controller_responses)
+                  if not response.error]
+    orphan_walker_ids = [walker_id for walker_id, response in zip(walker_ids, controller_responses) if response.error]
+    if orphan_walker_ids:
+        client.apply_batch([carla.command.DestroyActor(walker_id) for walker_id in orphan_walker_ids])
+
+    pedestrians = list(world.get_actors([w for w, _ in paired_ids])) if paired_ids else []
+    pedestrian_controllers = list(world.get_actors([c for _, c in paired_ids])) if paired_ids else []
+    if pedestrian_controllers:
+        world.wait_for_tick()  # Let the client receive the new walkers before starting their controllers
+    for controller in pedestrian_controllers:
+        controller.start()
+        controller.go_to_location(world.get_random_location_from_navigation())
+        controller.set_max_speed(1 + random.random() * 1.5)  # Variable
+        # pedestrian speed
+    print(f"✅ Spawned {len(pedestrians)} pedestrians out of {num_pedestrians_to_spawn} attempted.")
+    print(f"⏱️ Traffic and pedestrian setup took {time.perf_counter() - setup_start:.2f} s.")
 
     def get_left_overtake_location(actor):
         wp = carla_map.get_waypoint(actor.get_location(), project_to_road=True,
@@ -455,28 +474,66 @@ def main():
               f"Precipitation_Deposits={chosen_weather.precipitation_deposits}, "
               f"Fog={chosen_weather.fog_density}")
 
-    SIMULATION_TIMEOUT = 60  # Maximum simulation duration in seconds
-    start_time = time.time()
+    # Switch to synchronous fixed-delta stepping (and no rendering) only now that every actor
+    # is spawned, so the early aborts above never leave the server in these modes
+    original_settings = world.get_settings()
+    if SYNCHRONOUS_MODE or HEADLESS:
+        settings = world.get_settings()
+        if SYNCHRONOUS_MODE:
+            settings.synchronous_mode = True
+            settings.fixed_delta_seconds = FIXED_DELTA_SECONDS
+        if HEADLESS:
+            settings.no_rendering_mode = True
+        world.apply_settings(settings)
+    if SYNCHRONOUS_MODE:
+        traffic_manager.set_synchronous_mode(True)
+        print(f"⏱️ Synchronous mode: {FIXED_DELTA_SECONDS} simulated seconds per tick, no frame cap.")
+    if HEADLESS:
+        print("🕶️ Headless mode: no window, no camera, server rendering disabled.")
+    if RANDOM_SEED is not None:
+        traffic_manager.set_random_device_seed(RANDOM_SEED)
+
+    # The placeholder shown when there is no camera never changes: render it once
+    no_camera_text = None
+    if display is not None and not camera:
+        font = pygame.font.Font(pygame.font.get_default_font(), 36)
+        no_camera_text = font.render('No camera active', True, (255, 255, 255))
+
+    # Per-tick cost: server step (world.tick) and display update, the rest is client logic
+    ticks = 0
+    tick_seconds = 0.0
+    render_seconds = 0.0
+
+    wall_start_time = time.time()
+    start_time = world.get_snapshot().timestamp.elapsed_seconds  # Simulated seconds
+    current_time = start_time
+    ego_samples = []  # Raw (time, x, y, speed) samples of the follower, summarized at the end
+    last_trajectory_sample = None
 
     try:
         while running:  # The loop will continue as long as 'running' is True
-            current_time = time.time()
+            current_time = world.get_snapshot().timestamp.elapsed_seconds
             if (current_time - start_time) >= SIMULATION_TIMEOUT:
-                print(f"⏰ Timeout of {SIMULATION_TIMEOUT} seconds reached. Terminating scenario.")
+                print(f"⏰ Timeout of {SIMULATION_TIMEOUT} simulated seconds reached. Terminating scenario.")
                 running = False  # Terminate the loop if timeout is reached
 
             # Periodic
             # weather change
-            if current_time - LAST_WEATHER_CHANGE_TIME > WEATHER_CHANGE_INTERVAL:
+            if LAST_WEATHER_CHANGE_TIME is None or current_time - LAST_WEATHER_CHANGE_TIME > WEATHER_CHANGE_INTERVAL:
                 set_random_weather(world)
                 LAST_WEATHER_CHANGE_TIME = current_time
 
-            clock.tick(30)  # Limit framerate to 30 FPS
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
+            if clock and not SYNCHRONOUS_MODE:
+                clock.tick(30)  # Limit framerate to 30 FPS
+            if display is not None:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
 
+            tick_start = time.perf_counter()
             world.tick()  # Advance simulation by one tick
+            tick_seconds += time.perf_counter() - tick_start
+            ticks += 1
 
             # Leader
             # vehicle management
@@ -516,19 +573,31 @@ def main():
                 print("Follower no longer active, terminating simulation.")
                 running = False  # Terminate if follower is no longer active
 
+            # Ego
+            # trajectory sampling
+            if follower and follower.is_alive and (last_trajectory_sample is None or
+                                                   current_time - last_trajectory_sample >= TRAJECTORY_SAMPLE_INTERVAL):
+                ego_location = follower.get_location()
+                ego_velocity = follower.get_velocity()
+                ego_speed = math.sqrt(ego_velocity.x ** 2 + ego_velocity.y ** 2 + ego_velocity.z ** 2) * 3.6
+                ego_samples.append((current_time - start_time, ego_location.x, ego_location.y, ego_speed))
+                last_trajectory_sample = current_time
+
             # Pygame
             # display update
-            if camera and image_surface:
+            render_start = time.perf_counter()
+            if display is None:
+                pass
+            elif camera and image_surface:
                 display.blit(image_surface, (0, 0))
                 pygame.display.flip()
             elif not camera:
                 display.fill((0, 0, 0))
-                font = pygame.font.Font(pygame.font.get_default_font(), 36)
-                text_surface = font.render('No camera active', True, (255, 255, 255))
-                text_rect = text_surface.get_rect(center=(display.get_width() / 2,
-                                                          display.get_height() / 2))
-                display.blit(text_surface, text_rect)
+                text_rect = no_camera_text.get_rect(center=(display.get_width() / 2,
+                                                            display.get_height() / 2))
+                display.blit(no_camera_text, text_rect)
                 pygame.display.flip()
+            render_seconds += time.perf_counter() - render_start
 
     finally:
         print("🧹 Final cleanup...")
@@ -560,6 +629,32 @@ def main():
                 "weather": weather_details
             })
 
+        # Record the measured wall-clock cost of the run so scenario selection
+        # can use real durations instead of a fixed estimate
+        run_duration = time.time() - run_start_time
+        simulation_duration = time.time() - wall_start_time
+        simulated_seconds = current_time - start_time
+        tick_stats = {
+            "headless": HEADLESS,
+            "synchronous": SYNCHRONOUS_MODE,
+            "ticks": ticks,
+            "mean_tick_ms": round(1000.0 * simulation_duration / ticks, 3) if ticks else None,
+            "mean_server_step_ms": round(1000.0 * tick_seconds / ticks, 3) if ticks else None,
+            "mean_render_ms": round(1000.0 * render_seconds / ticks, 3) if ticks else None
+        }
+        if ticks:
+            print(f"⏱️ {ticks} ticks ({'headless' if HEADLESS else 'rendered'}): "
+                  f"{tick_stats['mean_tick_ms']:.2f} ms per tick, of which server step "
+                  f"{tick_stats['mean_server_step_ms']:.2f} ms and display {tick_stats['mean_render_ms']:.2f} ms.")
+        ego_trajectory = summarize_trajectory(ego_samples)
+        for sim_event in simulation_events:
+            sim_event["run_duration_seconds"] = round(run_duration, 2)
+            sim_event["simulation_duration_seconds"] = round(simulation_duration, 2)
+            sim_event["simulated_seconds"] = round(simulated_seconds, 2)
+            sim_event["tick_stats"] = tick_stats
+            if ego_trajectory:
+                sim_event["ego_trajectory"] = ego_trajectory
+
         output_filename = os.path.join(output_dir,
                                        f"simulation_events_{int(time.time())}.json")
         with open(output_filename, 'w') as f:
@@ -574,15 +669,23 @@ def main():
             camera.stop()
 
         # Destroy all
-        # actors
+        # actors with a single command batch (controllers stopped first)
+        teardown_start = time.perf_counter()
+        for controller in pedestrian_controllers:
+            try:
+                controller.stop()
+            except Exception as e:
+                print(f"Error stopping walker controller (ID: {controller.id}): {e}")
         actors_to_destroy = [leader, follower, camera, collision_sensor] + \
-                            traffic_vehicles + pedestrians + pedestrian_controllers
-        for actor in actors_to_destroy:
-            if actor and actor.is_alive:
-                try:
-                    actor.destroy()
-                except Exception as e:
-                    print(f"Error destroying actor {actor.type_id} (ID: {actor.id}): {e}")
+                            traffic_vehicles + pedestrian_controllers + pedestrians
+        destroy_batch = [carla.command.DestroyActor(actor.id) for actor in actors_to_destroy if actor]
+        try:
+            failed = [response.error for response in client.apply_batch_sync(destroy_batch) if response.error]
+            if failed:
+                print(f"Error destroying {len(failed)} actors: {failed[0]}")
+        except Exception as e:
+            print(f"Error destroying actors: {e}")
+        print(f"⏱️ Destroyed {len(destroy_batch)} actors in {time.perf_counter() - teardown_start:.2f} s.")
 
         # Reset
         # weather to ClearNoon
@@ -591,6 +694,15 @@ def main():
         except Exception as e:
             print(f"Error resetting weather: {e}")
 
+        # Restore
+        # asynchronous mode (otherwise the server would wait forever for the next tick) and rendering
+        if SYNCHRONOUS_MODE or HEADLESS:
+            try:
+                traffic_manager.set_synchronous_mode(False)
+                world.apply_settings(original_settings)
+            except Exception as e:
+                print(f"Error restoring world settings: {e}")
+
         pygame.quit()
 
 
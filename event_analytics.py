@@ -0,0 +1,237 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from selection_result import load_event_table, aggregate_runs
+
+
+# --- Analisi dei Log degli Eventi ---
+# Due sorgenti: il log live (events_live.json, una lista di eventi per tipo: collisions, overtakes, ...)
+# e i file simulation_events_*.json dei singoli run (tabella eventi di selection_result).
+# Entrambe vengono caricate in tabelle a colonne tipizzate. Il sensore di collisione registra lo stesso
+# urto molte volte a pochi millisecondi di distanza: la deduplicazione ordina gli eventi per (gruppo,
+# coppia di attori non ordinata, tempo) con un solo lexsort e apre un nuovo episodio dove cambia la
+# chiave o dove l'intervallo dal record precedente supera la finestra, senza cicli Python.
+# I tassi di collisione per gruppo (town, fascia meteo, tipo di strada, tipo dell'altro attore) sono
+# calcolati con np.unique + np.bincount.
+
+LIVE_EVENT_KINDS = ("collisions", "overtakes", "red_light_violations", "u_turns")
+COLLISION_DEDUP_WINDOW_SECONDS = 2.0  # come COLLISION_DEBOUNCE_TIME di ego_traffic.py
+WEATHER_BUCKET_FIELDS = ("precipitation", "fog_density", "sun_altitude_angle")
+WEATHER_BUCKET_SIZE = 25.0
+RATE_GROUP_COLUMNS = ("town", "weather_bucket", "road_type_at_collision", "other_actor_type")
+NO_COLLISION_LABEL = "none"  # tipo di strada / altro attore dei run senza collisioni
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def load_live_events(file_path):
+    """
+    Carica il log live in una tabella a colonne: kind, actor, other_actor (category), timestamp (float64)
+    e location_x/y/z (float32). Le liste di tipi sconosciuti vengono caricate comunque.
+    Restituisce una tabella vuota (dopo aver stampato il motivo) se il file è illeggibile o malformato.
+    """
+    columns = ("kind", "timestamp", "actor", "other_actor", "location_x", "location_y", "location_z")
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"❌ Errore nella lettura del log live {file_path}: {e}")
+        data = None
+    if not isinstance(data, dict):
+        if data is not None:
+            print(f"❌ Errore: Il log live {file_path} non è un dizionario di liste di eventi.")
+        data = {}
+
+    kinds = [k for k in LIVE_EVENT_KINDS if k in data] + sorted(k for k in data if k not in LIVE_EVENT_KINDS)
+    entries = [(kind, e) for kind in kinds if isinstance(data[kind], list) for e in data[kind]
+               if isinstance(e, dict)]
+    locations = [e.get("location") or {} for _, e in entries]
+
+    table = pd.DataFrame({
+        "kind": pd.Categorical([kind for kind, _ in entries], categories=kinds),
+        "timestamp": np.array([_to_float(e.get("timestamp")) for _, e in entries], dtype=np.float64),
+        "actor": pd.Categorical([e.get("actor") for _, e in entries]),
+        "other_actor": pd.Categorical([e.get("other_actor") for _, e in entries]),
+        "location_x": np.array([_to_float(loc.get("x")) for loc in locations], dtype=np.float32),
+        "location_y": np.array([_to_float(loc.get("y")) for loc in locations], dtype=np.float32),
+        "location_z": np.array([_to_float(loc.get("z")) for loc in locations], dtype=np.float32),
+    }, columns=columns)
+    return table
+
+
+def dedup_events(table, pair_columns, window_seconds=COLLISION_DEDUP_WINDOW_SECONDS, group_columns=(),
+                 time_column="timestamp"):
+    """
+    Fonde i record dello stesso episodio: stesso gruppo (`group_columns`, es. run_id), stessa coppia di
+    attori in qualunque ordine (A urta B e B urta A) e al più `window_seconds` dal record precedente
+    della coppia. Restituisce (episodi, etichette):
+    - episodi: il primo record di ogni episodio, in ordine di tabella, con la colonna 'duplicates'
+      (record fusi nell'episodio, lui compreso);
+    - etichette: per ogni riga della tabella, la posizione del suo episodio in `episodi`.
+    """
+    n = len(table)
+    if n == 0:
+        return table.assign(duplicates=np.zeros(0, dtype=np.int64)), np.zeros(0, dtype=np.int64)
+
+    # Codici comuni alle due colonne della coppia, ordinati per rendere la coppia non orientata
+    pair_codes, _ = pd.factorize(pd.concat([table[c].astype(object) for c in pair_columns], ignore_index=True))
+    first, second = pair_codes[:n], pair_codes[n:]
+    keys = [pd.factorize(table[c])[0] for c in group_columns] + [np.minimum(first, second),
+                                                                  np.maximum(first, second)]
+    times = table[time_column].to_numpy(dtype=np.float64)
+
+    order = np.lexsort([times] + keys[::-1])  # l'ultima chiave di lexsort è la primaria
+    starts = np.ones(n, dtype=bool)
+    for key in keys:
+        sorted_key = key[order]
+        starts[1:] &= sorted_key[1:] == sorted_key[:-1]
+    starts[1:] &= np.diff(times[order]) <= window_seconds
+    starts = ~starts  # nuovo episodio: cambia una chiave o l'intervallo supera la finestra
+    starts[0] = True
+
+    start_pos = np.flatnonzero(starts)
+    episode_of_sorted = np.cumsum(starts) - 1
+    first_rows = order[start_pos]
+    sizes = np.diff(np.append(start_pos, n))
+
+    # Episodi in ordine di tabella (ordine della loro prima riga)
+    episode_order = np.argsort(first_rows, kind="stable")
+    position = np.empty(len(first_rows), dtype=np.int64)
+    position[episode_order] = np.arange(len(first_rows))
+    labels = np.empty(n, dtype=np.int64)
+    labels[order] = position[episode_of_sorted]
+
+    episodes = table.iloc[first_rows[episode_order]].reset_index(drop=True)
+    episodes["duplicates"] = sizes[episode_order]
+    return episodes, labels
+
+
+def dedup_live_collisions(live_table, window_seconds=COLLISION_DEDUP_WINDOW_SECONDS):
+    """Collisioni distinte del log live (coppie di tipi di attori, vedi dedup_events)."""
+    collisions = live_table[(live_table["kind"] == "collisions").to_numpy()].reset_index(drop=True)
+    episodes, _ = dedup_events(collisions, ("actor", "other_actor"), window_seconds)
+    return episodes
+
+
+def weather_buckets(weather_values, bucket_size=WEATHER_BUCKET_SIZE, fields=WEATHER_BUCKET_FIELDS):
+    """
+    Etichetta della fascia meteo di ogni riga di `weather_values` (righe x campi di `fields`): ogni campo
+    è diviso in fasce larghe `bucket_size`. Le etichette sono costruite solo per le combinazioni distinte.
+    """
+    buckets = np.floor(np.asarray(weather_values, dtype=np.float64) / bucket_size)
+    buckets = np.where(np.isnan(buckets), np.iinfo(np.int64).min, buckets).astype(np.int64)
+    combos, inverse = np.unique(buckets, axis=0, return_inverse=True)
+
+    labels = []
+    for combo in combos:
+        parts = []
+        for field, b in zip(fields, combo):
+            if b == np.iinfo(np.int64).min:
+                parts.append(f"{field}=?")
+            else:
+                parts.append(f"{field}={b * bucket_size:g}..{(b + 1) * bucket_size:g}")
+        labels.append(" | ".join(parts))
+    return pd.Categorical.from_codes(inverse.ravel(), categories=pd.Index(labels)) if labels \
+        else pd.Categorical([])
+
+
+def run_table(event_table, window_seconds=COLLISION_DEDUP_WINDOW_SECONDS):
+    """
+    Una riga per run: colonne di gruppo dell'evento rappresentativo (prima collisione o primo evento),
+    numero di collisioni grezze e distinte (deduplicate per run e coppia di attori).
+    """
+    runs = aggregate_runs(event_table)
+    representative = event_table.iloc[runs["representative_pos"].to_numpy()].reset_index(drop=True)
+    collided = runs["collision_count"].to_numpy() > 0
+
+    table = pd.DataFrame({"original_filename": runs["original_filename"].to_numpy(),
+                          "town": representative["town"].astype(object).fillna("Unknown").to_numpy()})
+    table["weather_bucket"] = weather_buckets(
+        representative[[f"weather_{field}" for field in WEATHER_BUCKET_FIELDS]].to_numpy(dtype=np.float64))
+    for col in ("road_type_at_collision", "other_actor_type"):
+        values = representative[col].astype(object).fillna("Unknown").to_numpy()
+        table[col] = np.where(collided, values, NO_COLLISION_LABEL)
+
+    collision_rows = event_table[(event_table["event_type"] == "collision").to_numpy()]
+    episodes, _ = dedup_events(collision_rows, ("actor_id", "other_actor_id"), window_seconds,
+                               group_columns=("run_id",))
+    table["raw_collisions"] = runs["collision_count"].to_numpy()
+    table["collisions"] = np.bincount(episodes["run_id"].to_numpy(), minlength=len(runs))
+    return table
+
+
+def collision_rates(runs, by=RATE_GROUP_COLUMNS):
+    """
+    Tassi di collisione per ogni colonna di `by`: per ogni valore del gruppo, numero di run, run con
+    almeno una collisione, collisioni distinte, tasso (run con collisione / run) e collisioni per run.
+    Restituisce un dizionario colonna -> DataFrame ordinato per numero di run.
+    """
+    collided = (runs["collisions"].to_numpy() > 0).astype(np.float64)
+    collisions = runs["collisions"].to_numpy(dtype=np.float64)
+    rates = {}
+    for col in by:
+        groups, inverse = np.unique(runs[col].astype(str).to_numpy(), return_inverse=True)
+        n_runs = np.bincount(inverse, minlength=len(groups))
+        collision_runs = np.bincount(inverse, weights=collided, minlength=len(groups)).astype(np.int64)
+        group_collisions = np.bincount(inverse, weights=collisions, minlength=len(groups)).astype(np.int64)
+        table = pd.DataFrame({col: groups, "runs": n_runs, "collision_runs": collision_runs,
+                              "collisions": group_collisions, "collision_rate": collision_runs / n_runs,
+                              "collisions_per_run": group_collisions / n_runs})
+        rates[col] = table.sort_values(["runs", col], ascending=[False, True], kind="stable").reset_index(drop=True)
+    return rates
+
+
+if __name__ == "__main__":
+    # --- Configurazione Analisi ---
+    live_log_path = "newoutput/events_live.json"
+    input_folder = "simulation_output"
+    output_path = "analysis_results/event_analytics/event_analytics.json"
+    CATALOG_PATH = "analysis_results/scenario_catalog.sqlite"  # None per rileggere sempre tutti i file
+    DEDUP_WINDOW_SECONDS = COLLISION_DEDUP_WINDOW_SECONDS
+
+    report = {"dedup_window_seconds": DEDUP_WINDOW_SECONDS}
+
+    if os.path.exists(live_log_path):
+        live = load_live_events(live_log_path)
+        kind_counts = live["kind"].value_counts(sort=False)
+        live_collisions = dedup_live_collisions(live, DEDUP_WINDOW_SECONDS)
+        print(f"📄 Log live {live_log_path}: " + ", ".join(f"{k}={v}" for k, v in kind_counts.items()))
+        print(f"💥 Collisioni: {int(kind_counts.get('collisions', 0))} record, {len(live_collisions)} distinte "
+              f"(finestra {DEDUP_WINDOW_SECONDS:.1f} s).")
+        report["live_log"] = {
+            "file": live_log_path,
+            "events_by_kind": {k: int(v) for k, v in kind_counts.items()},
+            "distinct_collisions": len(live_collisions),
+            "collisions": [
+                {"timestamp": float(row.timestamp), "actor": row.actor, "other_actor": row.other_actor,
+                 "records": int(row.duplicates)}
+                for row in live_collisions.itertuples(index=False)
+            ]
+        }
+    else:
+        print(f"⚠️ Attenzione: Il log live '{live_log_path}' non esiste.")
+
+    if os.path.exists(input_folder):
+        runs = run_table(load_event_table(input_folder, CATALOG_PATH), DEDUP_WINDOW_SECONDS)
+        rates = collision_rates(runs)
+        print(f"\n📊 Tassi di collisione su {len(runs)} run ({int(runs['collisions'].sum())} collisioni distinte, "
+              f"{int(runs['raw_collisions'].sum())} record):")
+        for col, table in rates.items():
+            print(f"\n--- {col} ---")
+            print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        report["collision_rates"] = {col: table.to_dict(orient="records") for col, table in rates.items()}
+    else:
+        print(f"⚠️ Attenzione: La cartella '{input_folder}' non esiste.")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+    print(f"\n✅ Report salvato in {output_path}")
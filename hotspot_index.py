@@ -0,0 +1,222 @@
+import os
+import json
+
+import numpy as np
+
+from scenario_catalog import ScenarioCatalog
+
+
+# --- Indice Spaziale degli Hotspot di Collisione ---
+# Ogni collisione registra 'town' e 'impact_location'. Per ogni town i punti d'impatto sono ordinati per
+# cella di una griglia uniforme (lato HOTSPOT_CELL_METERS) e per ogni cella si conserva l'inizio del suo
+# intervallo di punti: una query a raggio r visita solo le (2 * ceil(r / lato) + 1)^2 celle intorno al punto.
+# Gli hotspot sono le celle con più collisioni nel loro intorno 3x3 (un incrocio a cavallo di due celle
+# non viene diviso). L'indice è salvato su disco (.npz, solo array numpy) insieme all'elenco dei file già
+# letti: ad ogni aggiornamento vengono letti solo i nuovi run.
+
+HOTSPOT_CELL_METERS = 10.0
+HOTSPOT_INDEX_PATH = "analysis_results/hotspot_index.npz"
+HOTSPOT_INDEX_VERSION = 1
+
+
+def collision_points(events):
+    """Punti d'impatto (town, x, y) delle collisioni di una lista di eventi."""
+    points = []
+    for event in events:
+        if not isinstance(event, dict) or event.get("event_type") != "collision":
+            continue
+        impact = event.get("impact_location") or {}
+        try:
+            points.append((str(event.get("town")), float(impact["x"]), float(impact["y"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return points
+
+
+class _TownGrid:
+    """Griglia uniforme densa dei punti d'impatto di una town (ricostruita quando arrivano nuovi punti)."""
+
+    def __init__(self, xs, ys, cell_size):
+        self.cell_size = cell_size
+        cx = np.floor(xs / cell_size).astype(np.int64)
+        cy = np.floor(ys / cell_size).astype(np.int64)
+        self.origin = (int(cx.min()), int(cy.min()))
+        self.shape = (int(cx.max()) - self.origin[0] + 1, int(cy.max()) - self.origin[1] + 1)
+
+        cells = (cx - self.origin[0]) * self.shape[1] + (cy - self.origin[1])
+        order = np.argsort(cells, kind="stable")
+        self.xs, self.ys = xs[order], ys[order]
+        self.counts = np.bincount(cells, minlength=self.shape[0] * self.shape[1]).reshape(self.shape)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts.ravel())])
+
+    def query_radius(self, x, y, radius):
+        reach = int(np.ceil(radius / self.cell_size))
+        cx = int(np.floor(x / self.cell_size)) - self.origin[0]
+        cy = int(np.floor(y / self.cell_size)) - self.origin[1]
+        x_lo, x_hi = max(cx - reach, 0), min(cx + reach + 1, self.shape[0])
+        y_lo, y_hi = max(cy - reach, 0), min(cy + reach + 1, self.shape[1])
+        if x_lo >= x_hi or y_lo >= y_hi:
+            return np.zeros((0, 2))
+
+        # Le celle di una stessa colonna x sono contigue: un intervallo di punti per colonna
+        rows = np.arange(x_lo, x_hi) * self.shape[1]
+        starts, stops = self.starts[rows + y_lo], self.starts[rows + y_hi]
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+        inside = (self.xs[idx] - x) ** 2 + (self.ys[idx] - y) ** 2 <= radius ** 2
+        return np.column_stack([self.xs[idx[inside]], self.ys[idx[inside]]])
+
+    def top_hotspots(self, k):
+        padded = np.pad(self.counts, 1)
+        neighbourhood = sum(padded[dx:dx + self.shape[0], dy:dy + self.shape[1]]
+                            for dx in range(3) for dy in range(3))
+        neighbourhood = np.where(self.counts > 0, neighbourhood, 0)  # solo celle con almeno una collisione
+
+        flat = neighbourhood.ravel()
+        k = min(k, int(np.count_nonzero(flat)))
+        top = np.argpartition(-flat, k - 1)[:k] if k else np.zeros(0, dtype=np.int64)
+        top = top[np.argsort(-flat[top], kind="stable")]
+
+        hotspots = []
+        for cell in top.tolist():
+            start, stop = self.starts[cell], self.starts[cell + 1]
+            hotspots.append({
+                "x": float(self.xs[start:stop].mean()),
+                "y": float(self.ys[start:stop].mean()),
+                "cell_collisions": int(stop - start),
+                "neighbourhood_collisions": int(flat[cell])
+            })
+        return hotspots
+
+
+class HotspotIndex:
+    """
+    Indice per town dei punti d'impatto delle collisioni: query a raggio e top-k hotspot in pochi
+    millisecondi, aggiornamento incrementale da simulation_output e salvataggio su disco.
+    """
+
+    def __init__(self, cell_size=HOTSPOT_CELL_METERS):
+        self.cell_size = float(cell_size)
+        self.processed_files = set()
+        self._points = {}  # town -> (xs, ys)
+        self._grids = {}  # town -> _TownGrid, costruita alla prima query dopo ogni aggiornamento
+
+    @classmethod
+    def load(cls, path=HOTSPOT_INDEX_PATH, cell_size=HOTSPOT_CELL_METERS):
+        """Carica l'indice salvato; un indice mancante, di altra versione o altro lato di cella riparte vuoto."""
+        index = cls(cell_size)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("version") != HOTSPOT_INDEX_VERSION or meta.get("cell_size") != index.cell_size:
+                    print(f"⚠️ Indice degli hotspot {path} non compatibile: verrà ricostruito.")
+                    return index
+                index.processed_files = set(meta.get("processed_files", []))
+                for k, town in enumerate(meta.get("towns", [])):
+                    index._points[town] = (data[f"x_{k}"], data[f"y_{k}"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Errore nella lettura dell'indice degli hotspot {path}: {e}. Verrà ricostruito.")
+            return cls(cell_size)
+        return index
+
+    def save(self, path=HOTSPOT_INDEX_PATH):
+        """Salva l'indice (scrittura atomica: ego_traffic.py può leggerlo mentre viene aggiornato)."""
+        towns = sorted(self._points)
+        meta = {"version": HOTSPOT_INDEX_VERSION, "cell_size": self.cell_size, "towns": towns,
+                "processed_files": sorted(self.processed_files)}
+        arrays = {"meta": np.array(json.dumps(meta))}
+        for k, town in enumerate(towns):
+            arrays[f"x_{k}"], arrays[f"y_{k}"] = self._points[town]
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def add_points(self, points):
+        """Aggiunge punti (town, x, y) all'indice."""
+        by_town = {}
+        for town, x, y in points:
+            by_town.setdefault(town, []).append((x, y))
+        for town, new_points in by_town.items():
+            new_points = np.asarray(new_points, dtype=np.float64)
+            xs, ys = self._points.get(town, (np.zeros(0), np.zeros(0)))
+            self._points[town] = (np.concatenate([xs, new_points[:, 0]]), np.concatenate([ys, new_points[:, 1]]))
+            self._grids.pop(town, None)
+
+    def update_from_folder(self, folder_path):
+        """Legge solo i file di simulazione non ancora indicizzati. Restituisce il numero di collisioni aggiunte."""
+        points = []
+        for file_path, filename, _, _ in ScenarioCatalog.scan_folder(folder_path):
+            if filename in self.processed_files:
+                continue
+            try:
+                with open(file_path, "r") as f:
+                    events = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"❌ Errore nella lettura di {filename}: {e}. Saltato.")
+                continue  # non registrato: verrà riletto al prossimo aggiornamento
+            if isinstance(events, list):
+                points.extend(collision_points(events))
+            self.processed_files.add(filename)
+
+        self.add_points(points)
+        return len(points)
+
+    def towns(self):
+        return sorted(self._points)
+
+    def num_collisions(self, town=None):
+        if town is not None:
+            return len(self._points[town][0]) if town in self._points else 0
+        return sum(len(xs) for xs, _ in self._points.values())
+
+    def _grid(self, town):
+        if town not in self._points or len(self._points[town][0]) == 0:
+            return None
+        if town not in self._grids:
+            self._grids[town] = _TownGrid(*self._points[town], self.cell_size)
+        return self._grids[town]
+
+    def query_radius(self, town, x, y, radius):
+        """Punti d'impatto (array m x 2) delle collisioni della town entro `radius` metri da (x, y)."""
+        grid = self._grid(town)
+        return grid.query_radius(x, y, radius) if grid else np.zeros((0, 2))
+
+    def count_within(self, town, locations, radius):
+        """Numero di collisioni entro `radius` metri da ciascuna delle posizioni (x, y)."""
+        return np.array([len(self.query_radius(town, x, y, radius)) for x, y in locations], dtype=np.int64)
+
+    def top_hotspots(self, town, k=10):
+        """
+        Le `k` celle della town con più collisioni nel loro intorno 3x3, in ordine decrescente:
+        posizione media dei punti della cella e conteggi della cella e dell'intorno.
+        """
+        grid = self._grid(town)
+        return grid.top_hotspots(k) if grid else []
+
+
+def spawn_point_weights(index, town, locations, radius, bias):
+    """
+    Pesi di campionamento dei punti di spawn: 1 + bias * (collisioni note entro `radius` metri).
+    Con bias 0 (o senza collisioni note nella town) tutti i punti hanno lo stesso peso.
+    """
+    counts = index.count_within(town, locations, radius)
+    return 1.0 + bias * counts
+
+
+if __name__ == "__main__":
+    input_folder = "simulation_output"
+    TOP_K = 5
+
+    index = HotspotIndex.load()
+    added = index.update_from_folder(input_folder)
+    index.save()
+    print(f"Indice degli hotspot aggiornato: +{added} collisioni (totale {index.num_collisions()}).")
+    for town in index.towns():
+        print(f"\n📍 {town}: {index.num_collisions(town)} collisioni")
+        for rank, hotspot in enumerate(index.top_hotspots(town, TOP_K), start=1):
+            print(f"  {rank}. ({hotspot['x']:.1f}, {hotspot['y']:.1f}): {hotspot['cell_collisions']} nella cella, "
+                  f"{hotspot['neighbourhood_collisions']} nell'intorno")
@@ -2,6 +2,7 @@ import os
 import time
 import subprocess
 import sys
+import json
 
 EXAMPLES_DIR = r"C:\Users\SeSaLab Tesi\Documents\TesistiAntonioTrovato\adas_testing\WindowsNoEditor\PythonAPI\examples"
 SCRIPT_NAME = "ego_traffic.py"
@@ -14,6 +15,27 @@ EXPECTED_SIMULATION_DURATION = 60  # Secondi, come definito in ego_traffic.py
 # Tempo massimo di attesa tra uno scenario e l'altro se lo scenario finisce prima
 MAX_WAIT_BETWEEN_SCENARIOS = 3 # Secondi
 
+# Log JSONL delle durate misurate (una riga per esecuzione), letto da selection_result.py.
+# L'estensione .jsonl evita che venga scambiato per un file di eventi.
+RUN_DURATIONS_LOG = os.path.join(EXAMPLES_DIR, "simulation_output", "run_durations.jsonl")
+OUTPUT_FILE_MARKER = "Simulation data saved to:"
+
+
+def log_run_duration(stdout, duration, returncode):
+    """Associa la durata misurata al file di eventi prodotto dall'esecuzione e la salva nel log."""
+    output_file = None
+    for line in (stdout or "").splitlines():
+        if OUTPUT_FILE_MARKER in line:
+            output_file = line.split(OUTPUT_FILE_MARKER, 1)[1].strip()
+    if output_file is None:
+        return
+    os.makedirs(os.path.dirname(RUN_DURATIONS_LOG), exist_ok=True)
+    with open(RUN_DURATIONS_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"output_file": os.path.basename(output_file),
+                            "duration_seconds": round(duration, 2),
+                            "returncode": returncode}) + "\n")
+
+
 while True:
     print("[INFO] Avvio nuovo ciclo di simulazione CARLA...")
     start_run_time = time.time()  # Registra l'ora di inizio dell'esecuzione dello script
@@ -35,6 +57,7 @@ while True:
 
         print(f"[INFO] Script '{SCRIPT_NAME}' terminato con codice di uscita: {result.returncode}")
         print(f"[INFO] Durata effettiva esecuzione: {actual_duration:.2f} secondi")
+        log_run_duration(result.stdout, actual_duration, result.returncode)
 
         if result.stdout:
             print("\n--- Output dello script CARLA (stdout) ---")
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from scenario_catalog import ScenarioCatalog
+from selection_result import (read_events_file, additional_greedy, load_runner_durations, file_timestamp,
+                              measured_exec_time, estimate_exec_times, FEATURE_NUMERIC_FIELDS,
+                              FEATURE_CATEGORICAL_COLUMNS)
+
+
+# --- Selezione Incrementale ---
+# La diversità di uno scenario è la distanza di Manhattan media (feature numeriche scalate MinMax,
+# categoriche one-hot) da tutti gli altri, come in compute_div_scores. Scomponendo la distanza:
+# - per ogni colonna numerica k si conserva S[i, k] = sum_j |x_ik - x_jk| in unità grezze: un cambio
+#   dell'intervallo MinMax cambia solo il divisore, quindi non serve ricalcolare nulla;
+# - per una colonna one-hot due scenari distano 2 se la categoria è diversa, 0 altrimenti: basta
+#   contare quante volte compare ogni categoria.
+# Aggiungere uno scenario costa quindi O(n * colonne numeriche).
+# I tempi di esecuzione seguono le regole di extract_exec_times: le stime dagli intervalli tra i file e le
+# mediane per tipo di evento dipendono da tutti i run, quindi vengono ricalcolate (in O(n log n)) alla prima
+# lettura dopo ogni aggiunta, anche quando i file arrivano fuori ordine.
+
+# Stesso schema fisso delle feature di compute_div_scores
+NUMERIC_FEATURES = FEATURE_NUMERIC_FIELDS
+CATEGORICAL_KEYS = FEATURE_CATEGORICAL_COLUMNS
+
+
+def _to_float(value):
+    """Valore numerico della feature, 0 se assente o non numerico (come in build_feature_matrix)."""
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(result) else result
+
+
+def representative_event(events, filename):
+    """
+    Evento rappresentativo di un run, come in load_scenarios_from_folder: la prima collisione
+    (o il primo evento), con 'original_filename', 'num_events' e 'collision_count'.
+    """
+    collision_ordinals = [i for i, e in enumerate(events) if e.get("event_type") == "collision"]
+    scenario_event_data = dict(events[collision_ordinals[0] if collision_ordinals else 0])
+    scenario_event_data['original_filename'] = filename
+    scenario_event_data['num_events'] = len(events)
+    scenario_event_data['collision_count'] = len(collision_ordinals)
+    return scenario_event_data
+
+
+class IncrementalSelector:
+    """
+    Mantiene punteggi di diversità e suite selezionata mentre arrivano nuovi scenari, senza
+    ricalcolare feature, scaler e distanze da zero. Punteggi e tempi di esecuzione sono quelli che
+    compute_div_scores ed extract_exec_times darebbero sugli stessi scenari.
+    """
+
+    def __init__(self, runner_durations=None, initial_capacity=1024):
+        self.runner_durations = runner_durations or {}
+        self.scenarios = []
+        self.collisions = []
+        # Ingressi di estimate_exec_times per scenario; i tempi derivati sono validi finché non arriva un run
+        self._measured_times = []
+        self._file_timestamps = []
+        self._event_types = []
+        self._exec_times = None
+
+        # Colonne numeriche: valori grezzi, somme delle distanze e intervalli MinMax
+        cols = len(NUMERIC_FEATURES)
+        self._raw = np.zeros((initial_capacity, cols), dtype=np.float64)
+        self._dist_sums = np.zeros((initial_capacity, cols), dtype=np.float64)
+        self._col_min = np.zeros(cols, dtype=np.float64)
+        self._col_max = np.zeros(cols, dtype=np.float64)
+
+        # Colonne categoriche: vocabolario (categoria -> codice), conteggi per codice e codici per scenario
+        self.vocabularies = {key: {} for key in CATEGORICAL_KEYS}
+        self._category_counts = {key: [] for key in CATEGORICAL_KEYS}
+        self._codes = {key: [] for key in CATEGORICAL_KEYS}
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def _ensure_capacity(self, rows):
+        capacity = self._raw.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(capacity, 1)
+        while new_capacity < rows:
+            new_capacity *= 2
+        for name in ("_raw", "_dist_sums"):
+            old = getattr(self, name)
+            grown = np.zeros((new_capacity, old.shape[1]), dtype=np.float64)
+            grown[:old.shape[0]] = old
+            setattr(self, name, grown)
+
+    @staticmethod
+    def _numeric_vector(scenario):
+        return np.array([_to_float((scenario.get(group) or {}).get(field)) for group, field in NUMERIC_FEATURES],
+                        dtype=np.float64)
+
+    @property
+    def exec_times(self):
+        """Tempi di esecuzione di tutti gli scenari, ricalcolati alla prima lettura dopo un'aggiunta."""
+        if self._exec_times is None:
+            self._exec_times, _, _ = estimate_exec_times(self._measured_times, self._file_timestamps,
+                                                         self._event_types)
+        return self._exec_times
+
+    def add(self, scenario):
+        """Aggiunge uno scenario aggiornando intervalli, vocabolari e somme delle distanze in O(n)."""
+        n = len(self.scenarios)
+        vector = self._numeric_vector(scenario)
+        self._ensure_capacity(n + 1)
+
+        self._raw[n] = vector
+        diffs = np.abs(self._raw[:n] - vector)
+        self._dist_sums[:n] += diffs
+        self._dist_sums[n] = diffs.sum(axis=0)
+
+        if n == 0:
+            self._col_min[:] = vector
+            self._col_max[:] = vector
+        else:
+            np.minimum(self._col_min, vector, out=self._col_min)
+            np.maximum(self._col_max, vector, out=self._col_max)
+
+        for key in CATEGORICAL_KEYS:
+            value = scenario.get(key)
+            category = 'Unknown' if value is None else value
+            vocabulary = self.vocabularies[key]
+            if category not in vocabulary:
+                vocabulary[category] = len(vocabulary)
+                self._category_counts[key].append(0)
+            code = vocabulary[category]
+            self._category_counts[key][code] += 1
+            self._codes[key].append(code)
+
+        self._measured_times.append(measured_exec_time(scenario, self.runner_durations))
+        self._file_timestamps.append(file_timestamp(scenario.get("original_filename")))
+        self._event_types.append(scenario.get("event_type"))
+        self._exec_times = None
+
+        self.scenarios.append(scenario)
+        self.collisions.append(1 if scenario.get("event_type") == "collision" else 0)
+
+    def div_scores(self):
+        """Punteggi di diversità di tutti gli scenari, uguali a compute_div_scores, in O(n)."""
+        n = len(self.scenarios)
+        if n < 2:
+            return [0.0] * n
+
+        ranges = self._col_max - self._col_min
+        inv_ranges = np.divide(1.0, ranges, out=np.zeros_like(ranges), where=ranges > 0)
+        totals = self._dist_sums[:n] @ inv_ranges
+
+        for key in CATEGORICAL_KEYS:
+            counts = np.asarray(self._category_counts[key], dtype=np.float64)
+            codes = np.asarray(self._codes[key], dtype=np.int64)
+            totals += 2.0 * (n - counts[codes])
+
+        return (totals / (n - 1)).tolist()
+
+    def select(self, lazy=True):
+        """Suite selezionata con l'Additional Greedy sui punteggi correnti."""
+        divs = self.div_scores()
+        exec_times = self.exec_times
+        max_exec_time = max(exec_times) if exec_times else 0.0
+        return additional_greedy(self.collisions, exec_times, divs, max_exec_time, self.scenarios, lazy=lazy)
+
+
+# --- Modalità Watch ---
+
+def watch_folder(folder_path, output_path, poll_interval=5.0, runner_durations_log=None, max_polls=None):
+    """
+    Controlla periodicamente la cartella e aggiunge in modo incrementale i nuovi file di simulazione
+    (ogni run viene scritto una sola volta da ego_traffic.py, quindi i file già aggiunti non vengono riletti;
+    un file illeggibile, ad esempio ancora in scrittura, viene riprovato quando cambiano mtime o dimensione).
+    Dopo ogni gruppo di nuovi scenari aggiorna la suite selezionata e la salva in `output_path`.
+    """
+    selector = IncrementalSelector(load_runner_durations(runner_durations_log))
+    added_paths = set()  # file aggiunti alla selezione
+    # (mtime, dimensione) dell'ultimo tentativo fallito: ego_traffic.py scrive i file senza rinomina atomica,
+    # quindi un file letto a metà scrittura viene riletto appena cambia, come nel ScenarioCatalog
+    failed_reads = {}
+    polls = 0
+    print(f"👀 Modalità watch su {folder_path} (ogni {poll_interval:.1f} secondi). Ctrl+C per terminare.")
+
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            new_entries = [e for e in ScenarioCatalog.scan_folder(folder_path)
+                           if e[0] not in added_paths and failed_reads.get(e[0]) != (e[2], e[3])]
+            # I file sono scritti in ordine di tempo: aggiunti in ordine, gli indici seguono l'ordine dei run
+            new_entries.sort(key=lambda e: (file_timestamp(e[1]) or 0, e[0]))
+
+            added = 0
+            for file_path, filename, mtime_ns, size in new_entries:
+                events = read_events_file(file_path)
+                if events:
+                    added_paths.add(file_path)
+                    failed_reads.pop(file_path, None)
+                    selector.add(representative_event(events, filename))
+                    added += 1
+                else:
+                    failed_reads[file_path] = (mtime_ns, size)
+
+            if added:
+                selected = selector.select()
+                write_selected_suite(selector, selected, output_path)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] +{added} scenari (totale {len(selector)}): "
+                      f"{len(selected)} selezionati.")
+
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Modalità watch terminata.")
+
+    return selector
+
+
+def write_selected_suite(selector, selected_indices, output_path):
+    """Salva la suite selezionata corrente (scrittura atomica, per chi la legge mentre viene aggiornata)."""
+    divs = selector.div_scores()
+    suite = {
+        "updated_at": datetime.now().strftime('%Y%m%d_%H%M%S'),
+        "total_scenarios_analyzed": len(selector),
+        "num_selected_scenarios": len(selected_indices),
+        "total_collisions_covered": sum(selector.collisions[i] for i in selected_indices),
+        "total_execution_time_seconds": f"{sum(selector.exec_times[i] for i in selected_indices):.2f}",
+        "selected_scenarios": [
+            {
+                "index_in_original_list": i,
+                "original_filename": selector.scenarios[i].get('original_filename', 'N/A'),
+                "event_type": selector.scenarios[i].get('event_type', 'N/A'),
+                "diversity_score": f"{divs[i]:.3f}",
+                "collision_flag": selector.collisions[i],
+                "execution_time": selector.exec_times[i]
+            }
+            for i in selected_indices
+        ]
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(suite, f, indent=4)
+    os.replace(tmp_path, output_path)
+
+
+if __name__ == "__main__":
+    input_folder = "simulation_output"
+    output_path = "analysis_results/online/selected_suite.json"
+    POLL_INTERVAL_SECONDS = 5.0
+
+    watch_folder(input_folder, output_path, POLL_INTERVAL_SECONDS,
+                 runner_durations_log=os.path.join(input_folder, "run_durations.jsonl"))
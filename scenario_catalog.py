@@ -0,0 +1,278 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+
+# --- Schema degli eventi ---
+# Ogni evento di simulation_events_*.json viene appiattito in una riga con colonne fisse.
+# I campi annidati (weather, town_characteristics, impact_location) diventano colonne con prefisso;
+# le chiavi non previste dallo schema finiscono nella colonna 'extra' (JSON) per non perdere dati.
+
+CATALOG_SCHEMA_VERSION = 3
+FOLDER_FINGERPRINT_SNAPSHOT = "folder_fingerprint"  # elenco dei file all'ultima sincronizzazione (vedi sync)
+
+EVENT_FIELDS = ("event_type", "timestamp", "message", "actor_id", "actor_type", "other_actor_id",
+                "other_actor_type", "town", "road_type_at_collision", "run_duration_seconds",
+                "simulation_duration_seconds")
+WEATHER_FIELDS = ("cloudiness", "precipitation", "precipitation_deposits", "wind_intensity",
+                  "fog_density", "sun_altitude_angle")
+TOWN_CHARACTERISTICS_FIELDS = ("map_name", "traffic_lights", "approx_curves", "approx_junctions", "approx_roads")
+IMPACT_LOCATION_FIELDS = ("x", "y", "z")
+
+NESTED_FIELDS = {
+    "weather": ("weather_", WEATHER_FIELDS),
+    "town_characteristics": ("tc_", TOWN_CHARACTERISTICS_FIELDS),
+    "impact_location": ("impact_", IMPACT_LOCATION_FIELDS),
+}
+
+EVENT_COLUMNS = EVENT_FIELDS + tuple(
+    prefix + field
+    for prefix, fields in NESTED_FIELDS.values()
+    for field in fields
+)
+
+# Ordine delle chiavi con cui ego_traffic.py scrive gli eventi, usato per ricostruirli
+_EVENT_LAYOUT = ("event_type", "timestamp", "message", "actor_id", "actor_type", "other_actor_id",
+                 "other_actor_type", "impact_location", "town", "town_characteristics",
+                 "road_type_at_collision", "weather", "run_duration_seconds", "simulation_duration_seconds")
+
+
+def _is_scalar(value):
+    return value is not None and not isinstance(value, (dict, list))
+
+
+def flatten_event(event):
+    """
+    Converte un evento (dizionario annidato) in un dizionario piatto sulle colonne EVENT_COLUMNS.
+    Restituisce la riga e il JSON delle chiavi extra (None se non ce ne sono).
+    """
+    row = {}
+    extra = {}
+    for key, value in event.items():
+        if key in EVENT_FIELDS and _is_scalar(value):
+            row[key] = value
+        elif key in NESTED_FIELDS and isinstance(value, dict):
+            prefix, fields = NESTED_FIELDS[key]
+            nested_extra = {}
+            stored_any = False
+            for sub_key, sub_value in value.items():
+                if sub_key in fields and _is_scalar(sub_value):
+                    row[prefix + sub_key] = sub_value
+                    stored_any = True
+                else:
+                    nested_extra[sub_key] = sub_value
+            if nested_extra or not stored_any:
+                extra[key] = nested_extra
+        else:
+            extra[key] = value
+    return row, (json.dumps(extra) if extra else None)
+
+
+def flatten_events(events):
+    """
+    Appiattisce la lista di eventi di un file in tuple (ordinale, *EVENT_COLUMNS, extra).
+    """
+    rows = []
+    for ordinal, event in enumerate(events or []):
+        row, extra_json = flatten_event(event)
+        rows.append((ordinal,) + tuple(row.get(c) for c in EVENT_COLUMNS) + (extra_json,))
+    return rows
+
+
+def _build_unflatten_layout():
+    # Le colonne di ogni campo annidato sono contigue in EVENT_COLUMNS: basta l'intervallo
+    layout = []
+    for key in _EVENT_LAYOUT:
+        if key in NESTED_FIELDS:
+            prefix, fields = NESTED_FIELDS[key]
+            start = EVENT_COLUMNS.index(prefix + fields[0])
+            layout.append((key, fields, start, start + len(fields)))
+        else:
+            layout.append((key, None, EVENT_COLUMNS.index(key), None))
+    return tuple(layout)
+
+
+_UNFLATTEN_LAYOUT = _build_unflatten_layout()
+
+
+def unflatten_event(values, extra_json):
+    """
+    Ricostruisce l'evento originale a partire dai valori delle colonne EVENT_COLUMNS
+    (nello stesso ordine) e dal JSON delle chiavi extra.
+    """
+    extra = json.loads(extra_json) if extra_json else None
+    event = {}
+    for key, fields, start, stop in _UNFLATTEN_LAYOUT:
+        if fields is None:
+            value = values[start]
+            if value is not None:
+                event[key] = value
+            continue
+
+        chunk = values[start:stop]
+        if None in chunk:
+            nested = {field: value for field, value in zip(fields, chunk) if value is not None}
+        else:
+            nested = dict(zip(fields, chunk))
+        if extra and key in extra:
+            nested.update(extra.pop(key))
+        elif not nested:
+            continue
+        event[key] = nested
+    if extra:
+        event.update(extra)
+    return event
+
+
+# --- Catalogo ---
+
+class ScenarioCatalog:
+    """
+    Catalogo SQLite degli eventi estratti dai file JSON di simulazione.
+    Ogni file è identificato da percorso, mtime e dimensione: a ogni sincronizzazione vengono
+    riletti solo i file nuovi o modificati, mentre quelli rimossi dalla cartella vengono eliminati.
+    Accanto agli eventi il catalogo conserva degli snapshot (blob con nome) di dati derivati da tutti gli
+    eventi, validi finché l'elenco dei file (percorso, mtime, dimensione) resta quello dell'ultima sincronizzazione.
+    """
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        catalog_dir = os.path.dirname(os.path.abspath(catalog_path))
+        os.makedirs(catalog_dir, exist_ok=True)
+        self.conn = sqlite3.connect(catalog_path)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_SCHEMA_VERSION:
+            # Schema diverso (o catalogo nuovo): si riparte da zero, i dati sono sempre ricostruibili
+            self.conn.execute("DROP TABLE IF EXISTS events")
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute("DROP TABLE IF EXISTS snapshots")
+
+        # Le colonne degli eventi non hanno tipo dichiarato: SQLite conserva il tipo originale del valore JSON
+        event_columns_sql = ", ".join(EVENT_COLUMNS)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                n_events INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                path TEXT NOT NULL,
+                ordinal INTEGER NOT NULL,
+                {event_columns_sql},
+                extra,
+                PRIMARY KEY (path, ordinal)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS snapshots (
+                name TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            );
+            PRAGMA user_version = {CATALOG_SCHEMA_VERSION};
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def scan_folder(folder_path):
+        """
+        Elenca i file JSON della cartella (e sottocartelle) nello stesso ordine di os.walk,
+        restituendo (percorso, nome file, mtime_ns, dimensione) per ciascuno.
+        """
+        entries = []
+        pending_dirs = [folder_path]
+        while pending_dirs:
+            subdirs = []
+            with os.scandir(pending_dirs.pop()) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(".json"):
+                        st = entry.stat()
+                        entries.append((entry.path, entry.name, st.st_mtime_ns, st.st_size))
+            # Come os.walk: prima i file della cartella, poi le sottocartelle nell'ordine di scansione
+            pending_dirs.extend(reversed(subdirs))
+        return entries
+
+    def sync(self, folder_path, read_events_file, map_fn=map):
+        """
+        Allinea il catalogo al contenuto della cartella.
+        `read_events_file(percorso)` deve restituire la lista di eventi del file, oppure None
+        se il file non è valido (in tal caso viene registrato con 0 eventi e non riletto finché non cambia).
+        `map_fn` permette di leggere i file modificati in parallelo (es. ProcessPoolExecutor.map).
+        Restituisce l'elenco ordinato dei file presenti e il numero di file (ri)letti.
+        """
+        entries = self.scan_folder(folder_path)
+        # Impronta dell'elenco dei file: se è quella dell'ultima sincronizzazione non c'è nulla da confrontare
+        fingerprint = hashlib.sha1("\n".join(f"{e[0]}\t{e[2]}\t{e[3]}" for e in entries).encode()).digest()
+        if self.load_snapshot(FOLDER_FINGERPRINT_SNAPSHOT) == fingerprint:
+            return entries, 0
+
+        known = set(self.conn.execute("SELECT path, mtime_ns, size FROM files"))
+
+        to_parse = [e for e in entries if (e[0], e[2], e[3]) not in known]
+        removed = []
+        if len(entries) - len(to_parse) != len(known):
+            # Qualche file del catalogo non corrisponde a nessun file invariato: rimosso o modificato
+            present = {e[0] for e in entries}
+            removed = [(path,) for path, _, _ in known if path not in present]
+
+        placeholders = ", ".join("?" * (len(EVENT_COLUMNS) + 3))
+        insert_event_sql = f"INSERT INTO events (path, ordinal, {', '.join(EVENT_COLUMNS)}, extra) VALUES ({placeholders})"
+
+        with self.conn:
+            # Gli snapshot descrivono il contenuto (e l'ordine) dei file: ogni modifica li invalida
+            self.conn.execute("DELETE FROM snapshots")
+            if removed:
+                self.conn.executemany("DELETE FROM events WHERE path = ?", removed)
+                self.conn.executemany("DELETE FROM files WHERE path = ?", removed)
+
+            parsed = map_fn(read_events_file, [e[0] for e in to_parse])
+            for (file_path, filename, mtime_ns, size), events in zip(to_parse, parsed):
+                event_rows = [(file_path,) + row for row in flatten_events(events)]
+
+                self.conn.execute("DELETE FROM events WHERE path = ?", (file_path,))
+                self.conn.executemany(insert_event_sql, event_rows)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files (path, filename, mtime_ns, size, n_events) VALUES (?, ?, ?, ?, ?)",
+                    (file_path, filename, mtime_ns, size, len(event_rows)))
+            self.conn.execute("INSERT INTO snapshots (name, data) VALUES (?, ?)",
+                              (FOLDER_FINGERPRINT_SNAPSHOT, fingerprint))
+
+        return entries, len(to_parse)
+
+    def load_event_rows(self, entries):
+        """
+        Restituisce gli eventi dei file in `entries` come lista piatta di tuple
+        (ordinale, *EVENT_COLUMNS, extra), raggruppate per file nell'ordine di `entries`,
+        insieme al numero di eventi di ciascun file.
+        """
+        events_by_path = {}
+        query = f"SELECT path, ordinal, {', '.join(EVENT_COLUMNS)}, extra FROM events ORDER BY path, ordinal"
+        for row in self.conn.execute(query):
+            events_by_path.setdefault(row[0], []).append(row[1:])
+
+        rows = []
+        counts = []
+        for file_path, _, _, _ in entries:
+            file_rows = events_by_path.get(file_path, [])
+            rows.extend(file_rows)
+            counts.append(len(file_rows))
+        return rows, counts
+
+    def load_snapshot(self, name):
+        """Restituisce il blob dello snapshot `name`, o None se manca o è stato invalidato da sync."""
+        row = self.conn.execute("SELECT data FROM snapshots WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def save_snapshot(self, name, data):
+        """Salva lo snapshot `name` (bytes) del contenuto attuale del catalogo."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (name, data) VALUES (?, ?)", (name, data))
@@ -0,0 +1,145 @@
+import numpy as np
+
+from scenario_catalog import WEATHER_FIELDS
+
+
+# --- Deduplicazione dei Run Quasi Identici ---
+# Molti run sono di fatto lo stesso scenario: stessa town, stesso preset meteo di set_random_weather,
+# stessa coppia di tipi di attori e impatto nella stessa zona. Ogni scenario diventa un insieme di token
+# (uno per faccetta, con il meteo in fasce e l'impatto su una griglia) e due scenari sono quasi duplicati
+# se la similarità di Jaccard dei token supera la soglia. I candidati si trovano con MinHash + LSH a bande
+# (tempo quasi lineare, nessun confronto tra tutte le coppie) e vengono poi verificati con la Jaccard esatta.
+# Tipo di evento e town sono chiavi rigide: collisioni e run senza incidenti, o run in town diverse,
+# non si fondono mai.
+
+DEDUP_NUM_PERM = 32  # funzioni hash della firma MinHash
+DEDUP_BANDS = 8  # bande LSH da DEDUP_NUM_PERM / DEDUP_BANDS righe (soglia implicita ~0.6)
+DEDUP_JACCARD_THRESHOLD = 0.8  # con 10 token: una faccetta diversa dà 9/11 ≈ 0.82, due danno 8/12 ≈ 0.67
+DEDUP_WEATHER_BUCKET = 10.0
+DEDUP_IMPACT_GRID_METERS = 10.0
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _codes(values):
+    """Codici interi densi dei valori (i NaN hanno un codice proprio)."""
+    _, inverse = np.unique(values, return_inverse=True)
+    return inverse.ravel().astype(np.int64)
+
+
+def scenario_token_ids(scenarios, weather_bucket=DEDUP_WEATHER_BUCKET, impact_grid=DEDUP_IMPACT_GRID_METERS):
+    """
+    Matrice (n scenari x faccette) degli identificativi dei token: un token per faccetta (town, road_type,
+    coppia di tipi di attori, cella della griglia d'impatto e una fascia per ogni parametro meteo).
+    Ogni faccetta ha un proprio intervallo di identificativi, quindi token uguali = stessa faccetta e valore.
+    """
+    columns = [
+        _codes(np.array([str(s.get("town")) for s in scenarios], dtype=object)),
+        _codes(np.array([str(s.get("road_type_at_collision")) for s in scenarios], dtype=object)),
+        _codes(np.array([f"{s.get('actor_type')}|{s.get('other_actor_type')}" for s in scenarios], dtype=object)),
+    ]
+
+    impacts = [s.get("impact_location") or {} for s in scenarios]
+    cell_x = _codes(np.floor(np.array([_to_float(i.get("x")) for i in impacts]) / impact_grid))
+    cell_y = _codes(np.floor(np.array([_to_float(i.get("y")) for i in impacts]) / impact_grid))
+    columns.append(_codes(cell_x * (cell_y.max() + 1) + cell_y))
+
+    weathers = [s.get("weather") or {} for s in scenarios]
+    for field in WEATHER_FIELDS:
+        columns.append(_codes(np.floor(np.array([_to_float(w.get(field)) for w in weathers]) / weather_bucket)))
+
+    token_ids = np.empty((len(scenarios), len(columns)), dtype=np.int64)
+    offset = 0
+    for k, codes in enumerate(columns):
+        token_ids[:, k] = codes + offset
+        offset += int(codes.max()) + 1
+    return token_ids
+
+
+def minhash_signatures(token_ids, num_perm=DEDUP_NUM_PERM, seed=0, chunk_rows=8192):
+    """
+    Firme MinHash (n x num_perm) di una matrice di identificativi di token (n x token per scenario),
+    con hash universali (a * token + b) mod p. Calcolate a blocchi di righe per limitare la memoria.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.int64)
+    b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.int64)
+    n_tokens = int(token_ids.max()) + 1 if token_ids.size else 0
+    token_hashes = (np.arange(n_tokens, dtype=np.int64)[:, None] * a + b) % _MERSENNE_PRIME
+
+    signatures = np.empty((token_ids.shape[0], num_perm), dtype=np.int64)
+    for start in range(0, token_ids.shape[0], chunk_rows):
+        stop = start + chunk_rows
+        signatures[start:stop] = token_hashes[token_ids[start:stop]].min(axis=1)
+    return signatures
+
+
+def dedup_scenarios(scenarios, threshold=DEDUP_JACCARD_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS,
+                    seed=0):
+    """
+    Raggruppa gli scenari quasi duplicati e restituisce (rappresentanti, pesi, etichette):
+    - rappresentanti: indice del primo scenario di ogni gruppo, in ordine crescente;
+    - pesi: numero di scenari rappresentati da ciascuno;
+    - etichette: per ogni scenario, la posizione del suo rappresentante nella lista.
+    Gli scenari vengono visitati in ordine: ognuno si confronta solo con i rappresentanti già registrati
+    nei propri bucket LSH (uno per banda) e si unisce al più simile se supera la soglia, altrimenti
+    diventa a sua volta rappresentante. Ogni scenario è quindi simile al proprio rappresentante (niente
+    catene di scenari via via diversi) e il costo è lineare nel numero di scenari per bande.
+    """
+    n = len(scenarios)
+    if n == 0:
+        return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    token_ids = scenario_token_ids(scenarios)
+    n_slots = token_ids.shape[1]
+    hard_keys = _codes(np.array([f"{s.get('event_type')}|{s.get('town')}" for s in scenarios], dtype=object))
+
+    signatures = minhash_signatures(token_ids, num_perm, seed)
+    rows_per_band = num_perm // bands
+
+    # Identificativo del bucket di ogni scenario in ogni banda, unico tra tutte le bande. La porzione di firma
+    # viene ridotta a un solo intero (le rare collisioni aggiungono solo candidati, poi verificati)
+    bucket_ids = np.empty((n, bands), dtype=np.int64)
+    offset = 0
+    for band in range(bands):
+        band_hash = hard_keys.copy()
+        for column in signatures[:, band * rows_per_band:(band + 1) * rows_per_band].T:
+            band_hash = band_hash * _MERSENNE_PRIME + column  # overflow voluto: aritmetica modulo 2^64
+        groups = _codes(band_hash)
+        bucket_ids[:, band] = groups + offset
+        offset += int(groups.max()) + 1
+
+    bucket_leader = [-1] * offset
+    tokens = token_ids.tolist()
+    hard = hard_keys.tolist()
+    leader_of = np.empty(n, dtype=np.int64)
+    for i, buckets in enumerate(bucket_ids.tolist()):
+        best, best_shared = -1, -1
+        for bucket in buckets:
+            leader = bucket_leader[bucket]
+            if leader >= 0 and leader != best and hard[leader] == hard[i]:
+                # Un token per faccetta: l'intersezione è il numero di faccette uguali
+                shared = sum(a == b for a, b in zip(tokens[i], tokens[leader]))
+                if shared > best_shared:
+                    best, best_shared = leader, shared
+
+        if best >= 0 and best_shared / (2 * n_slots - best_shared) >= threshold:
+            leader_of[i] = best
+        else:
+            leader_of[i] = i
+            for bucket in buckets:
+                if bucket_leader[bucket] < 0:
+                    bucket_leader[bucket] = i
+
+    representatives = np.flatnonzero(leader_of == np.arange(n))
+    labels = np.searchsorted(representatives, leader_of)
+    weights = np.bincount(labels, minlength=len(representatives))
+
+    return representatives.tolist(), weights, labels
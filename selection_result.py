@@ -1,54 +1,368 @@
+import io
 import os
 import json
 import sys
+import heapq
+import shutil
+import tempfile
+import textwrap
+import types
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from statistics import NormalDist
 
 import numpy as np
 import pandas as pd
 import sklearn
-from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
-from sklearn.metrics import pairwise_distances
+from sklearn.cluster import MiniBatchKMeans
 from datetime import datetime
 
+from scenario_catalog import (ScenarioCatalog, EVENT_COLUMNS, NESTED_FIELDS, WEATHER_FIELDS,
+                              TOWN_CHARACTERISTICS_FIELDS, flatten_events, unflatten_event)
+from scenario_dedup import dedup_scenarios
+from trajectory_diversity import trajectory_div_scores
+
 
 # --- Funzioni di Caricamento e Estrazione Dati ---
 
-def load_scenarios_from_folder(folder_path):
+def read_events_file(file_path):
     """
-    Carica tutti i file JSON da una cartella specificata, inclusi quelli nelle sottocartelle.
-    Ogni file JSON è atteso essere una LISTA di eventi.
-    Il codice estrarra' il PRIMO evento come rappresentativo dello scenario.
+    Legge un file JSON di simulazione e restituisce la sua lista di eventi.
+    Restituisce None (dopo aver stampato il motivo) se il file è vuoto, malformato o illeggibile.
+    """
+    filename = os.path.basename(file_path)
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+
+        if isinstance(data, list) and data:
+            return data
+        elif isinstance(data, list):
+            print(f"⚠️ Attenzione: Il file {filename} è una lista vuota. Saltato.")
+        else:
+            print(
+                f"❌ Errore: Il file {filename} non contiene una lista valida di eventi o ha un formato inatteso. Saltato.")
+
+    except json.JSONDecodeError as e:
+        print(f"❌ Errore di decodifica JSON nel file {filename}: {e}")
+    except Exception as e:
+        print(f"❌ Errore generico durante la lettura/elaborazione del file {filename}: {e}")
+    return None
+
+
+# Colonne della tabella eventi per tipo (le restanti colonne di EVENT_COLUMNS sono numeriche float32)
+CATEGORICAL_EVENT_COLUMNS = ("event_type", "message", "actor_type", "other_actor_type", "town",
+                             "road_type_at_collision", "tc_map_name")
+ID_EVENT_COLUMNS = ("actor_id", "other_actor_id")
+
+# Parallelismo del caricamento: None usa tutti i core disponibili
+LOADER_WORKERS = None
+LOADER_CHUNK_SIZE = 64
+
+
+def _read_flat_events(file_path):
+    """
+    Legge un file di simulazione e restituisce i suoi eventi appiattiti (eseguita nei processi worker).
+    """
+    return flatten_events(read_events_file(file_path))
+
+
+@contextmanager
+def _worker_map(workers=LOADER_WORKERS, chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Funzione map che distribuisce le letture dei file su un pool di processi (map sequenziale con un worker).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield map
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield lambda fn, paths: executor.map(fn, paths, chunksize=chunk_size)
+
+
+def _sync_catalog(catalog, folder_path, workers, chunk_size):
+    with _worker_map(workers, chunk_size) as map_fn:
+        entries, parsed_count = catalog.sync(folder_path, read_events_file, map_fn=map_fn)
+    print(f"Catalogo {catalog.catalog_path}: {parsed_count} file nuovi o modificati su {len(entries)}.")
+    return entries
+
+
+def load_event_rows(folder_path, catalog_path=None, workers=LOADER_WORKERS, chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Legge TUTTI gli eventi di tutti i file JSON della cartella (e sottocartelle) usando un pool di processi.
+    Restituisce le righe piatte (ordinale, *EVENT_COLUMNS, extra) raggruppate per file, il numero di eventi
+    e il nome di ciascun file, nell'ordine di os.walk.
+    Con `catalog_path` vengono riletti solo i file nuovi o modificati rispetto al catalogo SQLite.
+    """
+    if catalog_path:
+        catalog = ScenarioCatalog(catalog_path)
+        try:
+            entries = _sync_catalog(catalog, folder_path, workers, chunk_size)
+            rows, counts = catalog.load_event_rows(entries)
+        finally:
+            catalog.close()
+    else:
+        entries = ScenarioCatalog.scan_folder(folder_path)
+        rows = []
+        counts = []
+        with _worker_map(workers, chunk_size) as map_fn:
+            for file_rows in map_fn(_read_flat_events, [e[0] for e in entries]):
+                rows.extend(file_rows)
+                counts.append(len(file_rows))
+
+    filenames = [e[1] for e in entries]
+    return rows, counts, filenames
+
+
+def build_event_table(rows, counts, filenames):
+    """
+    Costruisce la tabella piatta e tipizzata degli eventi: una riga per evento con run_id (indice dello
+    scenario, assegnato ai soli file con almeno un evento), ordinale dell'evento nel file e colonne
+    dello schema EVENT_COLUMNS convertite in category / float32 / Int64.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    loaded = counts > 0
+    run_counts = counts[loaded]
+    run_filenames = [f for f, c in zip(filenames, counts) if c > 0]
+
+    table = pd.DataFrame.from_records(rows, columns=("event_ordinal",) + EVENT_COLUMNS + ("extra",))
+    table.insert(0, "run_id", np.repeat(np.arange(len(run_counts), dtype=np.int32), run_counts))
+    table["event_ordinal"] = table["event_ordinal"].astype(np.int16)
+    table.insert(2, "original_filename",
+                 pd.Categorical.from_codes(table["run_id"].to_numpy(), categories=pd.Index(run_filenames))
+                 if run_filenames else pd.Categorical([]))
+
+    for col in EVENT_COLUMNS:
+        if col in CATEGORICAL_EVENT_COLUMNS:
+            table[col] = table[col].astype("category")
+        elif col in ID_EVENT_COLUMNS:
+            table[col] = pd.to_numeric(table[col], errors='coerce').astype("Int64")
+        elif col == "timestamp":
+            table[col] = pd.to_numeric(table[col], errors='coerce').astype(np.float64)
+        else:
+            table[col] = pd.to_numeric(table[col], errors='coerce').astype(np.float32)
+
+    return table
+
+
+def load_event_table(folder_path, catalog_path=None, workers=LOADER_WORKERS, chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Carica tutti gli eventi della cartella nella tabella piatta e tipizzata (vedi build_event_table).
+    """
+    event_table, _ = load_events(folder_path, catalog_path, workers, chunk_size)
+    return event_table
+
+
+def aggregate_runs(event_table):
+    """
+    Aggrega la tabella eventi per scenario con operazioni vettoriali.
+    Per ogni run restituisce numero di eventi, numero di collisioni, ordinale della prima collisione (-1 se assente)
+    e la posizione (riga della tabella) dell'evento rappresentativo: la prima collisione, o il primo evento.
+    """
+    run_ids = event_table["run_id"].to_numpy()
+    ordinals = event_table["event_ordinal"].to_numpy()
+    is_collision = (event_table["event_type"] == "collision").to_numpy()
+
+    n_runs = int(run_ids[-1]) + 1 if len(run_ids) else 0
+    n_events = np.bincount(run_ids, minlength=n_runs)
+    collision_count = np.bincount(run_ids[is_collision], minlength=n_runs)
+
+    # Le righe sono ordinate per (run_id, ordinale): il primo evento di ogni run è all'inizio del suo blocco
+    representative_pos = np.concatenate(([0], np.cumsum(n_events)[:-1])) if n_runs else np.zeros(0, np.int64)
+    first_collision_ordinal = np.full(n_runs, -1, dtype=np.int32)
+
+    collision_pos = np.flatnonzero(is_collision)
+    runs_with_collision, first_idx = np.unique(run_ids[collision_pos], return_index=True)
+    first_collision_ordinal[runs_with_collision] = ordinals[collision_pos[first_idx]]
+    representative_pos[runs_with_collision] = collision_pos[first_idx]
+
+    return pd.DataFrame({
+        "run_id": np.arange(n_runs, dtype=np.int32),
+        "original_filename": event_table["original_filename"].cat.categories[:n_runs] if n_runs else [],
+        "n_events": n_events.astype(np.int32),
+        "collision_count": collision_count.astype(np.int32),
+        "first_collision_ordinal": first_collision_ordinal,
+        "representative_pos": representative_pos.astype(np.int64),
+    })
+
+
+# --- Snapshot della tabella eventi nel catalogo ---
+# Un caricamento "a caldo" (elenco dei file invariato dall'ultima sincronizzazione) non rilegge le righe del catalogo:
+# la tabella tipizzata è salvata come array colonnari (.npz) nello snapshot del catalogo, insieme alle righe
+# grezze degli eventi rappresentativi (un JSON per run). I dizionari degli scenari vengono ricostruiti
+# solo quando uno scenario viene letto (vedi LazyScenarios).
+
+EVENT_SNAPSHOT_NAME = "event_table_v1"
+
+
+def _scenario_from_values(values, filename, n_events, collision_count):
+    scenario_event_data = unflatten_event(values[:-1], values[-1])
+    scenario_event_data['original_filename'] = filename
+    scenario_event_data['num_events'] = n_events
+    scenario_event_data['collision_count'] = collision_count
+    return scenario_event_data
+
+
+class LazyScenarios(Sequence):
+    """
+    Sequenza degli scenari di uno snapshot: ogni dizionario viene ricostruito dalla sua riga JSON
+    al primo accesso e poi conservato (le modifiche agli scenari restano, come in una lista).
+    """
+
+    def __init__(self, rows_blob, offsets, filenames, n_events, collision_count):
+        self._rows_blob = rows_blob
+        self._offsets = offsets
+        self._filenames = filenames
+        self._n_events = n_events
+        self._collision_count = collision_count
+        self._scenarios = [None] * (len(offsets) - 1)
+
+    def __len__(self):
+        return len(self._scenarios)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        scenario = self._scenarios[index]
+        if scenario is None:
+            index = range(len(self))[index]
+            values = json.loads(self._rows_blob[self._offsets[index]:self._offsets[index + 1]])
+            scenario = _scenario_from_values(values, self._filenames[index], int(self._n_events[index]),
+                                             int(self._collision_count[index]))
+            self._scenarios[index] = scenario
+        return scenario
+
+
+def encode_event_snapshot(event_table, rows, runs):
+    """
+    Serializza la tabella eventi (una o due colonne numpy per colonna della tabella, categorie e colonne
+    di oggetti in JSON) e le righe grezze degli eventi rappresentativi dei run in un blob .npz.
+    """
+    arrays = {}
+    kinds = []
+    for k, col in enumerate(event_table.columns):
+        series = event_table[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            kinds.append(["category", series.cat.categories.tolist()])
+            arrays[f"c{k}"] = series.cat.codes.to_numpy()
+        elif isinstance(series.dtype, pd.Int64Dtype):
+            kinds.append(["Int64", None])
+            arrays[f"c{k}"] = series.to_numpy(dtype=np.int64, na_value=0)
+            arrays[f"m{k}"] = series.isna().to_numpy()
+        elif isinstance(series.dtype, np.dtype) and series.dtype != object:
+            kinds.append(["numpy", None])
+            arrays[f"c{k}"] = series.to_numpy()
+        else:
+            # Colonne di oggetti o stringhe (es. 'extra'): valori in JSON, mancanti come null
+            values = series.astype(object).where(series.notna(), None).tolist()
+            kinds.append(["values", {"dtype": str(series.dtype), "values": values}])
+
+    encoded_rows = [json.dumps(rows[pos][1:]).encode() for pos in runs["representative_pos"].tolist()]
+    arrays["row_offsets"] = np.concatenate(([0], np.cumsum([len(r) for r in encoded_rows]))).astype(np.int64)
+    arrays["rows"] = np.frombuffer(b"".join(encoded_rows), dtype=np.uint8)
+    meta = {"columns": event_table.columns.tolist(), "kinds": kinds}
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_event_snapshot(data):
+    """Inverso di encode_event_snapshot: restituisce (tabella eventi, LazyScenarios)."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as snapshot:
+        meta = json.loads(snapshot["meta"].tobytes())
+        columns = {}
+        for k, (col, (kind, payload)) in enumerate(zip(meta["columns"], meta["kinds"])):
+            if kind == "category":
+                columns[col] = pd.Categorical.from_codes(snapshot[f"c{k}"], categories=pd.Index(payload))
+            elif kind == "Int64":
+                columns[col] = pd.arrays.IntegerArray(snapshot[f"c{k}"], snapshot[f"m{k}"])
+            elif kind == "values":
+                columns[col] = pd.array(payload["values"], dtype=payload["dtype"])
+            else:
+                columns[col] = snapshot[f"c{k}"]
+        rows_blob = snapshot["rows"].tobytes()
+        offsets = snapshot["row_offsets"]
+
+    event_table = pd.DataFrame(columns, columns=meta["columns"])
+    runs = aggregate_runs(event_table)
+    scenarios = LazyScenarios(rows_blob, offsets.tolist(), runs["original_filename"].tolist(),
+                              runs["n_events"].to_numpy(), runs["collision_count"].to_numpy())
+    return event_table, scenarios
+
+
+def _events_from_rows(rows, counts, filenames):
+    event_table = build_event_table(rows, counts, filenames)
+    runs = aggregate_runs(event_table)
+    scenarios = [
+        _scenario_from_values(rows[pos][1:], filename, n_events, collision_count)
+        for pos, filename, n_events, collision_count in zip(runs["representative_pos"].tolist(),
+                                                            runs["original_filename"].tolist(),
+                                                            runs["n_events"].tolist(),
+                                                            runs["collision_count"].tolist())
+    ]
+    return event_table, runs, scenarios
+
+
+def load_events(folder_path, catalog_path=None, workers=LOADER_WORKERS, chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Carica la tabella eventi (vedi build_event_table) e gli scenari: per ogni run il suo evento
+    rappresentativo (vedi aggregate_runs) con 'original_filename', 'num_events' e 'collision_count'.
+    Con `catalog_path`, se nessun file è cambiato, entrambi vengono dallo snapshot del catalogo.
+    """
+    if not catalog_path:
+        event_table, _, scenarios = _events_from_rows(*load_event_rows(folder_path, None, workers, chunk_size))
+        return event_table, scenarios
+
+    catalog = ScenarioCatalog(catalog_path)
+    try:
+        entries = _sync_catalog(catalog, folder_path, workers, chunk_size)
+        snapshot = catalog.load_snapshot(EVENT_SNAPSHOT_NAME)
+        if snapshot is not None:
+            try:
+                return decode_event_snapshot(snapshot)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Snapshot del catalogo illeggibile ({e}): verrà ricostruito.")
+
+        rows, counts = catalog.load_event_rows(entries)
+        event_table, runs, scenarios = _events_from_rows(rows, counts, [e[1] for e in entries])
+        catalog.save_snapshot(EVENT_SNAPSHOT_NAME, encode_event_snapshot(event_table, rows, runs))
+    finally:
+        catalog.close()
+    return event_table, scenarios
+
+
+def load_scenarios_and_features(folder_path, catalog_path=None, workers=LOADER_WORKERS,
+                                chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Come load_scenarios_from_folder, ma restituisce anche la matrice delle feature per la diversità,
+    costruita direttamente dalla tabella eventi (vedi build_feature_matrix_from_events).
     """
-    scenarios = []
     print(f"Caricamento scenari dalla cartella: {folder_path} (e sottocartelle)")
     if not os.path.exists(folder_path):
         print(f"⚠️ Attenzione: La cartella '{folder_path}' non esiste.")
-        return []
+        return [], np.zeros((0, 0), dtype=np.float32)
+
+    event_table, scenarios = load_events(folder_path, catalog_path, workers, chunk_size)
+    runs = aggregate_runs(event_table)
 
-    # Utilizza os.walk per attraversare l'albero delle directory
-    for root, _, files in os.walk(folder_path):
-        for filename in files:
-            if filename.endswith(".json"):
-                file_path = os.path.join(root, filename)  # Usa 'root' per costruire il percorso completo
-                try:
-                    with open(file_path, 'r') as f:
-                        data = json.load(f)
-
-                        if isinstance(data, list) and data:
-                            if data:  # Assicurati che la lista non sia vuota
-                                scenario_event_data = data[0]
-                                scenario_event_data['original_filename'] = filename
-                                scenarios.append(scenario_event_data)
-                            else:
-                                print(f"⚠️ Attenzione: Il file {filename} è una lista vuota. Saltato.")
-                        else:
-                            print(
-                                f"❌ Errore: Il file {filename} non contiene una lista valida di eventi o ha un formato inatteso. Saltato.")
-
-                except json.JSONDecodeError as e:
-                    print(f"❌ Errore di decodifica JSON nel file {filename}: {e}")
-                except Exception as e:
-                    print(f"❌ Errore generico durante la lettura/elaborazione del file {filename}: {e}")
     print(f"Caricati {len(scenarios)} scenari.")
+    return scenarios, build_feature_matrix_from_events(event_table, runs["representative_pos"].to_numpy())
+
+
+def load_scenarios_from_folder(folder_path, catalog_path=None, workers=LOADER_WORKERS, chunk_size=LOADER_CHUNK_SIZE):
+    """
+    Carica tutti i file JSON da una cartella specificata, inclusi quelli nelle sottocartelle.
+    Ogni file JSON è atteso essere una LISTA di eventi.
+    Tutti gli eventi vengono letti in parallelo nella tabella eventi; lo scenario è rappresentato dalla
+    sua PRIMA collisione (o dal primo evento se non ci sono collisioni), arricchita con il numero di eventi
+    ('num_events') e di collisioni ('collision_count') del run.
+    Se viene indicato `catalog_path`, gli eventi estratti sono conservati in un catalogo SQLite
+    e ai caricamenti successivi vengono riletti solo i file nuovi o modificati.
+    """
+    scenarios, _ = load_scenarios_and_features(folder_path, catalog_path, workers, chunk_size)
     return scenarios
 
 
@@ -64,92 +378,499 @@ def extract_collisions(scenarios):
     return collision_flags
 
 
-def extract_exec_times(scenarios):
+# Durata assunta quando non esiste alcuna misura per lo scenario
+FIXED_SIM_DURATION = 60.0
+# Attesa di loop_runner.py tra due simulazioni (MAX_WAIT_BETWEEN_SCENARIOS), esclusa dalla durata stimata
+RUNNER_IDLE_SECONDS = 3.0
+# Intervalli più lunghi tra due file consecutivi sono pause tra campagne, non durate di esecuzione
+MAX_PLAUSIBLE_RUN_SECONDS = 4 * FIXED_SIM_DURATION
+
+
+def load_runner_durations(log_path):
+    """
+    Legge il log JSONL scritto da loop_runner.py (una riga per esecuzione con 'output_file' e
+    'duration_seconds') e restituisce un dizionario nome file -> durata misurata in secondi.
+    """
+    durations = {}
+    if not log_path or not os.path.exists(log_path):
+        return durations
+    with open(log_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                durations[os.path.basename(entry["output_file"])] = float(entry["duration_seconds"])
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                continue
+    return durations
+
+
+def file_timestamp(filename):
+    """
+    Restituisce il timestamp (secondi) codificato nel nome simulation_events_<timestamp>.json, o None.
+    """
+    stem = os.path.splitext(filename or "")[0]
+    suffix = stem.rsplit("_", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def measured_exec_time(scenario, runner_durations):
+    """
+    Durata misurata dello scenario (passi 1 e 2 di extract_exec_times), o None se non disponibile.
+    """
+    duration = scenario.get("run_duration_seconds")
+    if duration is None:
+        duration = runner_durations.get(scenario.get("original_filename"))
+    try:
+        if duration is not None and float(duration) > 0:
+            return float(duration)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def estimate_exec_times(measured, timestamps, event_types):
     """
-    Estrae il tempo di esecuzione di ciascuno scenario.
-    Poiché il JSON non contiene 'simulation_duration_seconds' globale,
-    si assume una durata fissa.
+    Completa le durate misurate (None se assenti) con i passi 3 e 4 di extract_exec_times, a partire dai
+    timestamp dei file (None se assenti) e dai tipi di evento degli scenari.
+    Restituisce i tempi di esecuzione e il numero di quelli stimati dai timestamp e assegnati per default.
     """
-    exec_times_list = []
-    FIXED_SIM_DURATION = 60.0  # Assumendo una durata fissa per ogni simulazione
-    for _ in scenarios:
-        exec_times_list.append(FIXED_SIM_DURATION)
+    exec_times_list = list(measured)
+
+    # Il nome del file contiene l'istante di fine simulazione: la differenza con il file precedente
+    # copre caricamento della mappa, spawn, simulazione e teardown, cioè il costo reale dell'esecuzione
+    stamped = sorted((ts, i) for i, ts in enumerate(timestamps) if ts is not None)
+    estimated_count = 0
+    for (prev_ts, _), (ts, i) in zip(stamped, stamped[1:]):
+        gap = ts - prev_ts - RUNNER_IDLE_SECONDS
+        if exec_times_list[i] is None and 0 < gap <= MAX_PLAUSIBLE_RUN_SECONDS:
+            exec_times_list[i] = float(gap)
+            estimated_count += 1
+
+    by_event_type = {}
+    for event_type, t in zip(event_types, exec_times_list):
+        if t is not None:
+            by_event_type.setdefault(event_type, []).append(t)
+    fallback = {event_type: float(np.median(times)) for event_type, times in by_event_type.items()}
+
+    default_count = 0
+    for i, event_type in enumerate(event_types):
+        if exec_times_list[i] is None:
+            exec_times_list[i] = fallback.get(event_type, FIXED_SIM_DURATION)
+            default_count += 1
+    return exec_times_list, estimated_count, default_count
+
+
+def extract_exec_times(scenarios, runner_durations=None):
+    """
+    Estrae il tempo di esecuzione di ciascuno scenario, usando in ordine di preferenza:
+    1. 'run_duration_seconds' scritto da ego_traffic.py nell'evento;
+    2. la durata misurata da loop_runner.py (`runner_durations`, vedi load_runner_durations);
+    3. l'intervallo tra il timestamp del file e quello del file precedente (le simulazioni sono sequenziali),
+       meno l'attesa del runner, se plausibile;
+    4. la mediana delle durate misurate per lo stesso tipo di evento, o infine una durata fissa.
+    """
+    runner_durations = runner_durations or {}
+    measured = [measured_exec_time(s, runner_durations) for s in scenarios]
+    measured_count = sum(1 for t in measured if t is not None)
+
+    exec_times_list, estimated_count, default_count = estimate_exec_times(
+        measured,
+        [file_timestamp(s.get("original_filename")) for s in scenarios],
+        [s.get("event_type") for s in scenarios])
+
+    print(f"Tempi di esecuzione: {measured_count} misurati, {estimated_count} stimati dai timestamp dei file, "
+          f"{default_count} assegnati per default.")
     return exec_times_list
 
 
 # --- Funzione per il Calcolo del Punteggio di Diversità ---
 
-def compute_div_scores(scenarios):
+# Memoria massima (in byte) occupata dai blocchi di distanze durante il calcolo della diversità.
+# Blocchi piccoli restano in cache e sono in genere anche più veloci.
+DIV_MAX_BLOCK_BYTES = 2 * 1024 * 1024
+
+
+# Schema fisso delle feature di diversità (colonne della tabella eventi).
+# Le numeriche sono scalate MinMax (valori assenti o non numerici = 0), le categoriche codificate one-hot
+# (valori assenti = 'Unknown'). map_name non è numerica ed è già rappresentata da town.
+FEATURE_NUMERIC_FIELDS = tuple(("weather", f) for f in WEATHER_FIELDS) + tuple(
+    ("town_characteristics", f) for f in TOWN_CHARACTERISTICS_FIELDS if f != "map_name")
+FEATURE_NUMERIC_COLUMNS = tuple(NESTED_FIELDS[group][0] + field for group, field in FEATURE_NUMERIC_FIELDS)
+FEATURE_CATEGORICAL_COLUMNS = ("town", "road_type_at_collision")
+
+
+def _assemble_feature_matrix(numeric, categorical_codes):
     """
-    Calcola il punteggio di diversità (div_score) per ogni scenario.
-    Gestisce campi presenti o assenti in base al tipo di evento.
+    Riempie la matrice float32 preallocata: colonne numeriche scalate MinMax sul posto, seguite
+    dalle colonne one-hot di ogni categorica (una per categoria presente).
+    `numeric` è una matrice n x k (NaN = valore mancante), `categorical_codes` una lista di vettori
+    di codici interi (uno per colonna categorica).
     """
-    records = []
+    n = numeric.shape[0]
+    compact_codes = [np.unique(codes, return_inverse=True)[1].reshape(-1) for codes in categorical_codes]
+    widths = [int(codes.max()) + 1 if n else 0 for codes in compact_codes]
 
-    for idx, s in enumerate(scenarios):
-        record = {
-            "id": idx,
-            "town": s.get("town", None),
-            "road_type_at_collision": s.get("road_type_at_collision", None)
-        }
+    X = np.zeros((n, numeric.shape[1] + sum(widths)), dtype=np.float32)
+    num = X[:, :numeric.shape[1]]
+    np.nan_to_num(numeric, copy=False, nan=0.0)
+    num[...] = numeric
+    if n:
+        col_min = num.min(axis=0)
+        col_range = num.max(axis=0) - col_min
+        num -= col_min
+        # Colonne costanti: MinMaxScaler le porta a 0, la sottrazione del minimo lo ha già fatto
+        np.divide(num, col_range, out=num, where=col_range > 0)
+
+    offset = numeric.shape[1]
+    rows = np.arange(n)
+    for codes, width in zip(compact_codes, widths):
+        X[rows, offset + codes] = 1.0
+        offset += width
+    return X
+
+
+def build_feature_matrix_from_events(event_table, positions):
+    """
+    Costruisce la matrice delle feature normalizzate direttamente dalle colonne tipizzate della tabella
+    eventi (righe `positions`, una per scenario), senza passare da dizionari o DataFrame intermedi.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    numeric = np.empty((len(positions), len(FEATURE_NUMERIC_COLUMNS)), dtype=np.float32)
+    for k, col in enumerate(FEATURE_NUMERIC_COLUMNS):
+        numeric[:, k] = event_table[col].to_numpy(dtype=np.float32, na_value=np.nan)[positions]
+
+    # I codici -1 (valore mancante) diventano la categoria 'Unknown'
+    categorical_codes = [event_table[col].cat.codes.to_numpy()[positions] for col in FEATURE_CATEGORICAL_COLUMNS]
+    return _assemble_feature_matrix(numeric, categorical_codes)
+
+
+def _numeric_feature(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def build_feature_matrix(scenarios):
+    """
+    Costruisce la matrice delle feature normalizzate (una riga per scenario) usata per la diversità
+    a partire dai dizionari degli scenari, con lo stesso schema fisso della tabella eventi.
+    Le colonne numeriche (meteo e caratteristiche della città) sono scalate con MinMax,
+    quelle categoriche (città e tipo di strada) sono codificate one-hot.
+    """
+    numeric = np.empty((len(scenarios), len(FEATURE_NUMERIC_COLUMNS)), dtype=np.float32)
+    for k, (group, field) in enumerate(FEATURE_NUMERIC_FIELDS):
+        numeric[:, k] = [_numeric_feature((s.get(group) or {}).get(field)) for s in scenarios]
+
+    # Codici in ordine alfabetico e -1 per i valori mancanti, come i codici delle colonne category
+    categorical_codes = []
+    for col in FEATURE_CATEGORICAL_COLUMNS:
+        values = [s.get(col) for s in scenarios]
+        vocabulary = {v: code for code, v in enumerate(sorted({v for v in values if v is not None}))}
+        categorical_codes.append(np.array([vocabulary.get(v, -1) for v in values], dtype=np.int64))
+    return _assemble_feature_matrix(numeric, categorical_codes)
+
+
+def manhattan_row_sums(X, Y=None, max_block_bytes=DIV_MAX_BLOCK_BYTES, dtype=np.float32, return_sq_sums=False,
+                       weights=None):
+    """
+    Per ogni riga di X calcola la somma delle distanze di Manhattan verso tutte le righe di Y
+    (Y = X se non specificata) senza mai materializzare la matrice completa delle distanze.
+    Le distanze vengono calcolate a blocchi di righe nel tipo `dtype`; per ogni blocco si conserva
+    solo la somma per riga (accumulata in float64), quindi la memoria di picco è limitata
+    da `max_block_bytes` indipendentemente dal numero di scenari.
+    Con return_sq_sums=True restituisce anche la somma dei quadrati delle distanze per riga.
+    Con `weights` (uno per riga di Y) le somme sono pesate, come se ogni riga di Y fosse ripetuta.
+    """
+    X = np.asarray(X)
+    Y = X if Y is None else np.asarray(Y)
+    n_rows, n_cols = X.shape[0], Y.shape[0]
+    row_sums = np.zeros(n_rows, dtype=np.float64)
+    row_sq_sums = np.zeros(n_rows, dtype=np.float64) if return_sq_sums else None
+    if n_rows == 0 or n_cols == 0:
+        return (row_sums, row_sq_sums) if return_sq_sums else row_sums
 
-        record.update(s.get("weather", {}))
-        record.update(s.get("town_characteristics", {}))
+    itemsize = np.dtype(dtype).itemsize
+    # Due buffer (blocco accumulato e differenze della colonna corrente) di block_rows x n_cols
+    block_rows = int(max(1, min(n_rows, max_block_bytes // (2 * n_cols * itemsize))))
 
-        records.append(record)
+    X_cast = np.ascontiguousarray(X, dtype=dtype)
+    Y_t = np.ascontiguousarray(Y.T, dtype=dtype)  # Una riga contigua per feature
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+    tile_buf = np.empty((block_rows, n_cols), dtype=dtype)
+    diff_buf = np.empty((block_rows, n_cols), dtype=dtype)
 
-    df = pd.DataFrame(records)
+    for start in range(0, n_rows, block_rows):
+        stop = min(start + block_rows, n_rows)
+        tile = tile_buf[:stop - start]
+        diff = diff_buf[:stop - start]
+        tile.fill(0)
+        for k in range(X_cast.shape[1]):
+            np.subtract(X_cast[start:stop, k, None], Y_t[k][None, :], out=diff)
+            np.abs(diff, out=diff)
+            tile += diff
+        if weights is None:
+            row_sums[start:stop] = tile.sum(axis=1, dtype=np.float64)
+        else:
+            row_sums[start:stop] = tile @ weights
+        if return_sq_sums:
+            np.square(tile, out=diff)
+            row_sq_sums[start:stop] = diff.sum(axis=1, dtype=np.float64) if weights is None else diff @ weights
 
-    cat_cols = ['town']
-    if 'road_type_at_collision' in df.columns:
-        cat_cols.append('road_type_at_collision')
+    return (row_sums, row_sq_sums) if return_sq_sums else row_sums
 
-    for col in cat_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna('Unknown')
 
-    encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-    cat_encoded_df = pd.DataFrame()
-    if not df.empty and any(col in df.columns for col in cat_cols):
-        actual_cat_cols = [col for col in cat_cols if col in df.columns]
-        if actual_cat_cols:
-            cat_encoded = encoder.fit_transform(df[actual_cat_cols])
-            cat_encoded_df = pd.DataFrame(cat_encoded, columns=encoder.get_feature_names_out(actual_cat_cols))
+# --- Diversità Esatta su Più Core ---
+# Le righe della matrice delle distanze vengono divise in blocchi (shard) e distribuite su un pool di
+# processi. La matrice delle feature è scritta una sola volta, trasposta (una riga per feature), in un file
+# .npy temporaneo che i worker aprono in memory-map: tutti leggono le stesse pagine della cache del sistema
+# operativo, senza copie per worker. Ogni shard restituisce solo le sue somme per riga, poi concatenate.
 
-    all_cols_except_id_cat = [col for col in df.columns if col not in ["id"] + cat_cols]
+DIV_PARALLEL_MIN_ROWS = 4096  # sotto questa soglia il pool costa più del calcolo
+DIV_SHARDS_PER_WORKER = 4  # più shard che worker per bilanciare il carico
 
-    numeric_df = df[all_cols_except_id_cat].apply(pd.to_numeric, errors='coerce')
-    numeric_df = numeric_df.dropna(axis=1, how='all')
-    num_cols_final = numeric_df.columns.tolist()
+_SHARED_DIV_INPUTS = None
 
-    scaler = MinMaxScaler()
-    num_scaled_df = pd.DataFrame()
-    if not numeric_df.empty:
-        num_scaled = scaler.fit_transform(numeric_df.fillna(0))
-        num_scaled_df = pd.DataFrame(num_scaled, columns=num_cols_final)
 
-    X = pd.concat([num_scaled_df.reset_index(drop=True), cat_encoded_df.reset_index(drop=True)], axis=1)
+def _attach_div_inputs(matrix_t_path, weights_path, max_block_bytes):
+    """Inizializzatore dei worker: apre in memory-map la matrice trasposta (ed eventualmente i pesi)."""
+    global _SHARED_DIV_INPUTS
+    X_t = np.load(matrix_t_path, mmap_mode="r")
+    weights = np.load(weights_path, mmap_mode="r") if weights_path else None
+    _SHARED_DIV_INPUTS = (X_t, weights, max_block_bytes)
 
-    if X.empty or X.shape[0] < 2:
+
+def _div_shard_row_sums(bounds):
+    X_t, weights, max_block_bytes = _SHARED_DIV_INPUTS
+    start, stop = bounds
+    # X_t.T ha come trasposta X_t, già contigua: manhattan_row_sums non ne fa copie
+    return manhattan_row_sums(X_t[:, start:stop].T, X_t.T, max_block_bytes=max_block_bytes, weights=weights)
+
+
+def parallel_manhattan_row_sums(X, workers=None, max_block_bytes=DIV_MAX_BLOCK_BYTES, weights=None):
+    """
+    Come manhattan_row_sums(X), ma con gli shard di righe distribuiti su `workers` processi
+    (None = tutti i core). Per poche righe o un solo worker esegue il calcolo nel processo corrente.
+    """
+    n = X.shape[0]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or n < DIV_PARALLEL_MIN_ROWS:
+        return manhattan_row_sums(X, max_block_bytes=max_block_bytes, weights=weights)
+
+    edges = np.linspace(0, n, min(n, workers * DIV_SHARDS_PER_WORKER) + 1).astype(np.int64)
+    shared_dir = tempfile.mkdtemp(prefix="div_shared_")
+    try:
+        matrix_t_path = os.path.join(shared_dir, "features_t.npy")
+        np.save(matrix_t_path, np.ascontiguousarray(np.asarray(X).T, dtype=np.float32))
+        weights_path = None
+        if weights is not None:
+            weights_path = os.path.join(shared_dir, "weights.npy")
+            np.save(weights_path, np.asarray(weights, dtype=np.float64))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_div_inputs,
+                                 initargs=(matrix_t_path, weights_path, max_block_bytes)) as executor:
+            shard_sums = list(executor.map(_div_shard_row_sums, zip(edges[:-1].tolist(), edges[1:].tolist())))
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    return np.concatenate(shard_sums)
+
+
+# Numero di scenari campionati dalla modalità approssimata e numero di righe usate per validarla
+DIV_APPROX_SAMPLE_SIZE = 2048
+DIV_APPROX_CHECK_ROWS = 256
+
+
+def approximate_div_scores(X, sample_size=DIV_APPROX_SAMPLE_SIZE, confidence=0.95, seed=0,
+                           max_block_bytes=DIV_MAX_BLOCK_BYTES):
+    """
+    Stima la distanza di Manhattan media di ogni scenario da tutti gli altri confrontandolo solo con
+    un campione casuale (senza reinserimento) di `sample_size` scenari: costo O(n * sample_size).
+    Restituisce le stime e un dizionario con i limiti d'errore SIMULTANEI al livello di `confidence`
+    (con probabilità `confidence` tutte le n stime li rispettano insieme: disuguaglianza di Boole, ogni
+    scenario ha probabilità di errore (1 - confidence) / n):
+    - 'error_bound': limite di Hoeffding, senza ipotesi sulla distribuzione
+      (le distanze sono comprese tra 0 e la somma delle ampiezze delle feature);
+    - 'clt_error_bound': il più grande intervallo normale per-scenario, basato sulla varianza campionaria
+      (approssimazione normale: con campioni piccoli può essere ottimistico).
+    """
+    n = X.shape[0]
+    m = min(sample_size, n)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, size=m, replace=False))
+
+    sums, sq_sums = manhattan_row_sums(X, X[sample], max_block_bytes=max_block_bytes, return_sq_sums=True)
+
+    # La media sul campione stima la media su tutti gli n scenari (incluso sé stesso, a distanza 0):
+    # il fattore n / (n - 1) la riporta alla media sui soli altri scenari
+    correction = n / (n - 1)
+    sample_mean = sums / m
+    estimates = sample_mean * correction
+
+    # Disuguaglianza di Boole: probabilità di errore delta / n per ogni scenario
+    delta = (1.0 - confidence) / n
+    distance_range = float(np.sum(X.max(axis=0) - X.min(axis=0)))
+    finite_population = (n - m) / (n - 1)
+    hoeffding = distance_range * np.sqrt(np.log(2.0 / delta) / (2.0 * m)) * correction * np.sqrt(finite_population)
+
+    sample_var = np.maximum(sq_sums / m - sample_mean ** 2, 0.0) * m / max(m - 1, 1)
+    z = NormalDist().inv_cdf(1.0 - delta / 2.0)
+    clt = z * np.sqrt(sample_var / m * finite_population) * correction
+
+    info = {
+        "method": "approx",
+        "sample_size": int(m),
+        "confidence": confidence,
+        "error_bound": float(hoeffding),
+        "clt_error_bound": float(clt.max()) if n else 0.0,
+    }
+    return estimates, info
+
+
+def estimate_div_error(X, approx_scores, n_rows=DIV_APPROX_CHECK_ROWS, seed=0, max_block_bytes=DIV_MAX_BLOCK_BYTES,
+                       bound=None):
+    """
+    Confronta i punteggi approssimati con quelli esatti su un campione di `n_rows` scenari
+    (costo O(n_rows * n)) e restituisce errore assoluto medio e massimo ed errore relativo massimo.
+    Con `bound` riporta anche la frazione degli scenari controllati il cui errore lo supera.
+    """
+    n = X.shape[0]
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n, size=min(n_rows, n), replace=False))
+    exact = manhattan_row_sums(X[rows], X, max_block_bytes=max_block_bytes) / (n - 1)
+    abs_error = np.abs(np.asarray(approx_scores)[rows] - exact)
+    rel_error = abs_error / np.maximum(exact, 1e-12)
+    return {
+        "checked_rows": int(len(rows)),
+        "mean_abs_error": float(abs_error.mean()),
+        "max_abs_error": float(abs_error.max()),
+        "max_rel_error": float(rel_error.max()),
+        "exceeding_fraction": float(np.mean(abs_error > bound)) if bound is not None else None,
+    }
+
+
+def compute_div_scores(scenarios, max_block_bytes=DIV_MAX_BLOCK_BYTES, method="exact",
+                       sample_size=DIV_APPROX_SAMPLE_SIZE, confidence=0.95, seed=0, X=None, weights=None,
+                       workers=1):
+    """
+    Calcola il punteggio di diversità (div_score) per ogni scenario.
+    Gestisce campi presenti o assenti in base al tipo di evento.
+    Il punteggio è la distanza di Manhattan media verso tutti gli altri scenari, calcolata
+    a blocchi con memoria di picco limitata da `max_block_bytes`.
+    Con method="approx" la media è stimata su un campione di `sample_size` scenari (tempo quasi lineare):
+    vengono stampati il limite d'errore dichiarato e l'errore misurato contro il calcolo esatto su un campione.
+    `X` permette di passare una matrice delle feature già costruita (es. da load_scenarios_and_features).
+    `weights` (es. i pesi di dedup_scenarios) conta ogni scenario come ripetuto tante volte quanto il suo
+    peso: la diversità resta la distanza media dagli scenari originali. Vale solo per il calcolo esatto.
+    `workers` distribuisce il calcolo esatto su più processi (None = tutti i core).
+    Con method="trajectory" la diversità è comportamentale: distanza DTW media dai k run più vicini
+    calcolata sulle traiettorie dell'ego (vedi trajectory_diversity), senza usare la matrice delle feature.
+    """
+    if method == "trajectory":
+        if weights is not None:
+            print("Avviso: I pesi degli scenari non sono usati dalla diversità delle traiettorie e vengono ignorati.")
+        return trajectory_div_scores(scenarios).tolist()
+
+    if X is None:
+        X = build_feature_matrix(scenarios)
+
+    if X.size == 0 or X.shape[0] < 2:
         print(
             "Avviso: Meno di 2 scenari o dati insufficienti per calcolare la diversità. Restituendo punteggi di diversità 0.")
         return [0.0] * len(scenarios)
 
-    dist_matrix = pairwise_distances(X, metric='manhattan')
+    if method == "approx" and sample_size < X.shape[0]:
+        if weights is not None:
+            print("Avviso: I pesi degli scenari non sono supportati dalla diversità approssimata e vengono ignorati.")
+        estimates, info = approximate_div_scores(X, sample_size, confidence, seed, max_block_bytes)
+        check = estimate_div_error(X, estimates, seed=seed + 1, max_block_bytes=max_block_bytes,
+                                   bound=info['clt_error_bound'])
+        print(f"Diversità approssimata su {info['sample_size']} scenari campione: tutte le {X.shape[0]} stime "
+              f"entro ±{info['error_bound']:.3f} (Hoeffding) / ±{info['clt_error_bound']:.3f} (normale) "
+              f"con confidenza {info['confidence']:.0%} (limiti simultanei).")
+        print(f"Errore misurato su {check['checked_rows']} scenari: medio {check['mean_abs_error']:.4f}, "
+              f"massimo {check['max_abs_error']:.4f} ({check['max_rel_error']:.2%} relativo); "
+              f"{check['exceeding_fraction']:.1%} oltre il limite normale.")
+        return estimates.tolist()
 
-    div_scores = [
-        np.mean(np.delete(dist_matrix[i], i))
-        for i in range(len(dist_matrix))
-    ]
+    # La distanza di ogni scenario da sé stesso è 0: la media esclude solo quel termine
+    row_sums = parallel_manhattan_row_sums(X, workers, max_block_bytes=max_block_bytes, weights=weights)
+    total = X.shape[0] if weights is None else float(np.sum(weights))
+    div_scores = (row_sums / (total - 1)).tolist()
 
     return div_scores
 
 
 # --- Algoritmo Additional Greedy ---
 
-def additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios):
+GREEDY_WEIGHTS = (0.5, 0.5)  # pesi (diversità, collisione) dello score
+
+
+def _greedy_score(scenario_idx, collisions, exec_times, divs, max_exec_time, weights=GREEDY_WEIGHTS):
+    """
+    Score pesato di un singolo scenario: somma pesata di diversità e collisione divisa per il tempo normalizzato.
+    """
+    normalized_exec_time = (exec_times[scenario_idx] / max_exec_time) if max_exec_time > 0 else 1.0
+    if normalized_exec_time < 0.0001:
+        normalized_exec_time = 0.0001
+
+    w_div, w_col = weights
+    return ((w_div * divs[scenario_idx]) + (w_col * collisions[scenario_idx])) / normalized_exec_time
+
+
+def _lazy_greedy_order(collisions, exec_times, divs, max_exec_time, p, weights=GREEDY_WEIGHTS):
+    """
+    Variante lazy (CELF) dell'Additional Greedy basata su una coda di priorità.
+    Lo score di un candidato viene ricalcolato solo quando arriva in cima alla coda: se è ancora
+    il migliore viene selezionato, altrimenti viene reinserito con lo score aggiornato.
+    A parità di score vince l'indice più basso, come nella versione classica.
+    """
+    exec_arr = np.asarray(exec_times, dtype=np.float64)
+    if max_exec_time > 0:
+        normalized = np.maximum(exec_arr / max_exec_time, 0.0001)
+    else:
+        normalized = np.ones_like(exec_arr)
+    w_div, w_col = weights
+    initial_scores = ((w_div * np.asarray(divs, dtype=np.float64)) +
+                      (w_col * np.asarray(collisions, dtype=np.float64))) / normalized
+
+    heap = list(zip((-initial_scores).tolist(), range(len(exec_arr))))
+    heapq.heapify(heap)
+
+    c = 0
+    selected_scenarios_indices = []
+    while c < p:
+        if not heap:
+            print("Avviso: Tutti gli scenari sono stati valutati, ma non tutte le collisioni sono state coperte.")
+            break
+
+        _, scenario_idx = heapq.heappop(heap)
+        try:
+            score = _greedy_score(scenario_idx, collisions, exec_times, divs, max_exec_time, weights)
+        except Exception as e:
+            print(f"Errore nel calcolo dello score per scenario {scenario_idx}: {e}. Saltando.")
+            continue
+
+        if heap and (-score, scenario_idx) > heap[0]:
+            # Lo score aggiornato non è più il migliore: torna in coda
+            heapq.heappush(heap, (-score, scenario_idx))
+            continue
+
+        if collisions[scenario_idx]:
+            c += 1
+        selected_scenarios_indices.append(scenario_idx)
+
+    return selected_scenarios_indices
+
+
+def additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios, lazy=False,
+                      weights=GREEDY_WEIGHTS):
     """
     Implementa l'algoritmo Additional Greedy per selezionare un sottoinsieme di scenari.
+    Con lazy=True usa la valutazione lazy (CELF) su coda di priorità, che restituisce
+    gli stessi indici nello stesso ordine in O(n log n).
+    `weights` sono i pesi (diversità, collisione) dello score; weight_sweep aiuta a sceglierli.
     """
     p = sum(collisions)
 
@@ -157,6 +878,9 @@ def additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios
         print("Nessuna collisione registrata negli scenari di input. Selezionando tutti gli scenari per l'analisi.")
         return list(range(len(all_scenarios)))
 
+    if lazy:
+        return _lazy_greedy_order(collisions, exec_times, divs, max_exec_time, p, weights)
+
     c = 0
     selected_scenarios_indices = []
     already_selected_set = set()
@@ -171,12 +895,8 @@ def additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios
 
         for scenario_idx in candidate_indices:
             try:
-                normalized_exec_time = (exec_times[scenario_idx] / max_exec_time) if max_exec_time > 0 else 1.0
-                if normalized_exec_time < 0.0001:
-                    normalized_exec_time = 0.0001
-
-                score = ((0.5 * divs[scenario_idx]) + (0.5 * collisions[scenario_idx])) / normalized_exec_time
-                weighted_sum_scores[scenario_idx] = score
+                weighted_sum_scores[scenario_idx] = _greedy_score(scenario_idx, collisions, exec_times, divs,
+                                                                  max_exec_time, weights)
             except Exception as e:
                 print(f"Errore nel calcolo dello score per scenario {scenario_idx}: {e}. Saltando.")
                 continue
@@ -196,27 +916,763 @@ def additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios
     return selected_scenarios_indices
 
 
+def budgeted_greedy(collisions, exec_times, divs, budget_seconds, weights=GREEDY_WEIGHTS):
+    """
+    Selezione con budget di tempo rigido (greedy per zaino).
+    Gli scenari vengono considerati in ordine decrescente di valore per secondo, dove il valore è
+    la somma di diversità e collisione pesata con `weights` come in additional_greedy, e vengono aggiunti
+    se entrano ancora nel budget. Come nel classico greedy per lo zaino, se un singolo scenario vale più
+    dell'intera selezione viene restituito da solo. Il tempo totale non supera mai `budget_seconds`.
+    """
+    costs = np.asarray(exec_times, dtype=np.float64)
+    w_div, w_col = weights
+    values = (w_div * np.asarray(divs, dtype=np.float64)) + (w_col * np.asarray(collisions, dtype=np.float64))
+    ratios = values / np.maximum(costs, 1e-9)
+
+    # Ordine per rapporto decrescente, a parità l'indice più basso
+    order = np.lexsort((np.arange(len(costs)), -ratios))
+
+    selected_scenarios_indices = []
+    used = 0.0
+    total_value = 0.0
+    for scenario_idx in order.tolist():
+        if used + costs[scenario_idx] <= budget_seconds:
+            selected_scenarios_indices.append(scenario_idx)
+            used += costs[scenario_idx]
+            total_value += values[scenario_idx]
+
+    fits = np.flatnonzero(costs <= budget_seconds)
+    if len(fits):
+        best_single = int(fits[np.argmax(values[fits])])
+        if values[best_single] > total_value:
+            selected_scenarios_indices = [best_single]
+            used = costs[best_single]
+
+    if not selected_scenarios_indices:
+        print(f"Avviso: Nessuno scenario rientra nel budget di {budget_seconds:.2f} secondi.")
+    else:
+        print(f"Budget di {budget_seconds:.2f} secondi: selezionati {len(selected_scenarios_indices)} scenari "
+              f"per {used:.2f} secondi.")
+    return selected_scenarios_indices
+
+
+# --- Analisi di Sensibilità dei Pesi ---
+# Lo score dell'Additional Greedy non dipende da ciò che è già selezionato: la suite scelta con dei pesi
+# è quindi un prefisso degli scenari ordinati per score decrescente, che si ferma quando tutte le
+# collisioni sono coperte. Per m combinazioni di pesi basta una matrice di score (m x n), un argsort per
+# riga e delle somme cumulate: nessuna esecuzione ripetuta. Con un budget la suite è quella di
+# budgeted_greedy, che salta gli scenari che non entrano e prosegue: non è più un prefisso, e l'ordine
+# per rapporto viene percorso una posizione alla volta per tutti i campioni e i pesi insieme.
+
+WEIGHT_SWEEP_STEPS = 11  # pesi della diversità 0.0, 0.1, ..., 1.0 (collisione = 1 - diversità)
+WEIGHT_SWEEP_BOOTSTRAP = 100
+WEIGHT_SWEEP_MAX_BLOCK_BYTES = 64 * 1024 * 1024  # memoria massima delle somme cumulate di un blocco di campioni
+
+
+def _sweep_prefix_metrics(weights, collisions, costs, divs, max_exec_time, counts):
+    """
+    Per ogni campione (riga di `counts`: quante volte compare ogni scenario) e ogni riga (peso diversità,
+    peso collisione) di `weights` restituisce numero di scenari, collisioni coperte, tempo e somma delle
+    diversità della suite scelta dall'Additional Greedy, come matrici (campioni x pesi).
+    In un campione bootstrap lo score di ogni scenario è quello della suite intera per una costante (il
+    rapporto tra i tempi massimi; la soglia minima di 0.0001 sui tempi normalizzati resta quella della suite
+    intera), quindi l'ordine è lo stesso: un argsort per peso e somme cumulate pesate per le molteplicità.
+    """
+    m, n = len(weights), len(costs)
+    n_samples = len(counts)
+    if n == 0:
+        zeros = np.zeros((n_samples, m))
+        return zeros.astype(np.int64), zeros, zeros, zeros
+    if max_exec_time > 0:
+        normalized = np.maximum(costs / max_exec_time, 0.0001)
+    else:
+        normalized = np.ones_like(costs)
+
+    scores = (weights[:, :1] * divs + weights[:, 1:] * collisions) / normalized
+    # Ordinamento stabile: a parità di score vince l'indice più basso, come in additional_greedy
+    order = np.argsort(-scores, axis=1, kind="stable")
+    multiplicity = counts[:, order]  # (campioni x pesi x n), scenari nell'ordine di ciascun peso
+    cum_counts = np.cumsum(multiplicity, axis=2)
+    values = {"collisions": collisions[order], "costs": costs[order], "divs": divs[order]}
+    cumulated = {name: np.cumsum(multiplicity * v, axis=2) for name, v in values.items()}
+
+    # Lunghezza (in posizioni del campione) della suite: fino all'ultima copia dell'ultima collisione
+    p = counts @ collisions
+    reached = np.argmax(cumulated["collisions"] >= p[:, None, None], axis=2)
+    lengths = np.where(p[:, None] > 0, np.take_along_axis(cum_counts, reached[:, :, None], axis=2)[:, :, 0], n)
+
+    # Valori cumulati alla posizione `lengths` del campione: scenario che la contiene e copie già incluse
+    pos = np.argmax(cum_counts >= np.maximum(lengths, 1)[:, :, None], axis=2)[:, :, None]
+    missing_copies = (np.take_along_axis(cum_counts, pos, axis=2) - np.maximum(lengths, 1)[:, :, None])[:, :, 0]
+    empty = lengths == 0
+
+    def at_length(name):
+        cum_value = np.take_along_axis(cumulated[name], pos, axis=2)[:, :, 0]
+        item_value = np.take_along_axis(np.broadcast_to(values[name], cumulated[name].shape), pos, axis=2)[:, :, 0]
+        return np.where(empty, 0.0, cum_value - missing_copies * item_value)
+
+    return lengths, at_length("collisions"), at_length("costs"), at_length("divs")
+
+
+def _sweep_budget_metrics(weights, collisions, costs, divs, counts, budget_seconds):
+    """
+    Come _sweep_prefix_metrics, ma per la suite di budgeted_greedy: scenari in ordine di valore per secondo
+    (a parità l'indice più basso, con le copie di un campione una dopo l'altra), saltando quelli che non
+    entrano nel budget residuo, e lo scenario migliore da solo se vale più dell'intera selezione.
+    Il rapporto valore/tempo non dipende dal campione: un solo ordinamento per peso, poi un passo per
+    posizione in cui ogni (campione, peso) prende tutte le copie dello scenario che entrano ancora.
+    """
+    m, n = len(weights), len(costs)
+    n_samples = len(counts)
+    lengths = np.zeros((n_samples, m), dtype=np.int64)
+    covered, used, div_sum, total_value = (np.zeros((n_samples, m)) for _ in range(4))
+    if n == 0:
+        return lengths, covered, used, div_sum
+
+    values = weights[:, :1] * divs + weights[:, 1:] * collisions  # (pesi x n)
+    ratios = values / np.maximum(costs, 1e-9)
+    order = np.stack([np.lexsort((np.arange(n), -row)) for row in ratios])
+    # Tempo minimo degli scenari che restano da percorrere: quando nessuno entra più ci si ferma
+    remaining_min_cost = np.minimum.accumulate(costs[order][:, ::-1], axis=1)[:, ::-1]
+
+    rows = np.arange(m)
+    for t in range(n):
+        if (budget_seconds - used < remaining_min_cost[:, t]).all():
+            break
+        idx = order[:, t]
+        cost = costs[idx]
+        copies = counts[:, idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fitting = np.floor((budget_seconds - used) / cost)
+        taken = np.where(cost > 0, np.clip(fitting, 0, copies), copies)
+        lengths += taken.astype(np.int64)
+        covered += taken * collisions[idx]
+        used += taken * cost
+        div_sum += taken * divs[idx]
+        total_value += taken * values[rows, idx]
+
+    # Scenario migliore tra quelli del campione che entrano nel budget (a parità l'indice più basso)
+    candidate_values = np.where(((counts > 0) & (costs <= budget_seconds))[:, None, :], values, -np.inf)
+    best = np.argmax(candidate_values, axis=2)
+    single = np.take_along_axis(candidate_values, best[:, :, None], axis=2)[:, :, 0] > total_value
+    lengths = np.where(single, 1, lengths)
+    covered = np.where(single, collisions[best], covered)
+    used = np.where(single, costs[best], used)
+    div_sum = np.where(single, divs[best], div_sum)
+    return lengths, covered, used, div_sum
+
+
+def _ratio(numerator, denominator, default):
+    """numeratore / denominatore elemento per elemento, `default` dove il denominatore non è positivo."""
+    out = np.full(np.broadcast(numerator, denominator).shape, default, dtype=np.float64)
+    return np.divide(numerator, denominator, out=out, where=denominator > 0)
+
+
+def weight_sweep(collisions, exec_times, divs, weights=None, n_bootstrap=WEIGHT_SWEEP_BOOTSTRAP,
+                 budget_seconds=None, seed=0, max_block_bytes=WEIGHT_SWEEP_MAX_BLOCK_BYTES):
+    """
+    Valuta in blocco molte combinazioni di pesi (diversità, collisione) dell'Additional Greedy.
+    Restituisce un DataFrame con una riga per combinazione: scenari selezionati, collisioni coperte,
+    tempo usato e diversità conservata (somma delle diversità selezionate / somma totale).
+    Con `n_bootstrap` > 0 la suite viene ricampionata con reinserimento e per ogni metrica si riportano
+    media e deviazione standard sui campioni (i punteggi di diversità non vengono ricalcolati). Gli indici
+    di tutti i campioni vengono estratti insieme e valutati a blocchi di al più `max_block_bytes`.
+    Con `budget_seconds` ogni combinazione viene valutata con budgeted_greedy invece che con
+    l'Additional Greedy.
+    """
+    if weights is None:
+        w_div = np.linspace(0.0, 1.0, WEIGHT_SWEEP_STEPS)
+        weights = np.column_stack([w_div, 1.0 - w_div])
+    weights = np.asarray(weights, dtype=np.float64).reshape(-1, 2)
+
+    collision_arr = np.asarray(collisions, dtype=np.float64)
+    costs = np.asarray(exec_times, dtype=np.float64)
+    div_arr = np.asarray(divs, dtype=np.float64)
+    n = len(costs)
+
+    def metrics(counts):
+        # counts: molteplicità (campioni x n) degli scenari; metriche (campioni x pesi)
+        if budget_seconds is None:
+            lengths, covered, used, div_sum = _sweep_prefix_metrics(weights, collision_arr, costs, div_arr,
+                                                                    costs.max() if n else 0.0, counts)
+        else:
+            lengths, covered, used, div_sum = _sweep_budget_metrics(weights, collision_arr, costs, div_arr,
+                                                                    counts, budget_seconds)
+        total_collisions = (counts @ collision_arr)[:, None]
+        total_time = (counts @ costs)[:, None]
+        total_div = (counts @ div_arr)[:, None]
+        return {
+            "num_selected": lengths,
+            "collisions_covered": covered,
+            "collision_coverage": _ratio(covered, total_collisions, default=1.0),
+            "time_used_seconds": used,
+            "time_fraction": _ratio(used, total_time, default=0.0),
+            "diversity_retained": _ratio(div_sum, total_div, default=0.0),
+        }
+
+    table = pd.DataFrame({"w_div": weights[:, 0], "w_col": weights[:, 1]})
+    for name, values in metrics(np.ones((1, n), dtype=np.int64)).items():
+        table[name] = values[0]
+
+    if n_bootstrap and n:
+        rng = np.random.default_rng(seed)
+        samples = rng.integers(0, n, (n_bootstrap, n))
+        counts = np.bincount((samples + n * np.arange(n_bootstrap)[:, None]).ravel(),
+                             minlength=n_bootstrap * n).reshape(n_bootstrap, n)
+        # Ogni campione occupa (pesi x n) molteplicità e quattro somme cumulate della stessa forma
+        block = max(1, int(max_block_bytes // (5 * len(weights) * n * 8)))
+        blocks = [metrics(counts[start:start + block]) for start in range(0, n_bootstrap, block)]
+        for name in ("collisions_covered", "time_used_seconds", "diversity_retained"):
+            stacked = np.concatenate([b[name] for b in blocks])
+            table[f"{name}_boot_mean"] = stacked.mean(axis=0)
+            table[f"{name}_boot_std"] = stacked.std(axis=0, ddof=1) if n_bootstrap > 1 else 0.0
+
+    return table
+
+
+# --- Selezione Max-Min (Diversità Marginale) ---
+
+def maxmin_greedy(X, collisions, exec_times, divs, max_exec_time, k=None, weights=GREEDY_WEIGHTS):
+    """
+    Variante dell'Additional Greedy con diversità marginale (farthest-point): la diversità di un
+    candidato è la distanza di Manhattan dallo scenario selezionato più vicino, non la distanza media
+    da tutti, così scenari quasi identici a quelli già scelti perdono valore.
+    Si mantiene il vettore delle distanze minime, aggiornato in O(n * colonne) dopo ogni scelta
+    (O(n * k) in totale), senza mai costruire la matrice delle distanze. Per la prima scelta, quando
+    non c'è ancora nulla di selezionato, si usa il punteggio statico `divs`.
+    Lo score (pesato con `weights`) e il criterio di arresto sono quelli di additional_greedy
+    (tutte le collisioni coperte), con un limite opzionale di `k` scenari.
+    """
+    n = len(exec_times)
+    p = sum(collisions)
+    if p == 0:
+        print("Nessuna collisione registrata negli scenari di input. Selezionando tutti gli scenari per l'analisi.")
+        return list(range(n))
+
+    X = np.asarray(X, dtype=np.float32)
+    exec_arr = np.asarray(exec_times, dtype=np.float64)
+    if max_exec_time > 0:
+        normalized = np.maximum(exec_arr / max_exec_time, 0.0001)
+    else:
+        normalized = np.ones_like(exec_arr)
+    w_div, w_col = weights
+    collision_term = w_col * np.asarray(collisions, dtype=np.float64)
+
+    diversity = np.asarray(divs, dtype=np.float64).copy()
+    min_distances = None
+    available = np.ones(n, dtype=bool)
+
+    c = 0
+    selected_scenarios_indices = []
+    while c < p and (k is None or len(selected_scenarios_indices) < k):
+        if not available.any():
+            print("Avviso: Tutti gli scenari sono stati valutati, ma non tutte le collisioni sono state coperte.")
+            break
+
+        scores = np.where(available, ((w_div * diversity) + collision_term) / normalized, -np.inf)
+        scenario_idx = int(np.argmax(scores))
+        available[scenario_idx] = False
+        if collisions[scenario_idx]:
+            c += 1
+        selected_scenarios_indices.append(scenario_idx)
+
+        distances = np.abs(X - X[scenario_idx]).sum(axis=1, dtype=np.float64)
+        if min_distances is None:
+            min_distances = distances
+        else:
+            np.minimum(min_distances, distances, out=min_distances)
+        diversity = min_distances
+
+    return selected_scenarios_indices
+
+
+# --- Selezione per Copertura di Celle (Set Cover) ---
+# Lo spazio degli scenari viene discretizzato in celle: town, road_type_at_collision, event_type e
+# parametri meteo suddivisi in fasce. Con COVERAGE_INTERACTION_ORDER = 2 sono celle anche le coppie di
+# valori (es. Town03 + pioggia forte), così la suite deve coprire anche le combinazioni e non solo i
+# singoli valori. Le celle di ogni scenario sono salvate come bitset (righe di parole uint64): il
+# guadagno di un candidato è il popcount di (celle dello scenario AND NOT celle già coperte).
+
+COVERAGE_CATEGORICAL_KEYS = ("town", "road_type_at_collision", "event_type")
+COVERAGE_WEATHER_BINS = {
+    "cloudiness": (25.0, 50.0, 75.0),
+    "precipitation": (25.0, 50.0, 75.0),
+    "precipitation_deposits": (25.0, 50.0, 75.0),
+    "wind_intensity": (25.0, 50.0, 75.0),
+    "fog_density": (25.0, 50.0, 75.0),
+    "sun_altitude_angle": (0.0, 30.0, 60.0),  # notte, alba/tramonto, giorno, sole alto
+}
+COVERAGE_INTERACTION_ORDER = 2  # 1 = solo singoli valori, 2 = anche coppie di valori
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(words):
+    """Numero di bit a 1 di ogni riga di parole uint64 (np.bitwise_count se disponibile, altrimenti tabella)."""
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def _coverage_facet_codes(scenarios):
+    """Codici interi (n scenari x faccette) e numero di valori possibili di ogni faccetta."""
+    columns = []
+    cardinalities = []
+    for key in COVERAGE_CATEGORICAL_KEYS:
+        values = ['Unknown' if s.get(key) is None else str(s.get(key)) for s in scenarios]
+        vocabulary, codes = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        columns.append(codes.ravel().astype(np.int64))
+        cardinalities.append(len(vocabulary))
+
+    for field, edges in COVERAGE_WEATHER_BINS.items():
+        raw = np.array([_numeric_feature((s.get("weather") or {}).get(field)) for s in scenarios], dtype=np.float64)
+        codes = np.digitize(raw, edges)
+        codes[np.isnan(raw)] = len(edges) + 1  # fascia a parte per il meteo mancante
+        columns.append(codes.astype(np.int64))
+        cardinalities.append(len(edges) + 2)
+
+    return np.stack(columns, axis=1), cardinalities
+
+
+def build_coverage_bitsets(scenarios, interaction_order=COVERAGE_INTERACTION_ORDER):
+    """
+    Restituisce (bitsets, n_celle): bitsets è una matrice uint64 (n scenari x parole) in cui il bit c
+    della riga i vale 1 se lo scenario i copre la cella c. Sono numerate solo le celle osservate.
+    """
+    n = len(scenarios)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.uint64), 0
+
+    codes, cardinalities = _coverage_facet_codes(scenarios)
+    n_facets = codes.shape[1]
+
+    cell_columns = []
+    offset = 0
+    for a in range(n_facets):
+        cell_columns.append(offset + codes[:, a])
+        offset += cardinalities[a]
+    if interaction_order >= 2:
+        for a in range(n_facets):
+            for b in range(a + 1, n_facets):
+                cell_columns.append(offset + codes[:, a] * cardinalities[b] + codes[:, b])
+                offset += cardinalities[a] * cardinalities[b]
+
+    # Ogni colonna ha un proprio intervallo di identificativi: le celle di una riga sono tutte distinte
+    cells = np.stack(cell_columns, axis=1)
+    _, compact = np.unique(cells.ravel(), return_inverse=True)
+    compact = compact.ravel().astype(np.int64)
+    n_cells = int(compact.max()) + 1
+
+    bitsets = np.zeros((n, (n_cells + 63) // 64), dtype=np.uint64)
+    rows = np.repeat(np.arange(n), cells.shape[1])
+    bits = np.left_shift(np.uint64(1), (compact & 63).astype(np.uint64))
+    np.bitwise_or.at(bitsets, (rows, compact >> 6), bits)
+    return bitsets, n_cells
+
+
+def coverage_greedy(scenarios, exec_times, budget_seconds=None, bitsets=None, n_cells=None):
+    """
+    Selezione per copertura: a ogni passo sceglie lo scenario che copre più celle non ancora coperte
+    per secondo di esecuzione, finché tutte le celle sono coperte (o, con `budget_seconds`, finché
+    nessun altro scenario utile entra nel budget). A parità di rapporto vince l'indice più basso.
+    Ogni scelta copre almeno una cella nuova, quindi i passi sono al più n_celle: a ogni passo il
+    guadagno dei candidati rimasti si ricalcola in blocco con AND NOT + popcount, e gli scenari che
+    non portano più celle nuove (o non entrano nel budget) escono definitivamente dai candidati.
+    `bitsets` e `n_cells` sono quelli di build_coverage_bitsets; senza `n_cells` si usano le celle coperte
+    da almeno uno scenario.
+    """
+    if bitsets is None:
+        bitsets, n_cells = build_coverage_bitsets(scenarios)
+    if len(bitsets) == 0:
+        return []
+    if n_cells is None:
+        # Bitset passati senza il numero di celle: le celle da coprire sono quelle di almeno uno scenario
+        n_cells = int(popcount_rows(np.bitwise_or.reduce(bitsets, axis=0)[None, :])[0])
+
+    costs = np.maximum(np.asarray(exec_times, dtype=np.float64), 1e-9)
+    candidates = np.arange(len(costs))
+    covered = np.zeros(bitsets.shape[1], dtype=np.uint64)
+    n_covered = 0
+    used = 0.0
+    selected_scenarios_indices = []
+    while n_covered < n_cells:
+        gains = popcount_rows(bitsets[candidates] & ~covered)
+        keep = gains > 0
+        if budget_seconds is not None:
+            keep &= used + costs[candidates] <= budget_seconds
+        candidates, gains = candidates[keep], gains[keep]
+        if len(candidates) == 0:
+            break
+
+        best = int(np.argmax(gains / costs[candidates]))
+        scenario_idx = int(candidates[best])
+        covered |= bitsets[scenario_idx]
+        n_covered += int(gains[best])
+        used += costs[scenario_idx]
+        selected_scenarios_indices.append(scenario_idx)
+
+    print(f"Copertura: {n_covered}/{n_cells} celle coperte con {len(selected_scenarios_indices)} scenari "
+          f"in {used:.2f} secondi.")
+    return selected_scenarios_indices
+
+# --- Selezione per Rappresentanti di Cluster ---
+# La matrice delle feature normalizzata (la stessa di compute_div_scores) viene suddivisa in k cluster
+# con k-means a mini-batch; da ogni cluster si prende un solo scenario, quindi la dimensione della suite
+# (e il suo costo) è fissata da k. Il costo è lineare in n: fit e assegnazione costano O(n * k * colonne).
+
+CLUSTER_K = 50
+CLUSTER_BATCH_SIZE = 4096
+CLUSTER_CANDIDATES = 5  # scenari più vicini al centroide tra cui scegliere il più economico
+
+
+def cluster_representatives(X, collisions, exec_times, k=CLUSTER_K, batch_size=CLUSTER_BATCH_SIZE,
+                            candidates_per_cluster=CLUSTER_CANDIDATES, seed=0):
+    """
+    Raggruppa gli scenari con MiniBatchKMeans e restituisce un rappresentante per cluster.
+    Per ogni cluster si considerano i `candidates_per_cluster` scenari con collisione più vicini al
+    centroide (i medoidi approssimati) e si sceglie il più economico; se il cluster non contiene
+    collisioni si usano i suoi scenari più vicini al centroide. Gli indici sono in ordine di cluster.
+    """
+    n = len(exec_times)
+    if n == 0:
+        return []
+    k = min(k, n)
+
+    X = np.asarray(X, dtype=np.float32)
+    kmeans = MiniBatchKMeans(n_clusters=k, batch_size=min(batch_size, n), n_init=3, random_state=seed)
+    labels = kmeans.fit_predict(X)
+    distances = np.sqrt(((X - kmeans.cluster_centers_[labels]) ** 2).sum(axis=1))
+
+    collision_arr = np.asarray(collisions, dtype=bool)
+    costs = np.asarray(exec_times, dtype=np.float64)
+
+    # Per ogni cluster: prima gli scenari con collisione, poi per distanza crescente dal centroide
+    order = np.lexsort((np.arange(n), distances, ~collision_arr, labels))
+    sorted_labels = labels[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, n])
+    ranks = np.arange(n) - np.repeat(group_starts, group_sizes)
+
+    # Candidati: i primi del gruppo, tenendo solo quelli con collisione se il cluster ne ha
+    has_collision = collision_arr[order[group_starts]]
+    candidate_mask = (ranks < candidates_per_cluster) & (
+        collision_arr[order] | ~np.repeat(has_collision, group_sizes))
+    candidates = order[candidate_mask]
+
+    # Il più economico tra i candidati di ogni cluster, a parità il più vicino al centroide
+    best = np.lexsort((distances[candidates], costs[candidates], labels[candidates]))
+    best_labels = labels[candidates][best]
+    firsts = np.r_[True, best_labels[1:] != best_labels[:-1]]
+    selected_scenarios_indices = candidates[best][firsts].tolist()
+
+    print(f"Cluster: {len(group_starts)} gruppi, {int(has_collision.sum())} con almeno una collisione.")
+    return selected_scenarios_indices
+
+
+# --- Selezione Multi-Obiettivo (Fronte di Pareto) ---
+# Collisioni coperte, diversità e tempo di esecuzione sono obiettivi in conflitto: invece di fonderli
+# in un unico score, si cerca il fronte di Pareto dei sottoinsiemi di scenari con una ricerca a
+# popolazione in stile NSGA-II. La popolazione è una matrice booleana (individui x scenari) e le fitness
+# di tutti gli individui si calcolano insieme come prodotto matrice-vettore.
+
+PARETO_POPULATION = 200
+PARETO_GENERATIONS = 200
+
+
+def _pareto_fitness(masks, objective_columns):
+    """Obiettivi da minimizzare per ogni individuo: -collisioni, -diversità, tempo."""
+    return (masks @ objective_columns) * np.array([-1.0, -1.0, 1.0])
+
+
+def non_dominated_ranks(F):
+    """
+    Rango di Pareto di ogni riga di F (obiettivi da minimizzare): 0 per il fronte non dominato,
+    1 per quello che resta togliendolo, e così via. Matrice di dominanza calcolata in blocco.
+    """
+    not_worse = np.ones((len(F), len(F)), dtype=bool)
+    better = np.zeros((len(F), len(F)), dtype=bool)
+    for column in F.T:
+        not_worse &= column[:, None] <= column[None, :]
+        better |= column[:, None] < column[None, :]
+    dominates = not_worse & better
+    dominated_by = dominates.sum(axis=0)
+    ranks = np.full(len(F), -1, dtype=np.int64)
+    remaining = np.ones(len(F), dtype=bool)
+    rank = 0
+    while remaining.any():
+        front = remaining & (dominated_by == 0)
+        ranks[front] = rank
+        remaining &= ~front
+        dominated_by -= dominates[front].sum(axis=0)
+        rank += 1
+    return ranks
+
+
+def crowding_distances(F, ranks):
+    """
+    Distanza di affollamento di NSGA-II, per tutti i fronti insieme: per ogni obiettivo un ordinamento
+    per (rango, valore), in cui gli estremi di ogni fronte sono i cambi di rango.
+    """
+    distances = np.zeros(len(F))
+    if len(F) == 0:
+        return distances
+    for column in F.T:
+        order = np.lexsort((column, ranks))
+        sorted_values, sorted_ranks = column[order], ranks[order]
+        first = np.r_[True, sorted_ranks[1:] != sorted_ranks[:-1]]
+        last = np.r_[first[1:], True]
+        front_of = np.cumsum(first) - 1
+        span = (sorted_values[last] - sorted_values[first])[front_of]
+        span[span == 0] = 1.0
+        gaps = np.full(len(F), np.inf)
+        inner = ~(first | last)
+        gaps[inner] = (sorted_values[2:] - sorted_values[:-2])[inner[1:-1]] / span[inner]
+        distances[order] += gaps
+    return distances
+
+
+def _coin_flips(rng, shape):
+    """Matrice booleana di lanci di moneta: otto celle per ogni parola uint64 casuale (un bit per byte)."""
+    size = int(np.prod(shape))
+    words = rng.integers(0, np.iinfo(np.uint64).max, (size + 7) // 8, dtype=np.uint64, endpoint=True)
+    return (words & np.uint64(0x0101010101010101)).view(np.uint8)[:size].reshape(shape).view(bool)
+
+
+def pareto_front(collisions, exec_times, divs, max_exec_time, population=PARETO_POPULATION,
+                 generations=PARETO_GENERATIONS, seed=0):
+    """
+    Cerca il fronte di Pareto dei sottoinsiemi di scenari (massime collisioni e diversità, minimo tempo).
+    La popolazione iniziale contiene prefissi dell'ordine dell'Additional Greedy (con più pesi e varie
+    lunghezze) e sottoinsiemi casuali di densità diverse; a ogni generazione torneo binario, crossover uniforme,
+    mutazione guidata (aggiunta o rimozione di uno scenario) e selezione elitista per rango e distanza
+    di affollamento.
+    Restituisce le maschere delle soluzioni non vuote del fronte e un DataFrame con i loro obiettivi, per
+    tempo crescente. Ogni generazione costa O(popolazione x n): con i valori predefiniti circa 2 secondi
+    per 5000 scenari, in crescita lineare; per suite più grandi conviene ridurre PARETO_GENERATIONS o
+    fondere prima i run quasi identici (dedup_scenarios).
+    """
+    n = len(exec_times)
+    rng = np.random.default_rng(seed)
+    objective_columns = np.column_stack([np.asarray(collisions, dtype=np.float64),
+                                         np.asarray(divs, dtype=np.float64),
+                                         np.asarray(exec_times, dtype=np.float64)])
+
+    exec_arr = objective_columns[:, 2]
+    cost_floor = np.maximum(exec_arr, 1e-9)
+    # Il valore per secondo della mutazione è lineare nel peso della diversità: base + w_div * pendenza
+    ratio_base = (objective_columns[:, 0] / cost_floor).astype(np.float32)
+    ratio_slope = ((objective_columns[:, 1] - objective_columns[:, 0]) / cost_floor).astype(np.float32)
+    normalized = np.maximum(exec_arr / max_exec_time, 0.0001) if max_exec_time > 0 else np.ones(n)
+    # Prefissi dell'ordine greedy per tre pesi della diversità, con lunghezze in progressione geometrica
+    # (le suite piccole sono quelle in cui ogni scenario conta di più)
+    prefix_lengths = np.unique(np.geomspace(1, n, max(population // 6, 1)).astype(np.int64))
+    seeded = []
+    for w_div in (0.25, 0.5, 0.75):
+        greedy_order = np.argsort(-(w_div * objective_columns[:, 1] + (1.0 - w_div) * objective_columns[:, 0]) /
+                                  normalized, kind="stable")
+        position_in_order = np.empty(n, dtype=np.int64)
+        position_in_order[greedy_order] = np.arange(n)
+        seeded.append(position_in_order[None, :] < prefix_lengths[:, None])
+    seeded = np.vstack(seeded)[:population]
+    densities = rng.random(population - len(seeded))
+    masks = np.vstack([seeded, rng.random((len(densities), n)) < densities[:, None]])
+    fitness = _pareto_fitness(masks, objective_columns)
+    ranks = non_dominated_ranks(fitness)
+    crowding = crowding_distances(fitness, ranks)
+
+    for _ in range(generations):
+        # Torneo binario: vince il rango più basso, a parità la distanza di affollamento più alta
+        contenders = rng.integers(0, len(masks), size=(2, len(masks), 2))
+        first, second = contenders[..., 0], contenders[..., 1]
+        first_wins = (ranks[first] < ranks[second]) | ((ranks[first] == ranks[second]) &
+                                                       (crowding[first] >= crowding[second]))
+        parents = np.where(first_wins, first, second)
+
+        # Crossover uniforme con operazioni bit a bit (np.where su matrici booleane è molto più lento)
+        first_parent, second_parent = masks[parents[0]], masks[parents[1]]
+        offspring = second_parent ^ ((first_parent ^ second_parent) & _coin_flips(rng, first_parent.shape))
+
+        # Mutazione guidata: ogni figlio aggiunge lo scenario non selezionato con il miglior valore per
+        # secondo oppure toglie quello selezionato con il peggiore, con un peso casuale tra diversità e
+        # collisione diverso per ogni figlio (così la popolazione esplora tutto il fronte).
+        # Un solo argmax per figlio sul rapporto con segno (float32): chi toglie cerca il minimo; gli scenari
+        # non candidati ricevono una penalità ben oltre ogni rapporto (al più ~1e9, con tempi nulli)
+        w_div = rng.random((len(offspring), 1))
+        counts = offspring.sum(axis=1)
+        adding = ((rng.random(len(offspring)) < 0.5) | (counts == 0)) & (counts < n)
+        sign = np.where(adding, 1.0, -1.0).astype(np.float32)[:, None]
+        scores = (sign * w_div.astype(np.float32)) * ratio_slope
+        scores += sign * ratio_base
+        scores -= (offspring == adding[:, None]).view(np.uint8) * np.float32(1e30)
+        offspring[np.arange(len(offspring)), np.argmax(scores, axis=1)] = adding
+
+        combined = np.vstack([masks, offspring])
+        combined_fitness = np.vstack([fitness, _pareto_fitness(offspring, objective_columns)])
+        ranks = non_dominated_ranks(combined_fitness)
+        crowding = crowding_distances(combined_fitness, ranks)
+        survivors = np.lexsort((-crowding, ranks))[:population]
+        masks, fitness = combined[survivors], combined_fitness[survivors]
+        ranks, crowding = ranks[survivors], crowding[survivors]
+
+    # Il sottoinsieme vuoto (tempo 0) non è mai dominato ma non è una suite: resta nella ricerca, non nel fronte
+    front_masks = np.unique(masks[ranks == 0], axis=0)
+    front_masks = front_masks[front_masks.any(axis=1)]
+    values = front_masks @ objective_columns
+    order = np.lexsort((-values[:, 0], values[:, 2]))
+    front_masks, values = front_masks[order], values[order]
+    table = pd.DataFrame({
+        "num_selected": front_masks.sum(axis=1),
+        "collisions_covered": values[:, 0].astype(np.int64),
+        "sum_diversity_scores": values[:, 1],
+        "execution_time_seconds": values[:, 2],
+    })
+    return front_masks, table
+
+
+def pareto_pick(table, budget_seconds=None):
+    """
+    Sceglie una soluzione del fronte: con un budget, quella con più collisioni (poi più diversità) che
+    vi rientra; altrimenti il "ginocchio", la soluzione più vicina al punto ideale con obiettivi normalizzati.
+    Restituisce la posizione nella tabella, o None se il fronte è vuoto o nessuna soluzione rientra nel budget.
+    """
+    values = table[["collisions_covered", "sum_diversity_scores", "execution_time_seconds"]].to_numpy(float)
+    if len(values) == 0:
+        return None
+    if budget_seconds is not None:
+        fits = np.flatnonzero(values[:, 2] <= budget_seconds)
+        if len(fits) == 0:
+            return None
+        return int(fits[np.lexsort((-values[fits, 1], -values[fits, 0]))[0]])
+
+    span = values.max(axis=0) - values.min(axis=0)
+    span[span == 0] = 1.0
+    normalized = (values - values.min(axis=0)) / span
+    normalized[:, 2] = 1.0 - normalized[:, 2]  # il tempo va minimizzato
+    return int(np.argmin(((1.0 - normalized) ** 2).sum(axis=1)))
+
+
+# --- Report di Analisi ---
+
+def scenario_record(i, scenario, collisions, exec_times, divs):
+    """
+    Riga per-scenario del report: metriche e tutti i dati originali dello scenario.
+    """
+    return {
+        "index": i,
+        "filename": scenario.get('original_filename', 'N/A'),
+        "event_type": scenario.get('event_type', 'N/A'),
+        "collision_flag": collisions[i],
+        "execution_time": exec_times[i],
+        "diversity_score": f"{divs[i]:.3f}",
+        "full_data": scenario  # Tutti i dati dello scenario
+    }
+
+
+def selected_scenario_details(idx, scenario, collisions, exec_times, divs):
+    """
+    Dettaglio di uno scenario selezionato, come riportato in 'details_of_selected_scenarios'.
+    """
+    return {
+        "index_in_original_list": idx,
+        "original_filename": scenario.get('original_filename', 'N/A'),
+        "event_type": scenario.get('event_type', 'N/A'),
+        "timestamp_of_event": scenario.get('timestamp', 'N/A'),
+        "map_town": scenario.get('town', 'N/A'),
+        "road_type_at_collision": scenario.get('road_type_at_collision', 'N/A'),
+        "weather_details": scenario.get('weather', {}),
+        "town_characteristics": scenario.get('town_characteristics', {}),
+        "diversity_score": f"{divs[idx]:.3f}",
+        "collision_flag": collisions[idx],
+        "execution_time": exec_times[idx]
+    }
+
+
+def write_scenarios_jsonl(path, all_scenarios, collisions, exec_times, divs):
+    """
+    Scrive i dati per-scenario in formato JSONL compatto: la riga i (da 0) contiene lo scenario di indice i,
+    così il report può riferirsi agli scenari tramite indice senza incorporarli.
+    """
+    with open(path, 'w') as f:
+        for i, scenario in enumerate(all_scenarios):
+            f.write(json.dumps(scenario_record(i, scenario, collisions, exec_times, divs), separators=(',', ':')))
+            f.write("\n")
+
+
+def stream_json_report(path, sections):
+    """
+    Scrive un oggetto JSON (indentato come json.dump con indent=4) una sezione alla volta.
+    `sections` è una sequenza di coppie (chiave, valore); i valori generatori vengono scritti come array
+    elemento per elemento, senza costruire in memoria l'intero documento.
+    """
+    with open(path, 'w') as f:
+        f.write("{")
+        for n, (key, value) in enumerate(sections):
+            f.write(",\n" if n else "\n")
+            f.write(f"    {json.dumps(key)}: ")
+            if isinstance(value, types.GeneratorType):
+                f.write("[")
+                empty = True
+                for item in value:
+                    f.write("\n" if empty else ",\n")
+                    f.write(textwrap.indent(json.dumps(item, indent=4), " " * 8))
+                    empty = False
+                f.write("]" if empty else "\n    ]")
+            else:
+                f.write(textwrap.indent(json.dumps(value, indent=4), " " * 4).lstrip())
+        f.write("\n}")
+
+
 # --- Esecuzione Completa dello Script ---
 
 if __name__ == "__main__":
     # --- Configurazione Path ---
     input_folder = "/Users/mariocelzo/Library/Mobile Documents/com~apple~CloudDocs/UNIVERSITA/TIROCINIO/adas_testing/simulation_output"
 
+    # --- Configurazione Selezione ---
+    WEIGHT_SWEEP = False  # True per confrontare in blocco più combinazioni di pesi (tabella weight_sweep.csv)
+    GREEDY_LAZY = True  # Valutazione lazy (CELF) dell'Additional Greedy: stessi risultati, molto più veloce
+    DIV_METHOD = "exact"  # "approx" per stimare la diversità su un campione (suite molto grandi), "trajectory" per la diversità delle traiettorie dell'ego
+    DIV_WORKERS = None  # Processi per la diversità esatta (None = tutti i core, 1 = nel processo corrente)
+    SELECTION_MODE = "greedy"  # "greedy" (score pesato), "maxmin" (diversità marginale), "coverage", "cluster", "pareto"
+    MAXMIN_K = None  # Numero massimo di scenari in modalità "maxmin" (None: fino a coprire tutte le collisioni)
+    TIME_BUDGET_SECONDS = None  # Budget di tempo per la CI (secondi): se impostato usa la selezione a budget
+    RUN_DURATIONS_LOG = os.path.join(input_folder, "run_durations.jsonl")  # Durate misurate da loop_runner.py
+    REPORT_EMBED_FULL_DATA = False  # True per incorporare tutti gli scenari nel report (formato storico)
+    SCENARIO_CATALOG_PATH = "analysis_results/scenario_catalog.sqlite"  # None per rileggere sempre tutti i file
+    DEDUP_SCENARIOS = False  # True per fondere i run quasi identici in rappresentanti pesati prima della selezione
+
     current_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     analysis_output_folder = f"analysis_results/run_{current_timestamp}"
     os.makedirs(analysis_output_folder, exist_ok=True)
     print(f"\n📁 I risultati dell'analisi verranno salvati in: {os.path.abspath(analysis_output_folder)}")
 
     # Step 1: Caricamento e pre-processing degli scenari
-    all_scenarios = load_scenarios_from_folder(input_folder)
+    all_scenarios, feature_matrix = load_scenarios_and_features(input_folder, catalog_path=SCENARIO_CATALOG_PATH)
 
     if not all_scenarios:
         print("Nessuno scenario da analizzare. Termino il programma.")
         exit()
 
     collisions = extract_collisions(all_scenarios)
-    exec_times = extract_exec_times(all_scenarios)
-    divs = compute_div_scores(all_scenarios)
+    exec_times = extract_exec_times(all_scenarios, load_runner_durations(RUN_DURATIONS_LOG))
+
+    # Step 1b (opzionale): deduplicazione. I tempi sono già stati stimati sull'elenco completo dei file
+    # (le stime usano il file precedente), qui si tengono solo i valori dei rappresentanti.
+    num_loaded_scenarios = len(all_scenarios)
+    dedup_weights = None
+    if DEDUP_SCENARIOS:
+        representatives, dedup_weights, _ = dedup_scenarios(all_scenarios)
+        all_scenarios = [all_scenarios[i] for i in representatives]
+        for scenario, weight in zip(all_scenarios, dedup_weights.tolist()):
+            scenario['dedup_weight'] = weight
+        feature_matrix = feature_matrix[representatives]
+        collisions = [collisions[i] for i in representatives]
+        exec_times = [exec_times[i] for i in representatives]
+        print(f"Deduplicazione: {num_loaded_scenarios} scenari ridotti a {len(all_scenarios)} rappresentanti.")
+
+    divs = compute_div_scores(all_scenarios, method=DIV_METHOD, X=feature_matrix, weights=dedup_weights,
+                              workers=DIV_WORKERS)
 
     max_exec_time = max(exec_times) if exec_times else 0.0
     if max_exec_time == 0.0 and len(exec_times) > 0:
@@ -236,8 +1692,41 @@ if __name__ == "__main__":
     print(f"Somma dei punteggi di diversità: {sum(divs):.3f}")
 
     # Step 3: Applicazione dell'algoritmo greedy per la selezione
-    print("\n--- Avvio Selezione Scenari con Algoritmo Greedy ---")
-    selected_scenario_indices = additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios)
+    if SELECTION_MODE == "maxmin":
+        print("\n--- Avvio Selezione Scenari con Diversità Marginale (Max-Min) ---")
+        selected_scenario_indices = maxmin_greedy(feature_matrix, collisions, exec_times, divs, max_exec_time,
+                                                  k=MAXMIN_K, weights=GREEDY_WEIGHTS)
+    elif SELECTION_MODE == "coverage":
+        print("\n--- Avvio Selezione Scenari per Copertura di Celle ---")
+        selected_scenario_indices = coverage_greedy(all_scenarios, exec_times, budget_seconds=TIME_BUDGET_SECONDS)
+    elif SELECTION_MODE == "pareto":
+        print("\n--- Avvio Selezione Multi-Obiettivo (Fronte di Pareto) ---")
+        front_masks, front_table = pareto_front(collisions, exec_times, divs, max_exec_time)
+        pareto_front_filename = os.path.join(analysis_output_folder, 'pareto_front.json')
+        with open(pareto_front_filename, 'w') as f:
+            json.dump([dict(row, selected_scenario_indices=np.flatnonzero(mask).tolist())
+                       for row, mask in zip(front_table.to_dict(orient="records"), front_masks)], f, indent=4)
+        print(f"Fronte di Pareto: {len(front_table)} soluzioni non dominate, salvate in: {pareto_front_filename}")
+        chosen = pareto_pick(front_table, TIME_BUDGET_SECONDS)
+        if chosen is None and TIME_BUDGET_SECONDS is None:
+            print("Avviso: Il fronte di Pareto non contiene soluzioni non vuote.")
+            selected_scenario_indices = []
+        elif chosen is None:
+            print(f"Avviso: Nessuna soluzione del fronte rientra nel budget di {TIME_BUDGET_SECONDS:.2f} secondi.")
+            selected_scenario_indices = []
+        else:
+            selected_scenario_indices = np.flatnonzero(front_masks[chosen]).tolist()
+    elif SELECTION_MODE == "cluster":
+        print(f"\n--- Avvio Selezione Scenari per Rappresentanti di {CLUSTER_K} Cluster ---")
+        selected_scenario_indices = cluster_representatives(feature_matrix, collisions, exec_times, k=CLUSTER_K)
+    elif TIME_BUDGET_SECONDS is not None:
+        print(f"\n--- Avvio Selezione Scenari con Budget di {TIME_BUDGET_SECONDS:.2f} secondi ---")
+        selected_scenario_indices = budgeted_greedy(collisions, exec_times, divs, TIME_BUDGET_SECONDS,
+                                                    weights=GREEDY_WEIGHTS)
+    else:
+        print("\n--- Avvio Selezione Scenari con Algoritmo Greedy ---")
+        selected_scenario_indices = additional_greedy(collisions, exec_times, divs, max_exec_time, all_scenarios,
+                                                      lazy=GREEDY_LAZY, weights=GREEDY_WEIGHTS)
 
     print(f"\n--- Risultati Selezione Greedy ---")
     print(f"Numero di scenari selezionati: {len(selected_scenario_indices)}")
@@ -254,63 +1743,71 @@ if __name__ == "__main__":
     print(f"Tempo totale di esecuzione della suite selezionata: {sum(selected_exec_times):.2f} secondi")
     print(f"Somma dei punteggi di diversità della suite selezionata: {sum(selected_divs):.3f}")
 
-    # Step 6: Salvataggio dei risultati in un file JSON
-    analysis_results = {
-        "input_folder": input_folder,
-        "total_scenarios_analyzed": len(all_scenarios),
-        "initial_suite_stats": {
+    # Step 5b (opzionale): confronto in blocco di più combinazioni di pesi dell'Additional Greedy
+    weight_sweep_filename = None
+    if WEIGHT_SWEEP:
+        print(f"\n--- Analisi di Sensibilità dei Pesi ({WEIGHT_SWEEP_BOOTSTRAP} campioni bootstrap) ---")
+        sweep_table = weight_sweep(collisions, exec_times, divs, budget_seconds=TIME_BUDGET_SECONDS)
+        print(sweep_table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        weight_sweep_filename = os.path.join(analysis_output_folder, 'weight_sweep.csv')
+        sweep_table.to_csv(weight_sweep_filename, index=False)
+        print(f"✅ Tabella dei pesi salvata in: {weight_sweep_filename}")
+
+    # Step 6: Salvataggio dei risultati: report in streaming e, in modalità slim, dati per-scenario a parte
+    report_sections = [
+        ("input_folder", input_folder),
+        ("total_scenarios_analyzed", len(all_scenarios)),
+        ("deduplication", {
+            "enabled": DEDUP_SCENARIOS,
+            "loaded_scenarios": num_loaded_scenarios,
+            "representatives": len(all_scenarios)
+        }),
+        ("initial_suite_stats", {
             "total_collisions": sum(collisions),
             "total_execution_time_seconds": f"{sum(exec_times):.2f}",
             "sum_diversity_scores": f"{sum(divs):.3f}"
-        },
-        "all_input_scenarios": [  # NUOVO: salva tutti gli scenari originali
-            {
-                "index": i,
-                "filename": s.get('original_filename', 'N/A'),
-                "event_type": s.get('event_type', 'N/A'),
-                "collision_flag": collisions[i],
-                "execution_time": exec_times[i],
-                "diversity_score": f"{divs[i]:.3f}",
-                "full_data": s  # Tutti i dati dello scenario
-            }
-            for i, s in enumerate(all_scenarios)
-        ],
-
-    "greedy_algorithm_metrics": {
-        "max_exec_time": max_exec_time,
-        "execution_timestamp": current_timestamp,
-        "python_version": sys.version.split()[0],
-        "numpy_version": np.__version__,
-        "pandas_version": pd.__version__,
-        "sklearn_version": sklearn.__version__
-    },
-
-        "selected_suite_stats": {
+        }),
+    ]
+
+    if REPORT_EMBED_FULL_DATA:
+        report_sections.append(("all_input_scenarios", (
+            scenario_record(i, s, collisions, exec_times, divs) for i, s in enumerate(all_scenarios))))
+    else:
+        scenarios_jsonl_filename = os.path.join(analysis_output_folder, 'scenarios.jsonl')
+        write_scenarios_jsonl(scenarios_jsonl_filename, all_scenarios, collisions, exec_times, divs)
+        print(f"✅ Dati per-scenario salvati in: {scenarios_jsonl_filename}")
+        report_sections.append(("all_input_scenarios_file", {
+            "path": os.path.basename(scenarios_jsonl_filename),
+            "format": "jsonl",
+            "indexing": "la riga i (da 0) contiene lo scenario con indice i"
+        }))
+
+    report_sections += [
+        ("greedy_algorithm_metrics", {
+            "selection_mode": SELECTION_MODE,
+            "max_exec_time": max_exec_time,
+            "time_budget_seconds": TIME_BUDGET_SECONDS,
+            "cluster_k": CLUSTER_K if SELECTION_MODE == "cluster" else None,
+            "greedy_weights": list(GREEDY_WEIGHTS),
+            "weight_sweep_file": os.path.basename(weight_sweep_filename) if weight_sweep_filename else None,
+            "execution_timestamp": current_timestamp,
+            "python_version": sys.version.split()[0],
+            "numpy_version": np.__version__,
+            "pandas_version": pd.__version__,
+            "sklearn_version": sklearn.__version__
+        }),
+        ("selected_suite_stats", {
             "num_selected_scenarios": len(selected_scenario_indices),
             "selected_scenario_indices": selected_scenario_indices,
             "total_collisions_covered": sum(selected_collisions),
             "total_execution_time_seconds": f"{sum(selected_exec_times):.2f}",
             "sum_diversity_scores": f"{sum(selected_divs):.3f}"
-        },
-        "details_of_selected_scenarios": [
-            {
-                "index_in_original_list": idx,
-                "original_filename": all_scenarios[idx].get('original_filename', 'N/A'),
-                "event_type": all_scenarios[idx].get('event_type', 'N/A'),
-                "timestamp_of_event": all_scenarios[idx].get('timestamp', 'N/A'),
-                "map_town": all_scenarios[idx].get('town', 'N/A'),
-                "road_type_at_collision": all_scenarios[idx].get('road_type_at_collision', 'N/A'),
-                "weather_details": all_scenarios[idx].get('weather', {}),
-                "town_characteristics": all_scenarios[idx].get('town_characteristics', {}),
-                "diversity_score": f"{divs[idx]:.3f}",
-                "collision_flag": collisions[idx],
-                "execution_time": exec_times[idx]
-            }
-            for idx in selected_scenario_indices
-        ]
-    }
+        }),
+        ("details_of_selected_scenarios", (
+            selected_scenario_details(idx, all_scenarios[idx], collisions, exec_times, divs)
+            for idx in selected_scenario_indices)),
+    ]
 
     output_json_filename = os.path.join(analysis_output_folder, 'analysis_report.json')
-    with open(output_json_filename, 'w') as f:
-        json.dump(analysis_results, f, indent=4)
-    print(f"✅ Report di analisi salvato in: {output_json_filename}")
\ No newline at end of file
+    stream_json_report(output_json_filename, report_sections)
+    print(f"✅ Report di analisi salvato in: {output_json_filename}")
@@ -0,0 +1,42 @@
+import numpy as np
+
+from curvature_index import CurvatureIndex, yaw_difference
+
+
+def _index(xs, ys, rng):
+    yaw = rng.uniform(-180, 180, len(xs))
+    return CurvatureIndex({"x": np.asarray(xs, dtype=np.float64), "y": np.asarray(ys, dtype=np.float64),
+                           "yaw": yaw, "curvature_next_yaw": yaw + rng.normal(0, 6, len(xs))})
+
+
+def _assert_nearest_matches_brute_force(index, xs, ys, queries):
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    for x, y in queries:
+        best = index.nearest(x, y)
+        assert best >= 0
+        found = (index.xs[best] - x) ** 2 + (index.ys[best] - y) ** 2
+        assert np.isclose(found, ((xs - x) ** 2 + (ys - y) ** 2).min())
+
+
+def test_nearest_sparse_far_apart_points():
+    rng = np.random.default_rng(0)
+    xs, ys = [0.0, 95.0], [95.0, 0.0]
+    index = _index(xs, ys, rng)
+    queries = [(1.0, 1.0), (50.0, 50.0), (-400.0, 3.0), (1000.0, 1000.0)] + rng.uniform(-200, 300, (200, 2)).tolist()
+    _assert_nearest_matches_brute_force(index, xs, ys, queries)
+
+
+def test_nearest_random_waypoints():
+    rng = np.random.default_rng(1)
+    for n in (1, 3, 50, 5000):
+        xs, ys = rng.uniform(-300, 300, n), rng.uniform(-200, 400, n)
+        index = _index(xs, ys, rng)
+        _assert_nearest_matches_brute_force(index, xs, ys, rng.uniform(-800, 800, (200, 2)))
+
+
+def test_classify_uses_wrap_aware_heading_change():
+    index = CurvatureIndex({"x": np.array([0.0, 50.0]), "y": np.array([0.0, 0.0]),
+                            "yaw": np.array([179.0, 10.0]), "curvature_next_yaw": np.array([-179.0, 30.0])})
+    assert index.classify(1.0, 0.0) == "straight"
+    assert index.classify(49.0, 0.0) == "curve"
+    assert yaw_difference(-170.0, 170.0) == 20.0
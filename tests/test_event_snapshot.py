@@ -0,0 +1,45 @@
+import json
+import os
+
+import pandas as pd
+
+from selection_result import LazyScenarios, load_events
+
+
+def _write_run(folder, name, events):
+    with open(os.path.join(folder, name), "w") as f:
+        json.dump(events, f)
+
+
+def _event(event_type, town, **extra):
+    event = {"event_type": event_type, "timestamp": 1.5, "actor_id": 7, "actor_type": "vehicle.audi.tt",
+             "town": town, "weather": {"cloudiness": 10.0, "fog_density": 2.5},
+             "impact_location": {"x": 1.25, "y": -3.0, "z": 0.1}}
+    event.update(extra)
+    return event
+
+
+def _assert_same_load(folder, catalog_path):
+    ref_table, ref_scenarios = load_events(folder, None, workers=1)
+    table, scenarios = load_events(folder, catalog_path, workers=1)
+    pd.testing.assert_frame_equal(table, ref_table)
+    assert list(scenarios) == ref_scenarios
+    return scenarios
+
+
+def test_warm_load_from_snapshot_matches_fresh_load(tmp_path):
+    folder, catalog_path = tmp_path / "runs", str(tmp_path / "catalog.sqlite")
+    folder.mkdir()
+    _write_run(folder, "a.json", [_event("lane_invasion", "Town01"), _event("collision", "Town01", other_actor_id=None)])
+    _write_run(folder, "b.json", [_event("run_end", "Town03", ego_trajectory={"t": [0, 1], "x": [0, 2]})])
+    _write_run(folder, "c.json", [])
+
+    assert isinstance(_assert_same_load(folder, catalog_path), list)
+    warm = _assert_same_load(folder, catalog_path)
+    assert isinstance(warm, LazyScenarios)
+    assert warm[-1]["ego_trajectory"] == {"t": [0, 1], "x": [0, 2]}
+
+    # Un file modificato invalida lo snapshot
+    _write_run(folder, "b.json", [_event("collision", "Town05"), _event("collision", "Town05")])
+    assert isinstance(_assert_same_load(folder, catalog_path), list)
+    assert _assert_same_load(folder, catalog_path)[1]["collision_count"] == 2
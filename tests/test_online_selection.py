@@ -0,0 +1,29 @@
+import random
+
+from online_selection import IncrementalSelector
+from selection_result import extract_exec_times
+
+
+def _scenario(ts, event_type, duration=None):
+    scenario = {"event_type": event_type, "original_filename": f"simulation_events_{ts}.json",
+                "town": "Town01", "weather": {"cloudiness": ts % 100}}
+    if duration is not None:
+        scenario["run_duration_seconds"] = duration
+    return scenario
+
+
+def test_exec_times_match_batch_when_files_arrive_out_of_order():
+    # Gli intervalli oltre MAX_PLAUSIBLE_RUN_SECONDS lasciano scenari senza stima: ricevono la mediana del tipo
+    scenarios = [_scenario(1000, "collision", 40.0), _scenario(1050, "collision"), _scenario(1400, "collision"),
+                 _scenario(1483, "run_end"), _scenario(2000, "run_end"), _scenario(2100, "run_end", 90.0),
+                 _scenario(5000, "lane_invasion")]
+    expected = extract_exec_times(scenarios)
+
+    for seed in range(5):
+        order = random.Random(seed).sample(range(len(scenarios)), len(scenarios))
+        selector = IncrementalSelector()
+        for k, i in enumerate(order):
+            selector.add(scenarios[i])
+            added = [scenarios[j] for j in order[:k + 1]]
+            assert selector.exec_times == extract_exec_times(added)
+        assert [selector.exec_times[order.index(i)] for i in range(len(scenarios))] == expected
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from selection_result import _sweep_budget_metrics, _sweep_prefix_metrics, weight_sweep
+
+
+def _greedy_prefix(collisions, costs, divs, weights, sample):
+    """Additional Greedy su un campione, scenario per scenario (a parità di score vince l'indice più basso)."""
+    normalized = np.maximum(costs / costs.max(), 0.0001)
+    order = sorted(sample, key=lambda j: (-(weights[0] * divs[j] + weights[1] * collisions[j]) / normalized[j], j))
+    p = collisions[sample].sum()
+    selected, covered = [], 0.0
+    for j in order:
+        if p and covered >= p:
+            break
+        selected.append(j)
+        covered += collisions[j]
+    return len(selected), collisions[selected].sum(), costs[selected].sum(), divs[selected].sum()
+
+
+def _budgeted_greedy(collisions, costs, divs, weights, budget_seconds, sample):
+    """budgeted_greedy su un campione: salta gli scenari che non entrano e prosegue, poi il migliore da solo."""
+    values = weights[0] * divs + weights[1] * collisions
+    order = sorted(sample, key=lambda j: (-values[j] / max(costs[j], 1e-9), j))
+    selected, used = [], 0.0
+    for j in order:
+        if used + costs[j] <= budget_seconds:
+            selected.append(j)
+            used += costs[j]
+    fits = sorted(j for j in set(sample) if costs[j] <= budget_seconds)
+    if fits:
+        best = max(fits, key=lambda j: values[j])
+        if values[best] > values[selected].sum():
+            selected = [best]
+    return len(selected), collisions[selected].sum(), costs[selected].sum(), divs[selected].sum()
+
+
+def test_bootstrap_metrics_match_per_sample_greedy():
+    rng = np.random.default_rng(1)
+    weights = np.array([[0.0, 1.0], [0.5, 0.5], [1.0, 0.0], [0.3, 0.7]])
+    for trial in range(30):
+        n = int(rng.integers(1, 40))
+        collisions = (rng.random(n) < rng.random()).astype(np.float64)
+        # Tempi e diversità discreti: molti pareggi, e tempi nulli una volta su tre
+        costs = rng.integers(0 if trial % 3 == 0 else 1, 5, n).astype(np.float64)
+        costs[0] = max(costs[0], 1.0)
+        divs = np.round(rng.random(n), 1)
+        samples = rng.integers(0, n, (6, n))
+        counts = np.stack([np.bincount(s, minlength=n) for s in samples])
+        budget_seconds = float(rng.integers(0, 30))
+
+        metrics = _sweep_prefix_metrics(weights, collisions, costs, divs, costs.max(), counts)
+        budget_metrics = _sweep_budget_metrics(weights, collisions, costs, divs, counts, budget_seconds)
+        for w, row in enumerate(weights):
+            expected = [_greedy_prefix(collisions, costs, divs, row, s) for s in samples]
+            np.testing.assert_allclose(np.column_stack([m[:, w] for m in metrics]), expected)
+            expected = [_budgeted_greedy(collisions, costs, divs, row, budget_seconds, s) for s in samples]
+            np.testing.assert_allclose(np.column_stack([m[:, w] for m in budget_metrics]), expected)
+
+
+def test_bootstrap_blocks_do_not_change_results():
+    rng = np.random.default_rng(2)
+    n = 300
+    collisions, costs, divs = (rng.random(n) < 0.3).astype(int), rng.uniform(10, 100, n), rng.random(n)
+    table = weight_sweep(collisions, costs, divs, n_bootstrap=20, budget_seconds=2000.0)
+    blocked = weight_sweep(collisions, costs, divs, n_bootstrap=20, budget_seconds=2000.0, max_block_bytes=1)
+    pd.testing.assert_frame_equal(table, blocked)
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import time
+
+import numpy as np
+
+
+# On-disk cache of per-town static data, keyed by map name and CARLA server version.
+# Generating every waypoint of a map at 2 m resolution and following each one takes
+# seconds of RPCs on every run, but the result never changes for a given map and version:
+# it is computed once, stored as NumPy arrays (.npz) plus the derived town
+# characteristics (.json), and loaded in milliseconds afterwards.
+
+TOWN_CACHE_DIR = "cache/towns"
+TOWN_CACHE_VERSION = 2  # Bump when the cached arrays or characteristics change
+WAYPOINT_RESOLUTION = 2.0  # Meters between generated waypoints
+CURVE_LOOKAHEAD = 5.0  # Meters ahead used to approximate curves in the town characteristics
+CURVATURE_LOOKAHEAD = 10.0  # Meters ahead used by the curvature index (see curvature_index.py)
+
+
+def cache_paths(map_name, server_version, cache_dir=TOWN_CACHE_DIR):
+    """Paths of the (.npz, .json) cache files of a map for a given CARLA server version."""
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{map_name.split('/')[-1]}_{server_version}")
+    base = os.path.join(cache_dir, safe_name)
+    return base + ".npz", base + ".json"
+
+
+def extract_waypoint_arrays(carla_map, resolution=WAYPOINT_RESOLUTION, lookahead=CURVE_LOOKAHEAD,
+                            curvature_lookahead=CURVATURE_LOOKAHEAD):
+    """
+    Generates the map waypoints once and returns them as NumPy arrays: position, yaw,
+    road and junction ids, and the yaw of the waypoints `lookahead` and `curvature_lookahead`
+    meters ahead (NaN at road ends). Each waypoint is followed with one next() call per distance.
+    """
+    waypoints = carla_map.generate_waypoints(resolution)
+    n = len(waypoints)
+    arrays = {
+        "x": np.empty(n, dtype=np.float64),
+        "y": np.empty(n, dtype=np.float64),
+        "z": np.empty(n, dtype=np.float64),
+        "yaw": np.empty(n, dtype=np.float64),
+        "road_id": np.empty(n, dtype=np.int64),
+        "junction_id": np.full(n, -1, dtype=np.int64),
+        "next_yaw": np.full(n, np.nan, dtype=np.float64),
+        "curvature_next_yaw": np.full(n, np.nan, dtype=np.float64),
+    }
+    for i, waypoint in enumerate(waypoints):
+        transform = waypoint.transform
+        arrays["x"][i] = transform.location.x
+        arrays["y"][i] = transform.location.y
+        arrays["z"][i] = transform.location.z
+        arrays["yaw"][i] = transform.rotation.yaw
+        arrays["road_id"][i] = waypoint.road_id
+        if waypoint.is_junction:
+            arrays["junction_id"][i] = waypoint.junction_id
+        next_waypoints = waypoint.next(lookahead)
+        if next_waypoints:
+            arrays["next_yaw"][i] = next_waypoints[0].transform.rotation.yaw
+        next_waypoints = waypoint.next(curvature_lookahead)
+        if next_waypoints:
+            arrays["curvature_next_yaw"][i] = next_waypoints[0].transform.rotation.yaw
+    return arrays
+
+
+def characteristics_from_arrays(map_name, arrays, traffic_lights):
+    """
+    Town characteristics computed from the waypoint arrays with the same heuristics
+    as the original per-waypoint loop (so cached and fresh values are identical).
+    """
+    # A significant change in yaw over the lookahead indicates a curve (raw difference, as before)
+    angle_diff = np.abs(arrays["yaw"] - arrays["next_yaw"])
+    num_curves = int(np.count_nonzero((angle_diff > 10) & (angle_diff < 350)))
+    junction_ids = arrays["junction_id"][arrays["junction_id"] >= 0]
+
+    return {
+        "map_name": map_name,
+        "traffic_lights": int(traffic_lights),
+        # Simple heuristic to reduce overcounting curves: divide by a factor based on waypoint density
+        "approx_curves": int(num_curves / 15),
+        "approx_junctions": int(len(np.unique(junction_ids))),
+        "approx_roads": int(len(np.unique(arrays["road_id"])))
+    }
+
+
+def load_town_cache(map_name, server_version, cache_dir=TOWN_CACHE_DIR):
+    """Returns (characteristics, arrays) from the cache, or None if missing, stale or unreadable."""
+    npz_path, json_path = cache_paths(map_name, server_version, cache_dir)
+    if not (os.path.exists(npz_path) and os.path.exists(json_path)):
+        return None
+    try:
+        with open(json_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get("cache_version") != TOWN_CACHE_VERSION or meta.get("map_name") != map_name or \
+                meta.get("server_version") != server_version:
+            return None
+        with np.load(npz_path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: unreadable town cache for {map_name} ({e}), rebuilding it.")
+        return None
+    return meta["characteristics"], arrays
+
+
+def save_town_cache(map_name, server_version, characteristics, arrays, cache_dir=TOWN_CACHE_DIR):
+    """Writes the cache files atomically (arrays first: the JSON marks a complete entry)."""
+    npz_path, json_path = cache_paths(map_name, server_version, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {"cache_version": TOWN_CACHE_VERSION, "map_name": map_name, "server_version": server_version,
+            "waypoint_resolution": WAYPOINT_RESOLUTION, "characteristics": characteristics}
+    for path, write in ((npz_path, lambda f: np.savez(f, **arrays)),
+                        (json_path, lambda f: f.write(json.dumps(meta, indent=4).encode()))):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+
+def load_cached_towns(cache_dir=TOWN_CACHE_DIR):
+    """
+    Waypoint arrays of every town in the cache, by map name (e.g. 'Carla/Maps/Town01'),
+    for offline analysis without a CARLA server. With several server versions the newest entry wins.
+    """
+    if not os.path.isdir(cache_dir):
+        return {}
+    towns = {}
+    json_paths = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".json")),
+                        key=os.path.getmtime)
+    for json_path in json_paths:
+        try:
+            with open(json_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        cached = load_town_cache(meta.get("map_name", ""), meta.get("server_version"), cache_dir)
+        if cached is not None:
+            towns[meta["map_name"]] = cached[1]
+    return towns
+
+
+def get_town_data(client, world, carla_map, cache_dir=TOWN_CACHE_DIR):
+    """
+    Static characteristics and waypoint arrays of the current town, from the cache when
+    available for this map and CARLA server version, otherwise computed and cached.
+    """
+    start = time.perf_counter()
+    server_version = client.get_server_version()
+    cached = load_town_cache(carla_map.name, server_version, cache_dir)
+    if cached is not None:
+        print(f"📦 Town characteristics of {carla_map.name} loaded from cache "
+              f"in {1000 * (time.perf_counter() - start):.1f} ms.")
+        return cached
+
+    print("Gathering town static characteristics...")
+    arrays = extract_waypoint_arrays(carla_map)
+    # Count traffic lights by iterating through all actors and filtering by type
+    traffic_lights = sum(1 for actor in world.get_actors() if 'traffic_light' in actor.type_id)
+    characteristics = characteristics_from_arrays(carla_map.name, arrays, traffic_lights)
+    save_town_cache(carla_map.name, server_version, characteristics, arrays, cache_dir)
+    print(f"📦 Town characteristics of {carla_map.name} computed and cached "
+          f"in {time.perf_counter() - start:.1f} s.")
+    return characteristics, arrays
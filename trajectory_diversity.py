@@ -0,0 +1,162 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# --- Diversità Comportamentale (Traiettorie dell'Ego) ---
+# ego_traffic.py salva in ogni evento un riassunto della traiettoria dell'ego ('ego_trajectory': tempi,
+# posizioni x/y e velocità su un numero fisso di punti). Ogni run diventa una serie (punti x canali) con
+# spostamento dal punto di partenza e velocità; la distanza tra due run è la DTW (distanza L1 per punto)
+# con banda di Sakoe-Chiba. Il punteggio di diversità di un run è la distanza media dai suoi k vicini più
+# prossimi: un comportamento che nessun altro run ripete ha un punteggio alto.
+# Per ogni run i vicini si cercano in ordine di limite inferiore LB_Keogh (calcolato in blocco su tutti i
+# candidati): la DTW si calcola solo sui candidati il cui limite è sotto la k-esima distanza trovata, a
+# lotti vettoriali, e si abbandona per ogni candidato appena supera quella distanza.
+
+TRAJECTORY_POINTS = 32
+TRAJECTORY_KNN = 5
+DTW_WINDOW = 3  # ampiezza della banda di Sakoe-Chiba, in punti
+DTW_FIRST_BATCH = 64  # primo lotto piccolo: la k-esima distanza si stringe subito
+DTW_MAX_BATCH = 512
+
+
+def trajectory_array(scenarios, num_points=TRAJECTORY_POINTS):
+    """
+    Restituisce (serie, validi): serie è un array (n, num_points, 3) con spostamento x, spostamento y
+    (metri dal punto iniziale) e velocità (km/h); validi indica gli scenari con una traiettoria utilizzabile.
+    I riassunti con un numero di punti diverso vengono ricampionati in tempo.
+    """
+    series = np.zeros((len(scenarios), num_points, 3), dtype=np.float64)
+    valid = np.zeros(len(scenarios), dtype=bool)
+    for i, scenario in enumerate(scenarios):
+        trajectory = scenario.get("ego_trajectory")
+        if not isinstance(trajectory, dict):
+            continue
+        try:
+            columns = [np.asarray(trajectory[key], dtype=np.float64) for key in ("t", "x", "y", "speed_kmh")]
+        except (KeyError, TypeError, ValueError):
+            continue
+        times = columns[0]
+        if len(times) < 2 or any(len(c) != len(times) for c in columns) or not np.all(np.diff(times) >= 0):
+            continue
+
+        if len(times) != num_points:
+            grid = np.linspace(times[0], times[-1], num_points)
+            columns = [grid] + [np.interp(grid, times, c) for c in columns[1:]]
+        _, x, y, speed = columns
+        series[i, :, 0] = x - x[0]
+        series[i, :, 1] = y - y[0]
+        series[i, :, 2] = speed
+        valid[i] = True
+    return series, valid
+
+
+def lb_keogh(query, candidates, window=DTW_WINDOW):
+    """
+    Limite inferiore LB_Keogh della DTW (L1, banda `window`) tra `query` (punti x canali) e ogni
+    candidato di `candidates` (m x punti x canali), calcolato per tutti i candidati insieme.
+    """
+    padded = np.pad(query, ((window, window), (0, 0)), mode="edge")
+    windows = sliding_window_view(padded, 2 * window + 1, axis=0)  # (punti, canali, 2 * window + 1)
+    upper = windows.max(axis=2)
+    lower = windows.min(axis=2)
+    return np.abs(candidates - np.clip(candidates, lower, upper)).sum(axis=(1, 2))
+
+
+def dtw_distances(query, candidates, window=DTW_WINDOW, cutoff=np.inf):
+    """
+    DTW (L1, banda di Sakoe-Chiba `window`) tra `query` e ogni candidato, vettorizzata sui candidati.
+    Early abandoning: un candidato la cui riga migliore supera `cutoff` viene scartato e ottiene inf.
+    """
+    m, n_points = candidates.shape[0], query.shape[0]
+    # Solo i costi dentro la banda: costs[:, i, window + d] = |query[i] - candidato[i + d]|, |d| <= window
+    padded = np.pad(candidates, ((0, 0), (window, window), (0, 0)), mode="edge")
+    bands = sliding_window_view(padded, 2 * window + 1, axis=1)  # (m, punti, canali, 2 * window + 1)
+    costs = np.abs(bands - query[None, :, :, None]).sum(axis=2)
+    distances = np.full(m, np.inf)
+
+    active = np.arange(m)
+    previous = np.full((m, n_points + 1), np.inf, dtype=costs.dtype)  # colonna 0: bordo a sinistra
+    previous[:, 1] = 0.0
+    for i in range(n_points):
+        lo, hi = max(0, i - window), min(n_points, i + window + 1)
+        # Dalla riga precedente (sopra o in diagonale) il minimo è vettoriale; il passo a sinistra dentro
+        # la riga, cell[j] = c[j] + min(from_prev[j], cell[j - 1]), si risolve con una scansione min-plus:
+        # cell[j] = P[j] + min_{k <= j} (from_prev[k] - P[k - 1]), con P le somme cumulate dei costi
+        row_costs = costs[:, i, lo - i + window:hi - i + window]
+        prefix = np.cumsum(row_costs, axis=1)
+        from_previous = np.minimum(previous[:, lo + 1:hi + 1], previous[:, lo:hi]) if i else previous[:, lo + 1:hi + 1]
+        current = np.full_like(previous, np.inf)
+        current[:, lo + 1:hi + 1] = prefix + np.minimum.accumulate(from_previous - prefix + row_costs, axis=1)
+
+        keep = current[:, lo + 1:hi + 1].min(axis=1) <= cutoff
+        if not keep.all():
+            active, current, costs = active[keep], current[keep], costs[keep]
+            if len(active) == 0:
+                return distances
+        previous = current
+
+    distances[active] = previous[:, n_points]
+    return distances
+
+
+def trajectory_novelty_scores(series, k=TRAJECTORY_KNN, window=DTW_WINDOW, max_batch=DTW_MAX_BATCH):
+    """
+    Per ogni serie, distanza DTW media (per punto) dalle sue `k` serie più vicine.
+    Restituisce i punteggi e la frazione di DTW complete evitate grazie al limite inferiore.
+    """
+    n, n_points = series.shape[0], series.shape[1]
+    k = min(k, n - 1)
+    scores = np.zeros(n)
+    computed = 0
+    for i in range(n):
+        bounds = lb_keogh(series[i], series, window)
+        bounds[i] = np.inf
+        order = np.argsort(bounds, kind="stable")[:n - 1]
+
+        nearest = np.full(k, np.inf)
+        pos = 0
+        batch = max(DTW_FIRST_BATCH, k)
+        while pos < len(order):
+            kth = nearest.max()
+            candidates = order[pos:pos + batch]
+            candidates = candidates[bounds[candidates] < kth]
+            if len(candidates) == 0:
+                break  # candidati ordinati per limite inferiore: nessuno dei successivi può entrare
+            distances = dtw_distances(series[i], series[candidates], window, cutoff=kth)
+            nearest = np.partition(np.concatenate([nearest, distances]), k - 1)[:k]
+            computed += len(candidates)
+            pos += batch
+            batch = min(2 * batch, max_batch)
+        scores[i] = nearest.mean() / n_points
+
+    pruned_fraction = 1.0 - computed / max(n * (n - 1), 1)
+    return scores, pruned_fraction
+
+
+def trajectory_div_scores(scenarios, k=TRAJECTORY_KNN, window=DTW_WINDOW):
+    """
+    Punteggi di diversità comportamentale degli scenari (vedi trajectory_novelty_scores). I canali sono
+    divisi per la loro deviazione standard, così spostamenti e velocità pesano in modo confrontabile.
+    Gli scenari senza traiettoria (run registrati prima del riassunto) ricevono il valore mediano.
+    """
+    series, valid = trajectory_array(scenarios)
+    scores = np.zeros(len(scenarios))
+    valid_idx = np.flatnonzero(valid)
+    if len(valid_idx) < 2:
+        print("Avviso: Meno di 2 scenari con traiettoria dell'ego. Restituendo punteggi di diversità 0.")
+        return scores
+
+    data = series[valid_idx]
+    scale = data.reshape(-1, data.shape[2]).std(axis=0)
+    scale[scale == 0] = 1.0
+    # float32: metà della banda di memoria per i limiti inferiori e le DTW, precisione più che sufficiente
+    valid_scores, pruned_fraction = trajectory_novelty_scores((data / scale).astype(np.float32), k, window)
+    scores[valid_idx] = valid_scores
+    print(f"Diversità delle traiettorie su {len(valid_idx)} scenari: "
+          f"{pruned_fraction:.1%} delle DTW evitate dal limite inferiore LB_Keogh.")
+
+    missing = len(scenarios) - len(valid_idx)
+    if missing:
+        scores[~valid] = np.median(valid_scores)
+        print(f"Avviso: {missing} scenari senza traiettoria dell'ego: assegnato il punteggio mediano.")
+    return scores